@@ -0,0 +1,10 @@
+"""Configuration for the test suite.
+
+The FFTW wisdom is not loaded or saved automatically while testing so that
+running the tests does not write to `~/.cache/mmfutils` (see
+:mod:`mmfutils.performance.wisdom`).  This must be set before the package is
+imported.
+"""
+import os
+
+os.environ.setdefault('MMFUTILS_WISDOM', '0')
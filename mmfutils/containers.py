@@ -2,18 +2,175 @@
 
 Archiving is supported through the interface defined by the ``persist``
 package (though use of that package is optional and it is not a dependency).
+
+Objects holding large arrays can be pickled without copying the array data
+with :func:`dumps` and :func:`loads`, which use pickle protocol 5 with
+out-of-band buffers (:pep:`574`).  For checkpoints, :func:`save_dir` saves
+objects to a directory (JSON metadata and `.npy` files) which
+:func:`load_dir` loads with memory-mapped arrays.
 """
 
 import collections
 from collections import abc
+import importlib
+import json
+import os
 import pickle
+import re
+import shutil
+import sys
+import tempfile
 
-__all__ = ['ObjectBase', 'Object',
-           'Container', 'ContainerList', 'ContainerDict']
+__all__ = ['lazy_attribute', 'ObjectBase', 'Object',
+           'Container', 'ContainerList', 'ContainerDict',
+           'dumps', 'loads', 'save_dir', 'load_dir']
+
+
+######################################################################
+# Pickling with out-of-band buffers
+def dumps(obj, buffers=None):
+    """Return `obj` pickled with protocol 5.
+
+    Arguments
+    ---------
+    buffers : list, None
+       If provided, the data of large contiguous arrays is not copied into the
+       pickle.  Instead, :class:`pickle.PickleBuffer` instances referencing
+       the data are appended to this list.  These must be passed to
+       :func:`loads` (or sent to another process with the pickle, for
+       example through shared memory or a socket using scatter/gather I/O).
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> c = Container(x=np.arange(10**6))
+    >>> buffers = []
+    >>> data = dumps(c, buffers=buffers)
+    >>> len(data) < 1000, len(buffers)
+    (True, 1)
+    >>> c1 = loads(data, buffers=buffers)
+    >>> np.shares_memory(c1.x, c.x)      # No copies were made
+    True
+    """
+    buffer_callback = None if buffers is None else buffers.append
+    return pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+
+
+def loads(data, buffers=()):
+    """Return the object pickled by :func:`dumps`.
+
+    Arguments
+    ---------
+    buffers : [buffer]
+       Out-of-band buffers returned by :func:`dumps`.  Arrays are
+       reconstructed as views of these buffers (read-only if the buffers are
+       read-only).
+    """
+    return pickle.loads(data, buffers=buffers)
+
+
+def _discard(buffer):
+    """Buffer callback keeping the buffers out-of-band (see
+    `_check_picklable`)."""
+    return None
+
+
+def _is_picklable_array(value):
+    """Return `True` if `value` is an array whose pickle is determined by its
+    structure (dtype and shape) and not its contents."""
+    # Numpy is not a dependency: if it has not been imported, then value
+    # cannot be an array.
+    np = sys.modules.get('numpy', None)
+    return (np is not None
+            and isinstance(value, np.ndarray)
+            and not value.dtype.hasobject)
 
 
 ######################################################################
 # General utilities
+class lazy_attribute(object):
+    """Decorator defining a derived attribute of an :class:`ObjectBase`
+    computed on first access.
+
+    The value is stored in the instance `__dict__`, so subsequent accesses are
+    ordinary attribute lookups without any overhead.  The arguments name the
+    attributes the value depends on (parameters, attributes set in `init()`,
+    or other lazy attributes).  Setting any of these through `__setattr__`
+    discards the stored value (and those of any lazy attributes that depend
+    on it) so that it will be recomputed when next accessed.
+
+    .. note:: Only assignments are tracked.  If you modify a dependency in
+       place, you must call :meth:`ObjectBase.invalidate`.
+
+    Examples
+    --------
+    >>> class A(ObjectBase):
+    ...     _independent_attributes = ('b',)
+    ...     def __init__(self, a=1, b=2):
+    ...         super().__init__(a=a, b=b)
+    ...     @lazy_attribute('a', 'b')
+    ...     def c(self):
+    ...         print("Computing c")
+    ...         return self.a + self.b
+    ...     @lazy_attribute('c')
+    ...     def c2(self):
+    ...         return self.c**2
+    >>> a = A()
+    >>> a.c2
+    Computing c
+    9
+    >>> a.c2
+    9
+    >>> a.b = 3         # An independent attribute: no need to call init()
+    >>> a.initialized
+    True
+    >>> a.c2
+    Computing c
+    16
+    """
+    def __init__(self, *depends):
+        self.depends = depends
+
+    def __call__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.func(instance)
+        return value
+
+
+def _get_lazy_dependents(cls):
+    """Return a dictionary mapping attribute names to the set of lazy
+    attributes of `cls` that depend on them (directly or indirectly)."""
+    lazy = {}
+    for _cls in reversed(cls.__mro__):
+        lazy.update((_k, _v) for _k, _v in vars(_cls).items()
+                    if isinstance(_v, lazy_attribute))
+
+    direct = collections.defaultdict(set)
+    for name, attr in lazy.items():
+        for dep in attr.depends:
+            direct[dep].add(name)
+
+    dependents = {}
+    for key in direct:
+        todo, found = list(direct[key]), set()
+        while todo:
+            name = todo.pop()
+            if name not in found:
+                found.add(name)
+                todo.extend(direct.get(name, ()))
+        dependents[key] = frozenset(found)
+    return dependents
+
+
 class ObjectBase(object):
     """General base class with a few convenience methods.
 
@@ -77,6 +234,14 @@ class ObjectBase(object):
     when `init()` is called. Objects can then include an `assert
     self.initialized` in the appropriate places.
 
+    Derived attributes that are cheap relative to `init()`, or that depend on
+    parameters that are frequently changed (boosts, twists, etc.) can instead
+    be defined with :class:`lazy_attribute`.  These are computed on first
+    access and only the affected ones are discarded when an attribute is set.
+    Parameters used only by lazy attributes (not directly in `init()`) can be
+    listed in `_independent_attributes`: setting these does not set
+    `initialized` to `False`.
+
     .. note:: This redefines __setattr__ to provide the behaviour.
 
     Examples
@@ -105,12 +270,21 @@ class ObjectBase(object):
     """
     initialized = False         # Assure that this is always defined.
     picklable_attributes = ()   # Tuple so it is immutable
+    _independent_attributes = ()
+    _lazy_dependents = {}       # Set by __init_subclass__()
+
+    def __init_subclass__(cls, **kw):
+        super().__init_subclass__(**kw)
+        cls._lazy_dependents = _get_lazy_dependents(cls)
 
     def __init__(self, **kw):
         for _k in kw:
             setattr(self, _k, kw[_k])
         if 'picklable_attributes' not in self.__dict__:
-            self.picklable_attributes = sorted(_k for _k in self.__dict__)
+            self.picklable_attributes = sorted(
+                _k for _k in self.__dict__
+                if not isinstance(getattr(type(self), _k, None),
+                                  lazy_attribute))
         self.init()
 
     def init(self):
@@ -119,12 +293,26 @@ class ObjectBase(object):
         # Don't forget to call `super().init()` in your code!
         self.initialized = True
 
+    def invalidate(self, *keys):
+        """Discard the lazy attributes that depend on `keys`.
+
+        Use this after modifying attributes in place.  If no `keys` are
+        given, all lazy attributes are discarded.
+        """
+        if not keys:
+            keys = self._lazy_dependents
+        for key in keys:
+            for _k in self._lazy_dependents.get(key, ()):
+                self.__dict__.pop(_k, None)
+
     def _check_attribute(self, key, value=None):
-        """Return True if attribute is pickable.
+        """Return True if attribute is pickable (and setting it requires
+        `init()` to be called).
 
         Can be overloaded to perform more comprehensive checks.
         """
-        return key in self.picklable_attributes
+        return (key in self.picklable_attributes
+                and key not in self._independent_attributes)
 
     def _getstate(self):
         """Return and OrderedDict of picklable attributes."""
@@ -166,6 +354,8 @@ class ObjectBase(object):
         if self._check_attribute(key, value):
             self.__dict__['initialized'] = False
         super().__setattr__(key, value)
+        if key in self._lazy_dependents:
+            self.invalidate(key)
 
 
 class ObjectMixin(object):
@@ -266,10 +456,18 @@ class ObjectMixin(object):
     ######################################################################
     # More comprehensive checks
     def _check_picklable(self, key, value):
-        """Raise ValueError if obj is not picklable."""
+        """Raise ValueError if obj is not picklable.
+
+        This is a structural check: the data of arrays (including arrays
+        nested in other objects) is not serialized.
+        """
+        if _is_picklable_array(value):
+            return
         try:
-            pickle.dumps(value)
-        except pickle.PicklingError:
+            # Out-of-band buffers are not copied.  Non-contiguous arrays are
+            # still copied, but only if they are nested in other objects.
+            pickle.dumps(value, protocol=5, buffer_callback=_discard)
+        except (pickle.PicklingError, TypeError, AttributeError):
             raise ValueError(f"Attribute {key}={value} not picklable.")
 
     def _check_attribute(self, key, value=None):
@@ -492,3 +690,182 @@ class ContainerDict(Container, abc.MutableMapping):
 
     def __delitem__(self, key):
         self.__delattr__(key)
+
+
+######################################################################
+# Directory archives
+_METADATA = 'metadata.json'
+_FORMAT = 1
+_TAGS = ('__npy__', '__object__', '__pickle__', '__tuple__')
+
+
+class _DirArchiver(object):
+    """Encode the state of an object as JSON, storing the arrays in `.npy`
+    files (see :func:`save_dir`)."""
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.names = set()
+
+    def get_name(self, key, ext=''):
+        """Return a unique file name in `dirname` for `key`."""
+        base = re.sub(r'[^\w.-]', '_', key) or '_'
+        name, n = base + ext, 0
+        while name in self.names or name == _METADATA:
+            n += 1
+            name = f"{base}_{n}{ext}"
+        self.names.add(name)
+        return name
+
+    def encode(self, value, key):
+        if value is None or type(value) in (bool, int, float, str):
+            return value
+        elif _is_picklable_array(value):
+            import numpy as np
+            name = self.get_name(key, '.npy')
+            np.save(os.path.join(self.dirname, name), value,
+                    allow_pickle=False)
+            return {'__npy__': name}
+        elif isinstance(value, ObjectMixin):
+            name = self.get_name(key)
+            save_dir(os.path.join(self.dirname, name), value)
+            return {'__object__': name}
+        elif type(value) in (list, tuple):
+            values = [self.encode(_v, f"{key}.{_n}")
+                      for _n, _v in enumerate(value)]
+            return values if type(value) is list else {'__tuple__': values}
+        elif (type(value) is dict
+              and all(type(_k) is str and _k not in _TAGS for _k in value)):
+            return {_k: self.encode(_v, f"{key}.{_k}")
+                    for _k, _v in value.items()}
+        name = self.get_name(key, '.pickle')
+        with open(os.path.join(self.dirname, name), 'wb') as f:
+            pickle.dump(value, f, protocol=5)
+        return {'__pickle__': name}
+
+    def decode(self, value, mmap_mode):
+        if isinstance(value, list):
+            return [self.decode(_v, mmap_mode) for _v in value]
+        elif not isinstance(value, dict):
+            return value
+        elif len(value) == 1 and next(iter(value)) in _TAGS:
+            [(tag, arg)] = value.items()
+            if tag == '__tuple__':
+                return tuple(self.decode(_v, mmap_mode) for _v in arg)
+            filename = os.path.join(self.dirname, arg)
+            if tag == '__object__':
+                return load_dir(filename, mmap_mode=mmap_mode)
+            elif tag == '__pickle__':
+                with open(filename, 'rb') as f:
+                    return pickle.load(f)
+            import numpy as np
+            try:
+                return np.load(filename, mmap_mode=mmap_mode,
+                               allow_pickle=False)
+            except ValueError:
+                # Empty arrays cannot be mapped.
+                return np.load(filename, allow_pickle=False)
+        return {_k: self.decode(_v, mmap_mode) for _k, _v in value.items()}
+
+
+def save_dir(dirname, obj, overwrite=False):
+    """Save `obj` to the directory `dirname`.
+
+    The state of the object (as used for pickling) is stored in the file
+    ``metadata.json`` with each array stored in a separate ``.npy`` file so
+    that it can be memory mapped by :func:`load_dir`.  Nested objects are
+    stored in subdirectories, and values which cannot be represented in JSON
+    are pickled into separate files.
+
+    Arguments
+    ---------
+    dirname : str
+       Directory.  This must not exist unless `overwrite` is `True`.
+    obj : Object
+       Object (any instance of :class:`ObjectMixin` such as a
+       :class:`Container`) to save.
+    overwrite : bool
+       If `True`, replace an existing archive.  The new archive is written to
+       a temporary directory first, so that the old archive is only removed
+       once the new archive is complete.
+    """
+    if not isinstance(obj, ObjectMixin):
+        raise TypeError(f"Can only save Objects (got {type(obj)})")
+    dirname = os.path.abspath(dirname)
+    if os.path.exists(dirname):
+        if not overwrite:
+            raise ValueError(f"Directory {dirname} exists.")
+        if not os.path.exists(os.path.join(dirname, _METADATA)):
+            raise ValueError(
+                f"Refusing to overwrite {dirname}: not an archive.")
+        parent, name = os.path.split(dirname)
+        tmpdir = tempfile.mkdtemp(prefix=f".{name}.", dir=parent)
+        try:
+            new_dirname = os.path.join(tmpdir, 'new')
+            old_dirname = os.path.join(tmpdir, 'old')
+            save_dir(new_dirname, obj)
+            os.replace(dirname, old_dirname)
+            try:
+                os.replace(new_dirname, dirname)
+            except BaseException:
+                # Restore the old archive before tmpdir is removed.
+                os.replace(old_dirname, dirname)
+                raise
+        finally:
+            shutil.rmtree(tmpdir)
+        return
+
+    os.makedirs(dirname)
+    archiver = _DirArchiver(dirname)
+    cls = type(obj)
+    metadata = dict(
+        format=_FORMAT,
+        module=cls.__module__,
+        name=cls.__qualname__,
+        state={_k: archiver.encode(_v, _k)
+               for _k, _v in obj.__getstate__().items()})
+    with open(os.path.join(dirname, _METADATA), 'w') as f:
+        json.dump(metadata, f, indent=1)
+
+
+def load_dir(dirname, mmap_mode='r'):
+    """Return the object saved in `dirname` by :func:`save_dir`.
+
+    Loading is fast even for large archives since the arrays are memory
+    mapped: only the pages that are used are read from disk.
+
+    .. warning:: Values that were pickled will be unpickled.  Only load
+       archives from trusted sources.
+
+    Arguments
+    ---------
+    dirname : str
+       Directory.
+    mmap_mode : None, 'r', 'r+', 'c'
+       Mode with which to memory map the arrays (see :func:`numpy.load`).
+       The default read-only mapping guards the archive against accidental
+       modification.  Use `None` to load the arrays into memory.
+
+    Examples
+    --------
+    >>> import numpy as np, tempfile
+    >>> c = Container(x=np.arange(10.0), n=3, c=Container(a='a', b=(1, 2)))
+    >>> with tempfile.TemporaryDirectory() as d:
+    ...     save_dir(os.path.join(d, 'c'), c)
+    ...     c1 = load_dir(os.path.join(d, 'c'))
+    >>> c1
+    Container(c=Container(a='a', b=(1, 2)), n=3, x=memmap([0., ..., 9.]))
+    """
+    with open(os.path.join(dirname, _METADATA)) as f:
+        metadata = json.load(f)
+    if metadata.get('format', None) != _FORMAT:
+        raise ValueError(
+            f"Unsupported archive format {metadata.get('format', None)}")
+    cls = importlib.import_module(metadata['module'])
+    for _name in metadata['name'].split('.'):
+        cls = getattr(cls, _name)
+    archiver = _DirArchiver(dirname)
+    state = {_k: archiver.decode(_v, mmap_mode)
+             for _k, _v in metadata['state'].items()}
+    obj = cls.__new__(cls)
+    obj.__setstate__(state)
+    return obj
@@ -1,5 +1,6 @@
 from .bases import (SphericalBasis, PeriodicBasis, CartesianBasis,
                     CylindricalBasis, interfaces)
+from .evolve import SplitOperatorEvolver
 
 __all__ = ['SphericalBasis', 'PeriodicBasis', 'CartesianBasis',
-           'CylindricalBasis', 'interfaces']
+           'CylindricalBasis', 'SplitOperatorEvolver', 'interfaces']
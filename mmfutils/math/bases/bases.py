@@ -1,27 +1,157 @@
+import collections
+import concurrent.futures
 import itertools
 import math
+import os
+import threading
 
 import numpy as np
-import scipy.fftpack
+import scipy.linalg
 
-from mmfutils.containers import ObjectBase
+from mmfutils.containers import ObjectBase, lazy_attribute
 
 from . import interfaces
 from .interfaces import (implementer, IBasis, IBasisKx, IBasisLz,
                          IBasisWithConvolution, BasisMixin)
 
-from mmfutils.performance.fft import fft, ifft, fftn, ifftn, resample
+from mmfutils.performance.backends import get_backend
+from mmfutils.performance import fft as _fft
+from mmfutils.performance.fft import resample
+from mmfutils.performance.slabs import (fftn_slabs, ifftn_slabs,
+                                        apply_k_slabs)
 from .utils import (prod, dst, idst, get_xyz, get_kxyz)
+from .cache import PROPAGATOR_CACHE, PropagatorCache
 from mmfutils.math import bessel
 
 sp = scipy
 
 _TINY = np.finfo(float).tiny
 
+# Default number of workers computing the shifted convolutions of
+# CartesianBasis.convolve_coulomb_exact(method='sum') concurrently.  This is
+# independent of the number of FFT threads: the workers run single-threaded
+# transforms (see mmfutils.performance.fft.thread_limit()).
+_WORKERS = os.cpu_count() or 1
+
+# Thread pool shared by all calls (see _get_pool()).
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def set_num_workers(nworkers):
+    """Set the number of workers for the 'sum' method of
+    :meth:`CartesianBasis.convolve_coulomb_exact`.
+
+    The shared thread pool is shut down and recreated on the next use, so do
+    not call this while convolutions are being computed.
+    """
+    global _WORKERS, _POOL
+    with _POOL_LOCK:
+        _WORKERS = nworkers
+        old, _POOL = _POOL, None
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def _get_pool():
+    """Return the shared thread pool with `_WORKERS` threads.
+
+    The pool is created once (on first use) rather than per call.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = concurrent.futures.ThreadPoolExecutor(
+                _WORKERS, thread_name_prefix='mmfutils.bases')
+        return _POOL
+
+
+def _sum_concurrently(f, work, out, max_in_flight):
+    """Add `f(*args)` for each `args` in `work` to `out`.
+
+    The terms are computed in the shared thread pool using single-threaded
+    transforms with at most `max_in_flight` in progress (the pool is shared
+    and may have more workers), and are summed in order so that the result is
+    deterministic.
+    """
+    def f_single(*args):
+        with _fft.thread_limit(1):
+            return f(*args)
+
+    pool = _get_pool()
+    pending = collections.deque()
+    for args in work:
+        if len(pending) >= max_in_flight:
+            out += pending.popleft().result()
+        pending.append(pool.submit(f_single, *args))
+    while pending:
+        out += pending.popleft().result()
+    return out
+
+
 __all__ = ['SphericalBasis', 'PeriodicBasis', 'CartesianBasis',
            'interfaces']
 
 
+class _BackendAttribute(object):
+    """Class attribute returning the attribute `name` of `self._backend`.
+
+    This is a non-data descriptor, so it can be overridden by setting the
+    attribute on the instance or replacing it on the class.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        return getattr(obj._backend, self.name)
+
+
+def _divide(a, b, fill=0.0):
+    """Return `a/b` with `fill` where `b == 0`.
+
+    This is a faster replacement for ``np.ma.divide(a, b).filled(fill)``.
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    res = np.empty(np.broadcast_shapes(a.shape, b.shape),
+                   dtype=np.result_type(a, b, fill, float))
+    res[...] = fill
+    np.divide(a, b, out=res, where=(b != 0))
+    return res
+
+
+def _is_memmap(a):
+    """Return `True` if `a` is a memory-mapped array (processed in slabs)."""
+    return isinstance(a, np.memmap)
+
+
+def _get_shift_weights(shifts, real):
+    """Return the list of `(l, weight)` for the shifted convolutions.
+
+    If `real`, then the contributions from the shifts `l` and `-l` (mod 3) are
+    complex conjugates, so only one of each pair is included with weight 2.
+    """
+    work = []
+    for l in shifts:
+        weight = 1
+        if real and any(l):
+            if tuple(-np.asarray(l) % 3) < l:
+                continue    # Included as the conjugate of -l
+            weight = 2
+        work.append((l, weight))
+    return work
+
+
+def _astype(a, dtype):
+    """Return `a` with the precision of the real `dtype` (complex values stay
+    complex)."""
+    a = np.asarray(a)
+    if np.iscomplexobj(a):
+        dtype = np.result_type(dtype, np.complex64)
+    return a.astype(dtype, copy=False)
+
+
 @implementer(IBasisWithConvolution)
 class SphericalBasis(ObjectBase, BasisMixin):
     """1-dimensional basis for radial problems.
@@ -31,13 +161,28 @@ class SphericalBasis(ObjectBase, BasisMixin):
     wavefunctions here so that a factor of `r` is required to convert these
     into the radial functions.  Unlike the DVR techniques, this approach allows
     us to compute the Coulomb interaction for example.
+
+    Parameters
+    ----------
+    N : int
+       Number of abscissa.
+    R : float
+       Radius of the basis.
+    backend : str, Backend, None
+       Array backend (see :mod:`mmfutils.performance.backends`).
     """
-    def __init__(self, N, R):
+    # Cache of the propagators exp(-factor*k**2) used by laplacian(exp=True).
+    # Set to None to disable caching.
+    propagator_cache = PROPAGATOR_CACHE
+
+    def __init__(self, N, R, backend=None):
         self.N = N
         self.R = R
+        self.backend = backend
         super().__init__()
 
     def init(self):
+        self._backend = get_backend(self.backend)
         dx = self.R/self.N
         r = np.arange(1, self.N+1) * dx
         k = np.pi * (0.5 + np.arange(self.N)) / self.R
@@ -45,6 +190,7 @@ class SphericalBasis(ObjectBase, BasisMixin):
         self._pxyz = [k]
         self.metric = 4*np.pi * r**2 * dx
         self.k_max = k.max()
+        super().init()
 
     def laplacian(self, y, factor=1.0, exp=False):
         """Return the laplacian of `y` times `factor` or the
@@ -61,39 +207,51 @@ class SphericalBasis(ObjectBase, BasisMixin):
            This is used for split evolvers.
         """
         r = self.xyz[0]
-        K = -factor * self._pxyz[0]**2
-        if exp:
-            K = np.exp(K)
+        k = self._pxyz[0]
 
-        ys = [y.real, y.imag] if np.iscomplexobj(y) else [y]
-        res = [idst(K * dst(r*_y))/r for _y in ys]
+        def get_K():
+            return -factor * k**2
 
-        if np.iscomplexobj(y):
-            res = res[0] + 1j*res[1]
+        if exp:
+            exp = self._backend.exp
+            if self.propagator_cache is None:
+                K = exp(get_K())
+            else:
+                K = self.propagator_cache.get(
+                    factor, k, compute=lambda: exp(get_K()))
         else:
-            res = res[0]
+            K = get_K()
 
-        return res
+        # Complex y is handled by dst() which transforms the real and imaginary
+        # parts together in a single pass.
+        return self._idst(K * self._dst(r*y))/r
+
+    def _dst(self, f):
+        return dst(f, backend=self._backend)
+
+    def _idst(self, F):
+        return idst(F, backend=self._backend)
 
     def coulomb_kernel(self, k):
         """Form for the truncated Coulomb kernel."""
         D = 2*self.R
-        return 4*np.pi * np.ma.divide(1.0 - np.cos(k*D), k**2).filled(D**2/2.0)
+        return 4*np.pi * _divide(1.0 - np.cos(k*D), k**2, D**2/2.0)
 
     def convolve_coulomb(self, y, form_factors=[]):
         """Modified Coulomb convolution to include form-factors (if provided).
 
         This version implemented a 3D spherically symmetric convolution.
         """
-        y = np.asarray(y)
+        xp = self._backend.xp
+        y = xp.asarray(y)
         r = self.xyz[0]
         N, R = self.N, self.R
 
         # Padded arrays with trailing _
-        ry_ = np.concatenate([r*y, np.zeros(y.shape, dtype=y.dtype)], axis=-1)
+        ry_ = xp.concatenate([r*y, xp.zeros(y.shape, dtype=y.dtype)], axis=-1)
         k_ = np.pi * (0.5 + np.arange(2*N)) / (2*R)
         K = prod([_K(k_) for _K in [self.coulomb_kernel] + form_factors])
-        return idst(K * dst(ry_))[..., :N] / r
+        return self._idst(K * self._dst(ry_))[..., :N] / r
 
     def convolve(self, y, C=None, Ck=None):
         """Return the periodic convolution `int(C(x-r)*y(r),r)`.
@@ -106,10 +264,10 @@ class SphericalBasis(ObjectBase, BasisMixin):
         R_N = R/N
         if Ck is None:
             C0 = (self.metric * C).sum()
-            Ck = np.ma.divide(2*np.pi * R_N * dst(r*C), k).filled(C0)
+            Ck = _divide(2*np.pi * R_N * self._dst(r*C), k, C0)
         else:
             Ck = Ck(k)
-        return idst(Ck * dst(r*y)) / r
+        return self._idst(Ck * self._dst(r*y)) / r
 
 
 @implementer(IBasisWithConvolution, IBasisKx, IBasisLz)
@@ -136,21 +294,65 @@ class PeriodicBasis(ObjectBase, BasisMixin):
        corresponds to working in a boosted frame with velocity `vx = px/m`.
     smoothing_cutoff : float
        Fraction of maximum momentum used in the function smooth().
+    fft_plans : bool
+       If `True`, then pre-plan the FFTs (requires pyfftw) for states of shape
+       `state_shape` and type `state_dtype`.  These are then used by
+       :meth:`laplacian`, :meth:`convolve`, and :meth:`smooth` with
+       preallocated aligned buffers, avoiding the plan lookup and allocation
+       on every call.  States of other shapes use the usual FFTs.  Pass
+       `out` to :meth:`laplacian` to avoid allocating the result.
+
+       Thread safety: the plans and their buffers are created per thread on
+       first use, so a basis can be shared between threads at the cost of
+       one set of buffers per thread.  Do not share an `out` array between
+       concurrent calls.
+    state_shape : tuple, None
+       Shape of the states for the planned FFTs.  Defaults to `Nxyz`.
+    state_dtype : dtype, None
+       Type of the states for the planned FFTs.  Defaults to the complex type
+       corresponding to `dtype`.
+    dtype : dtype
+       Floating point type of the abscissa, momenta, and kernels.  Use
+       `np.float32` for single precision: with `np.complex64` states, all
+       operations (including the FFTs) are then performed in single
+       precision, halving the memory and bandwidth.
+    scratch_dir : str, None
+       Directory for the scratch arrays used with out-of-core states.
+    backend : str, Backend, None
+       Array backend providing the array namespace `xp`, the FFTs, and the
+       elementwise kernels (see :mod:`mmfutils.performance.backends`).  The
+       planned FFTs are only used if the backend supports them.
+
+    Out-of-core states: If a state is a :class:`numpy.memmap`, then
+    :meth:`fft`, :meth:`fftn`, :meth:`laplacian` (without `twist_phase_x` or
+    `kwz2`), :meth:`convolve`, and :meth:`convolve_coulomb` process it slab by
+    slab (see :mod:`mmfutils.performance.slabs`) holding at most `slab_bytes`
+    in memory.  Unless `out` is provided, the results are memory-mapped
+    scratch arrays in `scratch_dir`.
+
+    The momenta and the quantities derived from them are lazy attributes (see
+    :class:`mmfutils.containers.lazy_attribute`), so `boost_pxyz` and
+    `smoothing_cutoff` can be changed (e.g. in a parameter scan) without
+    calling :meth:`init`: only the affected quantities are recomputed.
     """
+    _independent_attributes = ('boost_pxyz', 'smoothing_cutoff')
+
+    # Cache of the propagators exp(-factor*k2) used by laplacian(exp=True).
+    # Set to None to disable caching.
+    propagator_cache = PROPAGATOR_CACHE
 
-    # Select operations are performed using self.xp instead of numpy.
-    # This can be replaced cupy to provide gpu support with minimal
-    # code changes.  Similarly with the fft functions and a generic
-    # function to convert an array into a numpy array on the host.
-    xp = np
-    _fft = staticmethod(fft)
-    _ifft = staticmethod(ifft)
-    _fftn = staticmethod(fftn)
-    _ifftn = staticmethod(ifftn)
-    _asnumpy = staticmethod(np.asarray)  # Convert to numpy array
+    # Bounds on the per-instance cache of convolution kernels.  The 'sum'
+    # method of CartesianBasis.convolve_coulomb_exact() uses up to 3**dim.
+    kernel_cache_maxsize = 32
+    kernel_cache_max_bytes = 256*2**20
+
+    # Maximum size of the slabs held in memory for out-of-core states.
+    slab_bytes = 64*2**20
 
     def __init__(self, Nxyz, Lxyz, symmetric_lattice=False,
-                 axes=None, boost_pxyz=None, smoothing_cutoff=0.8):
+                 axes=None, boost_pxyz=None, smoothing_cutoff=0.8,
+                 fft_plans=False, state_shape=None, state_dtype=None,
+                 dtype=np.float64, scratch_dir=None, backend=None):
         self.symmetric_lattice = symmetric_lattice
         self.Nxyz = np.asarray(Nxyz)
         self.Lxyz = np.asarray(Lxyz)
@@ -161,43 +363,146 @@ class PeriodicBasis(ObjectBase, BasisMixin):
         if axes is None:
             axes = np.arange(-self.dim, 0)
         self.axes = np.asarray(axes)
+        self.fft_plans = fft_plans
+        self.state_shape = state_shape
+        self.state_dtype = state_dtype
+        self.dtype = np.dtype(dtype)
+        self.scratch_dir = scratch_dir
+        self.backend = backend
         super().__init__()
 
     def init(self):
-        self.xyz = tuple(map(
-            self.xp.asarray,
+        dtype = self.dtype
+
+        # Select operations are performed using self.xp instead of numpy.
+        # This can be replaced by cupy (through a backend) to provide gpu
+        # support with minimal code changes.  Similarly with the fft
+        # functions and a generic function to convert an array into a numpy
+        # array on the host.  These are accessed through the backend (which
+        # is pickled by name) rather than stored so that the basis can be
+        # pickled.
+        backend = self._backend = get_backend(self.backend)
+
+        self.xyz = tuple(
             get_xyz(Nxyz=self.Nxyz, Lxyz=self.Lxyz,
-                    symmetric_lattice=self.symmetric_lattice)))
-        self._pxyz = tuple(map(
-            self.xp.asarray,
-            get_kxyz(Nxyz=self.Nxyz, Lxyz=self.Lxyz)))
-        self._pxyz_derivative = tuple(map(
-            self.xp.asarray,
-            get_kxyz(Nxyz=self.Nxyz, Lxyz=self.Lxyz)))
+                    symmetric_lattice=self.symmetric_lattice, dtype=dtype,
+                    backend=backend))
+        self._kxyz = tuple(
+            get_kxyz(Nxyz=self.Nxyz, Lxyz=self.Lxyz, dtype=dtype,
+                     backend=backend))
+        self._pxyz_derivative = tuple(
+            get_kxyz(Nxyz=self.Nxyz, Lxyz=self.Lxyz, dtype=dtype,
+                     backend=backend))
 
         # Zero out odd highest frequency component.
         for _N, _p in zip(self.Nxyz, self._pxyz_derivative):
             _p.ravel()[_N//2] = 0.0
 
-        # Add boosts
-        self._pxyz = [_p - _b
-                      for (_p, _b) in zip(self._pxyz,
-                                          self.xp.asarray(self.boost_pxyz))]
-        self.metric = np.prod(self.Lxyz/self.Nxyz)
-        self.k_max = self._asnumpy([abs(_p).max() for _p in self._pxyz])
+        self.metric = dtype.type(np.prod(self.Lxyz/self.Nxyz))
+
+        self._plans = threading.local()
+        self._fftn_plans        # Plan now rather than on the first call.
+        super().init()
 
+    @property
+    def _fftn_plans(self):
+        """The planned transforms (or `None`) for `fft_plans`.
+
+        The plans share work buffers, so each thread gets its own plans
+        (created on first use in that thread).
+        """
+        plans = self._plans
+        if not hasattr(plans, 'fftn'):
+            plans.fftn = self._get_fftn_plans()
+        return plans.fftn
+
+    def _get_fftn_plans(self):
+        """Return new planned transforms (or `None`) for `fft_plans`."""
+        backend = self._backend
+        if not self.fft_plans or backend.get_fftn_plans is None:
+            return None
+        shape = self.state_shape
+        if shape is None:
+            shape = tuple(self.Nxyz)
+        return backend.get_fftn_plans(
+            tuple(shape), dtype=self.get_state_dtype(),
+            axes=self.axes % len(shape))
+
+    def __getstate__(self):
+        # The FFTW plans cannot be pickled: they are rebuilt on unpickling.
+        state = dict(self.__dict__)
+        state.pop('_plans', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._plans = threading.local()
+        self._fftn_plans
+
+    # Select operations are performed using self.xp instead of numpy, and
+    # the FFTs with self._fft etc.  These are taken from the backend (see
+    # `backend`), but for compatibility, they can still be overridden by
+    # setting them on the class or instance (e.g. ``PeriodicBasis.xp =
+    # cupy``), in which case they take precedence over the backend.
+    xp = _BackendAttribute('xp')
+    _fft = _BackendAttribute('fft')
+    _ifft = _BackendAttribute('ifft')
+    _fftn = _BackendAttribute('fftn')
+    _ifftn = _BackendAttribute('ifftn')
+    _rfftn = _BackendAttribute('rfftn')
+    _irfftn = _BackendAttribute('irfftn')
+    _asnumpy = _BackendAttribute('asnumpy')  # Convert to numpy array
+
+    ######################################################################
+    # Lazy attributes depending on the boost.
+    @lazy_attribute('_kxyz', 'boost_pxyz')
+    def _pxyz(self):
+        """Boosted momenta."""
+        return [_p - _b for (_p, _b) in zip(
+            self._kxyz, self.xp.asarray(self.boost_pxyz, dtype=self.dtype))]
+
+    @lazy_attribute('_pxyz')
+    def k_max(self):
+        return self._asnumpy([abs(_p).max() for _p in self._pxyz])
+
+    @lazy_attribute('_pxyz', 'smoothing_cutoff')
+    def _smoothing_factor(self):
         p2_pc2 = sum(
             (_p/(self.smoothing_cutoff * _p).max())**2
             for _p in self._pxyz)
-        self._smoothing_factor = self.xp.where(p2_pc2 < 1, 1, 0)
-        #np.exp(-p2_pc2**4)
-        #self._smoothing_factor = 1.0
-
-        # Memoize momentum sums for speed
+        return self.xp.where(p2_pc2 < 1, 1, 0).astype(self.dtype)
+
+    @lazy_attribute('_kxyz', 'boost_pxyz')
+    def _rpxyz(self):
+        """Half-spectrum momenta for the real transforms used with real
+        inputs.  These are only valid without boosts: otherwise the kernels
+        are not symmetric and the result will not be real."""
+        if np.any(np.asarray(self.boost_pxyz) != 0):
+            return None
+        return tuple(
+            get_kxyz(Nxyz=self.Nxyz, Lxyz=self.Lxyz, real=True,
+                     dtype=self.dtype, backend=self._backend))
+
+    @lazy_attribute('_pxyz')
+    def _k2_kx2_kyz2(self):
+        """Memoized momentum sums for speed."""
         _kx2 = self._pxyz[0]**2
         _kyz2 = sum(_p**2 for _p in self._pxyz[1:])
         _k2 = _kx2+_kyz2
-        self._k2_kx2_kyz2 = (_k2, _kx2, _kyz2)
+        return (_k2, _kx2, _kyz2)
+
+    @lazy_attribute('_pxyz', '_rpxyz')
+    def _kernel_cache(self):
+        """Cache of convolution kernels (see get_kernel())."""
+        return PropagatorCache(
+            maxsize=self.kernel_cache_maxsize,
+            max_bytes=self.kernel_cache_max_bytes)
+
+    def get_state_dtype(self):
+        """Return the type of the states (see `state_dtype`)."""
+        if self.state_dtype is None:
+            return np.result_type(self.dtype, np.complex64)
+        return np.dtype(self.state_dtype)
 
     @property
     def kx(self):
@@ -212,7 +517,7 @@ class PeriodicBasis(ObjectBase, BasisMixin):
         return self.Nxyz[0]
 
     def laplacian(self, y, factor=1.0, exp=False, kx2=None, k2=None,
-                  kwz2=0, twist_phase_x=None):
+                  kwz2=0, twist_phase_x=None, out=None):
         """Return the laplacian of `y` times `factor` or the exponential of this.
 
         Arguments
@@ -241,34 +546,52 @@ class PeriodicBasis(ObjectBase, BasisMixin):
            compensate, the momenta should be shifted as well::
 
               -factor * twist_phase_x*ifft((k+k_twist)**2*fft(y/twist_phase_x)
+        out : array, optional
+           If provided, the result is stored here.  This must be a complex
+           array of the same shape as `y` and may be `y` itself.  The
+           transforms are then performed in place, so no state-sized
+           temporaries are allocated (unless `twist_phase_x` is used).
         """
         _k2, _kx2, _kyz2 = self._k2_kx2_kyz2
         if k2 is None:
             if kx2 is None:
-                k2 = _k2
+                k2_args = (_k2,)
             else:
-                kx2 = self.xp.asarray(kx2)
-                k2 = kx2 + _kyz2
+                k2_args = (kx2, _kyz2)
         else:
-            k2 = self.xp.asarray(k2)
             assert kx2 is None
+            k2_args = (k2,)
+
+        def get_K():
+            k2 = sum(map(self.xp.asarray, k2_args))
+            return -factor * k2
 
-        K = -factor * k2
         if exp:
             if kwz2 != 0:
                 raise NotImplementedError(
                     f"Cannot use exp=True if kwz2 != 0 (got {kwz2}).")
-            K = self.xp.exp(K)
+            exp = self._backend.exp
+            if self.propagator_cache is None:
+                K = exp(get_K())
+            else:
+                K = self.propagator_cache.get(
+                    factor, *k2_args, compute=lambda: exp(get_K()))
+        else:
+            K = get_K()
 
         if twist_phase_x is not None:
             twist_phase_x = self.xp.asarray(twist_phase_x)
             y = y/twist_phase_x
 
-        yt = self.fftn(y)
-        laplacian_y = self.ifftn(K * yt)
-
-        if kwz2 != 0:
+        if kwz2 == 0:
+            laplacian_y = self._apply_k(y, K, out=out)
+        else:
+            yt = self.fftn(y)
+            laplacian_y = self.ifftn(K * yt)
             laplacian_y += 2*kwz2*factor * self.apply_Lz_hbar(y, yt=yt)
+            if out is not None:
+                out[...] = laplacian_y
+                laplacian_y = out
 
         if twist_phase_x is not None:
             laplacian_y *= twist_phase_x
@@ -283,30 +606,130 @@ class PeriodicBasis(ObjectBase, BasisMixin):
         return x*self.ifftn(ky*yt) - y*self.ifftn(kx*yt)
 
     # We need these wrappers because the state may have additional
-    # indices for components etc. in front.
-    def fft(self, x, axis):
+    # indices for components etc. in front.  The `out` argument is only
+    # passed on if specified so that replacement FFTs need not support it.
+    def _slab_kw(self):
+        """Return the keyword arguments for the out-of-core transforms."""
+        return dict(dir=self.scratch_dir, max_bytes=self.slab_bytes,
+                    backend=self._backend)
+
+    def fft(self, x, axis, out=None):
         """Perform the fft along self.axes[axis]"""
         axis = self.axes[axis] % len(x.shape)
-        return self._fft(x, axis=axis)
+        if _is_memmap(x):
+            return fftn_slabs(x, axes=[axis], out=out, **self._slab_kw())
+        if out is None:
+            return self._fft(x, axis=axis)
+        return self._fft(x, axis=axis, out=out)
 
-    def ifft(self, x, axis):
+    def ifft(self, x, axis, out=None):
         """Perform the ifft along self.axes[axis]"""
         axis = self.axes[axis] % len(x.shape)
-        return self._ifft(x, axis=axis)
+        if _is_memmap(x):
+            return ifftn_slabs(x, axes=[axis], out=out, **self._slab_kw())
+        if out is None:
+            return self._ifft(x, axis=axis)
+        return self._ifft(x, axis=axis, out=out)
 
-    def fftn(self, x):
+    def fftn(self, x, out=None):
         """Perform the fft along spatial axes"""
         axes = self.axes % len(x.shape)
-        return self._fftn(x, axes=axes)
+        if _is_memmap(x):
+            return fftn_slabs(x, axes=axes, out=out, **self._slab_kw())
+        if out is None:
+            return self._fftn(x, axes=axes)
+        return self._fftn(x, axes=axes, out=out)
 
-    def ifftn(self, x):
+    def ifftn(self, x, out=None):
         """Perform the ifft along spatial axes"""
         axes = self.axes % len(x.shape)
-        return self._ifftn(x, axes=axes)
+        if _is_memmap(x):
+            return ifftn_slabs(x, axes=axes, out=out, **self._slab_kw())
+        if out is None:
+            return self._ifftn(x, axes=axes)
+        return self._ifftn(x, axes=axes, out=out)
+
+    def rfftn(self, x):
+        """Perform the real fft along spatial axes.
+
+        The last spatial axis is reduced to `N//2 + 1` points.
+        """
+        axes = self.axes % len(x.shape)
+        return self._rfftn(x, axes=axes)
+
+    def irfftn(self, x, s=None):
+        """Perform the inverse real fft along spatial axes.
+
+        Arguments
+        ---------
+        s : [int]
+           Shape of the output along the spatial axes.  Defaults to `Nxyz`.
+        """
+        axes = self.axes % len(x.shape)
+        if s is None:
+            s = self.Nxyz
+        return self._irfftn(x, s=tuple(s), axes=axes)
+
+    def _use_rfft(self, y):
+        """Return `True` if the real transforms can be used for `y`."""
+        return self._rpxyz is not None and not self.xp.iscomplexobj(y)
+
+    def _apply_k_memmap(self, y, Kk, real=False):
+        """Return `ifftn(Kk*fftn(y))` for out-of-core `y`.
+
+        If the kernel is `real`, then return the real part if the in-memory
+        path would have used the real transforms.
+        """
+        res = self._apply_k(y, Kk)
+        if real and self._use_rfft(y):
+            res = res.real
+        return res
+
+    def _apply_k_real(self, y, Kk):
+        """Return `irfftn(Kk*rfftn(y))` for real `y`.
+
+        Here `Kk` must be real and tabulated on the half-spectrum momenta
+        `_rpxyz`.
+        """
+        s = [y.shape[_a] for _a in self.axes % len(y.shape)]
+        return self.irfftn(Kk * self.rfftn(y), s=s)
+
+    def _apply_k(self, y, Kk, out=None):
+        """Return `ifftn(Kk*fftn(y))` using the planned FFTs if possible.
+
+        If `out` is provided, then the result is stored there and the
+        transforms are performed in place (or in the work buffers of the
+        plans), so no state-sized arrays are allocated.  Otherwise a new
+        array is returned.  The plans are per thread, so this may be called
+        concurrently from several threads.
+        """
+        if _is_memmap(y):
+            return apply_k_slabs(y, Kk, axes=self.axes % len(y.shape),
+                                 out=out, **self._slab_kw())
+        plans = self._fftn_plans
+        if plans is not None:
+            fftn_plan, ifftn_plan = plans
+            y = np.asarray(y)
+            shape = fftn_plan.input_shape
+            if (y.shape == shape
+                    and np.can_cast(y.dtype, fftn_plan.input_array.dtype)
+                    and np.broadcast_shapes(np.shape(Kk), shape) == shape):
+                fftn_plan.input_array[...] = y
+                yt = fftn_plan()
+                yt *= Kk
+                if out is None:
+                    out = np.empty(shape, dtype=yt.dtype)
+                out[...] = ifftn_plan()
+                return out
+        if out is None:
+            return self.ifftn(Kk * self.fftn(y))
+        yt = self.fftn(y, out=out)
+        yt *= Kk
+        return self.ifftn(yt, out=yt)
 
     def smooth(self, x, frac=0.8):
         """Smooth the state by multiplying by form factor."""
-        return self.ifftn(self._smoothing_factor*self.fftn(x))
+        return self._apply_k(x, self._smoothing_factor)
 
     def get_gradient(self, y):
         # TODO: Check this for the highest momentum issue.
@@ -333,21 +756,56 @@ class PeriodicBasis(ObjectBase, BasisMixin):
         constant background removed so that the net charge in the unit
         cell is zero.
         """
-        return 4*np.pi * np.ma.divide(1.0, k**2).filled(0.0)
+        return 4*np.pi * _divide(1.0, k**2, 0.0)
+
+    def get_kernel(self, key, form_factors, compute):
+        """Return the kernel `compute()` from the kernel cache.
+
+        Kernels are cached per basis on `key` and the identity of the
+        `form_factors`.  The cache is cleared by :meth:`init` and when the
+        momenta change (e.g. if `boost_pxyz` is set).  The kernels are
+        read-only.
+
+        Arguments
+        ---------
+        key : str, tuple
+           Key identifying the kernel.
+        form_factors : [function]
+           Form factors used by the kernel.
+        compute : function
+           Function returning the kernel.
+        """
+        return self._kernel_cache.get(key, *form_factors, compute=compute)
 
     def convolve_coulomb(self, y, form_factors=[]):
-        """Periodic convolution with the Coulomb kernel."""
-        y = np.asarray(y)
+        """Periodic convolution with the Coulomb kernel.
+
+        If `y` is real (and the kernel is real), then real transforms are used
+        and the result is real.  The kernels are cached (see
+        :meth:`get_kernel`).
+        """
+        y = np.asanyarray(y)
+
+        def get_Ck(pxyz):
+            k = np.sqrt(sum(_k**2 for _k in pxyz))
+            return _astype(
+                prod([_K(k) for _K in [self.coulomb_kernel] + form_factors]),
+                self.dtype)
 
-        # This broadcasts to the appropriate size if there are
-        # multiple components.
-        # dim = len(np.asarray(self.Lxyz))
-        # N = np.asarray(y.shape)
-        # b_cast = [None] * (dim - len(N)) + [slice(None)]*dim
+        if _is_memmap(y):
+            Ck = self.get_kernel(('coulomb', False), form_factors,
+                                 lambda: get_Ck(self._pxyz))
+            return self._apply_k_memmap(y, Ck, real=not np.iscomplexobj(Ck))
 
-        k = np.sqrt(sum(_k**2 for _k in self._pxyz))
-        Ck = prod([_K(k) for _K in [self.coulomb_kernel] + form_factors])
-        return self.ifftn(Ck * self.fftn(y))
+        if self._use_rfft(y):
+            Ck = self.get_kernel(('coulomb', True), form_factors,
+                                 lambda: get_Ck(self._rpxyz))
+            if not np.iscomplexobj(Ck):
+                return self._apply_k_real(y, Ck)
+
+        Ck = self.get_kernel(('coulomb', False), form_factors,
+                             lambda: get_Ck(self._pxyz))
+        return self._apply_k(y, Ck)
 
     def convolve(self, y, C=None, Ck=None):
         """Return the periodic convolution `int(C(x-r)*y(r),r)`.
@@ -362,13 +820,35 @@ class PeriodicBasis(ObjectBase, BasisMixin):
            If provided, then this function will be used instead directly in
            momentum space.  Assumed to be spherically symmetric (will be passed
            only the magnitude `k`)
+
+        If `y` and the kernel are real, then real transforms are used and the
+        result is real.
         """
+        if _is_memmap(y):
+            if Ck is None:
+                real = not np.iscomplexobj(C)
+                Ck = self.fftn(np.asarray(C))
+            else:
+                Ck = Ck(np.sqrt(sum(_k**2 for _k in self._pxyz)))
+                real = not np.iscomplexobj(Ck)
+            return self._apply_k_memmap(y, Ck, real=real)
+
+        y = self.xp.asarray(y)
+        if self._use_rfft(y):
+            if Ck is None:
+                if not np.iscomplexobj(C):
+                    return self._apply_k_real(y, self.rfftn(np.asarray(C)))
+            else:
+                Ck_ = Ck(np.sqrt(sum(_k**2 for _k in self._rpxyz)))
+                if not np.iscomplexobj(Ck_):
+                    return self._apply_k_real(y, Ck_)
+
         if Ck is None:
             Ck = self.fftn(C)
         else:
             k = np.sqrt(sum(_k**2 for _k in self._pxyz))
             Ck = Ck(k)
-        return self.ifftn(Ck * self.fftn(y))
+        return self._apply_k(y, Ck)
 
     @property
     def dim(self):
@@ -398,12 +878,35 @@ class CartesianBasis(PeriodicBasis):
     fast_coulomb : bool
        If `True`, use the fast Coulomb algorithm which is slightly less
        accurate but much faster.
+
+    Additional keyword arguments are passed to :class:`PeriodicBasis`.
     """
     def __init__(self, Nxyz, Lxyz, axes=None,
-                 symmetric_lattice=False, fast_coulomb=True):
+                 symmetric_lattice=False, fast_coulomb=True, **kw):
         self.fast_coulomb = fast_coulomb
         PeriodicBasis.__init__(self, Nxyz=Nxyz, Lxyz=Lxyz, axes=axes,
-                               symmetric_lattice=symmetric_lattice)
+                               symmetric_lattice=symmetric_lattice, **kw)
+
+    def init(self):
+        super().init()
+        # Phases exp(i*delta*x) for the shifts delta = 2*pi*l/3/L used by
+        # convolve_coulomb_exact(method='sum').  These are stored along each
+        # axis and combined with get_exp_delta().
+        ctype = np.result_type(self.dtype, np.complex64)
+        exp = self._backend.exp
+        self._exp_delta_xyz = [
+            [exp(2j*np.pi * _l/3.0/_L * _x).astype(ctype) for _l in range(3)]
+            for _x, _L in zip(self.xyz, self.Lxyz)]
+
+    def get_exp_delta(self, l):
+        """Return the phase `exp(i*delta*x)` for the shift `l`.
+
+        Arguments
+        ---------
+        l : (int, int, ...)
+           Shifts `delta = 2*pi*l/3/L` along each axis with `l` in `(0, 1, 2)`.
+        """
+        return prod(_exp[_l] for _exp, _l in zip(self._exp_delta_xyz, l))
 
     def convolve_coulomb_fast(self, y, form_factors=[], correct=False):
         r"""Return the approximate convolution `int(C(x-r)*y(r),r)` where
@@ -457,23 +960,30 @@ class CartesianBasis(PeriodicBasis):
         N0 = N.copy()
         N0[-dim:] = N[-dim:]//3
 
-        y0 = resample(y, N0)
+        y0 = resample(y, N0, backend=self._backend)
         V = resample(self.convolve_coulomb_exact(
-            y0, form_factors=form_factors, method='pad'), N)
+            y0, form_factors=form_factors, method='pad'), N,
+            backend=self._backend)
         if correct:
-            k = np.sqrt(sum(_K**2 for _K in self._pxyz))
-            C = 4*np.pi * np.ma.divide(1.0, k**2).filled(0.0)
-            for F in form_factors:
-                C = C * F(k)
-            dV = self.ifftn(C * self.fftn(y - resample(y0, N)))
-            if np.issubdtype(V.dtype, np.complex128):
+            def get_C():
+                k = np.sqrt(sum(_K**2 for _K in self._pxyz))
+                C = 4*np.pi * _divide(1.0, k**2, 0.0)
+                for F in form_factors:
+                    C = C * F(k)
+                return _astype(C, self.dtype)
+
+            C = self.get_kernel(('fast',), form_factors, get_C)
+            dV = self.ifftn(C * self.fftn(
+                y - resample(y0, N, backend=self._backend)))
+            if np.iscomplexobj(V):
                 V += dV
             else:
                 assert np.allclose(0, V.imag)
                 V += dV.real
         return V
 
-    def convolve_coulomb_exact(self, y, form_factors=[], method='sum'):
+    def convolve_coulomb_exact(self, y, form_factors=[], method='sum',
+                               threads=None, max_in_flight=None):
         r"""Return the convolution `int(C(x-r)*y(r),r)` where
 
         .. math::
@@ -485,9 +995,25 @@ class CartesianBasis(PeriodicBasis):
         ---------
         y : array
            Usually the density, but can be any array
-        method : 'sum', 'pad'
-           Either zero-pad the array (takes extra memory but can use multiple
-           cores) or sum over the 27 small transforms (slow).
+        method : 'sum', 'pad', 'pruned'
+           Either zero-pad the array (takes `3**dim` times the memory), sum
+           over the 27 small transforms, or use the 'pruned' method which
+           computes the zero-padded convolution axis by axis, skipping the
+           transforms of the pencils known to vanish (the same memory as
+           'pad' but about half the transforms).  If `y` is real, then real
+           transforms are used where possible and the 'sum' method only
+           computes about half of the transforms.
+        threads : int, None
+           Number of shifted transforms of the 'sum' method computed
+           concurrently.  Defaults to the number of workers (see
+           :func:`set_num_workers`: by default the number of cores), which
+           is also the maximum.  If more than one, then each worker uses
+           single-threaded transforms so that the cores are not
+           oversubscribed.
+        max_in_flight : int, None
+           Maximum number of shifted transforms being computed at once.  Each
+           requires several temporary arrays the size of `y`, so this bounds
+           the memory usage.  Defaults to `threads`.
 
         This function is designed for computing the Coulomb potential of a
         charge distribution.  In this case, one would have the kernel:
@@ -502,52 +1028,184 @@ class CartesianBasis(PeriodicBasis):
         """
         y = np.asarray(y)
         L = np.asarray(self.Lxyz)
-        dim = len(L)
         D = np.sqrt((L**2).sum())  # Diameter of cell
 
         def C(k):
-            C = 4*np.pi * np.ma.divide(1 - np.cos(D*k), k**2).filled(D**2/2.)
+            C = 4*np.pi * _divide(1 - np.cos(D*k), k**2, D**2/2.)
             for F in form_factors:
                 C = C * F(k)
-            return C
+            return _astype(C, self.dtype)
 
         if method == 'sum':
-            # Sum with a loop.  Minimizes the memory usage, but will not
-            # use multiple cores.
-            K = self._pxyz
-            X = self.xyz
-            V = np.zeros(y.shape, dtype=y.dtype)
-            for l in itertools.product(np.arange(3), repeat=dim):
-                delta = [2*np.pi * _l/3.0/_L for _l, _L in zip(l, L)]
-                exp_delta = np.exp(1j*sum(_d*_x for _x, _d in zip(X, delta)))
-                y_delta = (exp_delta.conj() * y)
-                k = np.sqrt(sum((_k + _d)**2 for _k, _d in zip(K, delta)))
-                dV = (exp_delta * self.ifftn(C(k) * self.fftn(y_delta)))
-                if np.issubdtype(V.dtype, np.complex128):
-                    V += dV
-                else:
-                    assert np.allclose(0, V.imag)
-                    V += dV.real
-            return V/dim**3
+            return self._coulomb_sum(y, C, form_factors, threads=threads,
+                                     max_in_flight=max_in_flight)
         elif method == 'pad':
-            N = np.asarray(y.shape[-dim:])
-            N_padded = 3*N
-            L_padded = 3*L
-            shape = np.asarray(y.shape)
-            shape_padded = shape.copy()
-            shape_padded[-dim:] = N_padded
-            y_padded = np.zeros(shape_padded, dtype=y.dtype)
-            inds = tuple(slice(0, _N) for _N in shape)
-            y_padded[inds] = y
-            k = np.sqrt(
-                sum(_K**2 for _K in get_kxyz(N_padded, L_padded)))
-
-            # This broadcasts to the appropriate size
-            b_cast = (None,) * (dim - len(N)) + (slice(None),)*dim
-            return self.ifftn(C(k)[b_cast] * self.fftn(y_padded))[inds]
+            return self._coulomb_pad(y, C, form_factors)
+        elif method == 'pruned':
+            return self._coulomb_pruned(y, C)
         else:
             raise NotImplementedError(
-                "method=%s not implemented: use 'sum' or 'pad'" % (method,))
+                "method=%s not implemented: use 'sum', 'pad', or 'pruned'"
+                % (method,))
+
+    def _coulomb_sum(self, y, C, form_factors, threads, max_in_flight):
+        """Implementation of `convolve_coulomb_exact(method='sum')`.
+
+        Sum over the shifted periodic convolutions.  These are computed
+        concurrently in a thread pool (the FFTs and ufuncs release the GIL)
+        using single-threaded transforms, with at most `max_in_flight` shifts
+        in progress, and summed in a
+        fixed order so the result is deterministic.  For real `y`, the
+        contributions from shifts `l` and `-l` (mod 3) are complex conjugates,
+        so only half need to be computed.
+        """
+        L = np.asarray(self.Lxyz)
+        dim = len(L)
+        if threads is None:
+            threads = _WORKERS
+        if max_in_flight is None:
+            max_in_flight = threads
+        max_in_flight = max(1, min(max_in_flight, threads))
+        K = self._pxyz
+
+        def get_Ck(l):
+            def compute():
+                delta = [2*np.pi * _l/3.0/_L for _l, _L in zip(l, L)]
+                return C(np.sqrt(sum((_k + _d)**2
+                                     for _k, _d in zip(K, delta))))
+            return self.get_kernel(('sum', l), form_factors, compute)
+
+        shifts = list(itertools.product(range(3), repeat=dim))
+
+        # Pairing requires a real kernel
+        real = (not np.iscomplexobj(y)
+                and not np.iscomplexobj(get_Ck(shifts[0])))
+        work = _get_shift_weights(shifts, real)
+
+        V = np.zeros(y.shape, dtype=y.dtype)
+        complex_V = np.iscomplexobj(V)
+
+        def get_dV(l, weight):
+            exp_delta = self.get_exp_delta(l)
+            dV = exp_delta * self.ifftn(
+                get_Ck(l) * self.fftn(exp_delta.conj() * y))
+            if not complex_V:
+                dV = dV.real
+            if weight != 1:
+                dV *= weight
+            return dV
+
+        threads = min(threads, len(work))
+        if threads <= 1:
+            for l, weight in work:
+                V += get_dV(l, weight)
+        else:
+            _sum_concurrently(get_dV, work, out=V,
+                              max_in_flight=max_in_flight)
+        return V/3**dim
+
+    def _coulomb_pad(self, y, C, form_factors):
+        """Implementation of `convolve_coulomb_exact(method='pad')`."""
+        L = np.asarray(self.Lxyz)
+        dim = len(L)
+        N = np.asarray(y.shape[-dim:])
+        N_padded = 3*N
+        L_padded = 3*L
+        shape = np.asarray(y.shape)
+        shape_padded = shape.copy()
+        shape_padded[-dim:] = N_padded
+        y_padded = np.zeros(shape_padded, dtype=y.dtype)
+        inds = tuple(slice(0, _N) for _N in shape)
+        y_padded[inds] = y
+
+        # This broadcasts to the appropriate size
+        b_cast = (None,) * (dim - len(N)) + (slice(None),)*dim
+
+        def get_Ck(real):
+            return C(np.sqrt(sum(
+                _K**2 for _K in get_kxyz(N_padded, L_padded, real=real,
+                                         dtype=self.dtype,
+                                         backend=self._backend))))
+
+        if not np.iscomplexobj(y):
+            Ck = self.get_kernel(('pad', True, tuple(N_padded)),
+                                 form_factors, lambda: get_Ck(True))
+            if not np.iscomplexobj(Ck):
+                return self.irfftn(Ck[b_cast] * self.rfftn(y_padded),
+                                   s=N_padded)[inds]
+
+        Ck = self.get_kernel(('pad', False, tuple(N_padded)),
+                             form_factors, lambda: get_Ck(False))
+        return self.ifftn(Ck[b_cast] * self.fftn(y_padded))[inds]
+
+    def _coulomb_pruned(self, y, C):
+        """Implementation of `convolve_coulomb_exact(method='pruned')`.
+
+        The zero-padded convolution of the 'pad' method, but without forming
+        the padded array and transforming one axis at a time so that the
+        pencils known to vanish are skipped.  The forward transforms start
+        with the last spatial axis, where only the `N**(dim-1)` pencils of
+        `y` are non-zero, and each later axis has 3 times as many non-zero
+        pencils.  Likewise, only the first `N` points along each axis are
+        kept after its inverse transform.  In 3D, this needs 13 rather than
+        27 sets of `(3N)**2` transforms each way.  The kernel is not cached
+        but computed slab by slab (see :meth:`_apply_pruned_kernel`).
+        """
+        L = np.asarray(self.Lxyz)
+        dim = len(L)
+        axes = self.axes % len(y.shape)
+        spatial = tuple(range(-dim, 0))
+        y = np.moveaxis(y, axes, spatial)
+        N = np.asarray(y.shape[-dim:])
+        n = 3*N
+        backend = self._backend
+
+        # Real transforms require a real kernel
+        real = (not np.iscomplexobj(y)
+                and not np.iscomplexobj(C(np.ones(1, dtype=self.dtype))))
+        kxyz = get_kxyz(n, 3*L, real=real, dtype=self.dtype, backend=backend)
+        K, kz = kxyz[:-1], np.ravel(kxyz[-1])
+
+        if real:
+            yt = backend.rfft(y, n=n[-1], axis=-1)
+        else:
+            yt = backend.fft(y, n=n[-1], axis=-1)
+        for _a in reversed(spatial[:-1]):
+            yt = backend.fft(yt, n=n[_a], axis=_a)
+
+        self._apply_pruned_kernel(yt, C, K, kz)
+
+        for _a in spatial[:-1]:
+            if _a == -dim:
+                backend.ifft(yt, axis=_a, out=yt)
+            else:
+                yt = backend.ifft(yt, axis=_a)
+            yt = yt[(Ellipsis, slice(0, N[_a])) + (slice(None),)*(-1 - _a)]
+        if real:
+            V = backend.irfft(yt, n=n[-1], axis=-1)
+        else:
+            V = backend.ifft(yt, axis=-1)
+        return np.moveaxis(V[..., :N[-1]], spatial, axes)
+
+    def _apply_pruned_kernel(self, yt, C, K, kz):
+        """Multiply `yt` in place by the kernel `C(sqrt(sum(K**2) + kz**2))`.
+
+        The kernel is computed one slab (along the first spatial axis) at a
+        time so that the temporaries are bounded by :attr:`slab_bytes`.
+        """
+        if not K:
+            yt *= C(abs(kz))
+            return yt
+        dim = len(K) + 1
+        N0 = yt.shape[-dim]
+        step = max(1, self.slab_bytes // max(1, yt.nbytes // N0))
+        for i0 in range(0, N0, step):
+            slab = slice(i0, i0 + step)
+            k2 = K[0][slab]**2 + kz**2
+            for _k in K[1:]:
+                k2 = k2 + _k**2
+            yt[(Ellipsis, slab) + (slice(None),)*(dim - 1)] *= C(np.sqrt(k2))
+        return yt
 
     def convolve_coulomb(self, y, form_factors=[], **kw):
         if self.fast_coulomb:
@@ -582,29 +1240,57 @@ class CylindricalBasis(ObjectBase, BasisMixin):
        Axes in array y which correspond to the x and r axes here.
        This is required for cases where y has additional dimensions.
        The default is the last two axes (best for performance).
+    fft_plans : bool
+       If `True`, then pre-plan the FFTs along the x axis (requires pyfftw)
+       for states of shape `state_shape` and type `state_dtype`.  See
+       :class:`PeriodicBasis`.
+    state_shape : tuple, None
+       Shape of the states for the planned FFTs.  Defaults to `Nxr`.
+    state_dtype : dtype, None
+       Type of the states for the planned FFTs.  Defaults to the complex type
+       corresponding to `dtype`.
+    dtype : dtype
+       Floating point type of the abscissa, momenta, and kinetic matrices.
+       The DVR basis is constructed in double precision then converted.
+    backend : str, Backend, None
+       Array backend providing the FFTs and the elementwise kernels (see
+       :mod:`mmfutils.performance.backends`).
+
+    The momenta are lazy attributes (see
+    :class:`mmfutils.containers.lazy_attribute`), so `twist` and `boost_px`
+    can be changed without calling :meth:`init`.
     """
+    _independent_attributes = ('twist', 'boost_px')
     _d = 2                    # Dimension of spherical part (see nu())
 
+    # Cache of the propagators used by apply_exp_K().  Set to None to disable
+    # caching.
+    propagator_cache = PROPAGATOR_CACHE
+
     def __init__(self, Nxr, Lxr, twist=0, boost_px=0,
-                 axes=(-2, -1), symmetric_x=True):
+                 axes=(-2, -1), symmetric_x=True,
+                 fft_plans=False, state_shape=None, state_dtype=None,
+                 dtype=np.float64, backend=None):
         self.twist = twist
         self.boost_px = np.asarray(boost_px)
         self.Nxr = np.asarray(Nxr)
         self.Lxr = np.asarray(Lxr)
         self.symmetric_x = symmetric_x
         self.axes = np.asarray(axes)
+        self.fft_plans = fft_plans
+        self.state_shape = state_shape
+        self.state_dtype = state_dtype
+        self.dtype = np.dtype(dtype)
+        self.backend = backend
         super().__init__()
 
     def init(self):
+        backend = self._backend = get_backend(self.backend)
         Lx, R = self.Lxr
         x = get_xyz(Nxyz=self.Nxr, Lxyz=self.Lxr,
-                    symmetric_lattice=self.symmetric_x)[0]
-        kx0 = get_kxyz(Nxyz=self.Nxr, Lxyz=self.Lxr)[0]
-        self.kx = (kx0 + float(self.twist) / Lx - self.boost_px)
+                    symmetric_lattice=self.symmetric_x, backend=backend)[0]
+        kx0 = get_kxyz(Nxyz=self.Nxr, Lxyz=self.Lxr, backend=backend)[0]
         self._kx0 = kx0
-        self._kx2 = self.kx**2
-
-        self.y_twist = np.exp(1j*self.twist*x/Lx)
 
         Nx, Nr = self.Nxr
 
@@ -613,10 +1299,6 @@ class CylindricalBasis(ObjectBase, BasisMixin):
         # This self._kmax defines the DVR basis, not self.k_max
         self._kmax = (Nr - 0.25)*np.pi/R
 
-        # This is just the maximum momentum for diagnostics,
-        # determining cutoffs etc.
-        self.k_max = np.array([abs(self.kx).max(), self._kmax])
-
         nr = np.arange(Nr)[None, :]
         r = self._r(Nr)[None, :]  # Do this after setting _kmax
         self.xyz = [x, r]
@@ -642,11 +1324,85 @@ class CylindricalBasis(ObjectBase, BasisMixin):
         self._Kr = K
         self._Kr_diag = (r1, r2, V, d)   # For use when exponentiating
 
-        # And factor for x.
-        self._Kx = self._kx2
+        if self.dtype != np.float64:
+            dtype = self.dtype
+            x, r = self.xyz = [_astype(x, dtype), _astype(r, dtype)]
+            self._kx0 = _astype(self._kx0, dtype)
+            self.metric = _astype(self.metric, dtype)
+            self.metric.setflags(write=False)
+            self.weights = _astype(self.weights, dtype)
+            self._Kr = _astype(self._Kr, dtype)
 
-        # Cache for K_data from apply_exp_K.
-        self._K_data = []
+        self._plans = threading.local()
+        self._fft_plans         # Plan now rather than on the first call.
+        super().init()
+
+    @property
+    def _fft_plans(self):
+        """The planned transforms (or `None`) for `fft_plans`.
+
+        Each thread gets its own plans (see :class:`PeriodicBasis`).
+        """
+        plans = self._plans
+        if not hasattr(plans, 'fft'):
+            plans.fft = self._get_fft_plans()
+        return plans.fft
+
+    def _get_fft_plans(self):
+        """Return new planned transforms (or `None`) for `fft_plans`."""
+        backend = self._backend
+        if not self.fft_plans or backend.get_fft_plans is None:
+            return None
+        shape = self.state_shape
+        if shape is None:
+            shape = tuple(self.Nxr)
+        return backend.get_fft_plans(
+            tuple(shape), dtype=self.get_state_dtype(),
+            axis=(self.axes % len(shape))[0])
+
+    def __getstate__(self):
+        # The FFTW plans cannot be pickled: they are rebuilt on unpickling.
+        state = dict(self.__dict__)
+        state.pop('_plans', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._plans = threading.local()
+        self._fft_plans
+
+    ######################################################################
+    # Lazy attributes depending on the twist and boost.
+    @lazy_attribute('_kx0', 'twist', 'boost_px')
+    def kx(self):
+        return _astype(
+            self._kx0 + float(self.twist) / self.Lx - self.boost_px,
+            self.dtype)
+
+    @lazy_attribute('kx')
+    def _kx2(self):
+        return self.kx**2
+
+    @lazy_attribute('_kx2')
+    def _Kx(self):
+        """Factor for x."""
+        return self._kx2
+
+    @lazy_attribute('kx', '_kmax')
+    def k_max(self):
+        """Maximum momentum for diagnostics, determining cutoffs etc."""
+        return np.array([abs(self.kx).max(), self._kmax])
+
+    @lazy_attribute('xyz', 'twist')
+    def y_twist(self):
+        x = self.xyz[0]
+        return _astype(self._backend.exp(1j*self.twist*x/self.Lx), self.dtype)
+
+    def get_state_dtype(self):
+        """Return the type of the states (see `state_dtype`)."""
+        if self.state_dtype is None:
+            return np.result_type(self.dtype, np.complex64)
+        return np.dtype(self.state_dtype)
 
     @property
     def Lx(self):
@@ -711,35 +1467,33 @@ class CylindricalBasis(ObjectBase, BasisMixin):
         return self.y_twist * self.ifft(self._kx0 * self.fft(y/self.y_twist))
 
     def apply_exp_K(self, y, factor, kx2=None, twist_phase_x=None):
-        r"""Return `exp(K*factor)*y` or return precomputed data if
-        `K_data` is `None`.
+        r"""Return `exp(K*factor)*y`.
+
+        The propagators are cached in `propagator_cache`.
         """
         if kx2 is None:
             kx2 = self._Kx
-        _K_data_max_len = 3
-        ind = None
-        for _i, (_f, _d) in enumerate(self._K_data):
-            if np.allclose(factor, _f):
-                ind = _i
-        if ind is None:
+
+        exp = self._backend.exp
+
+        def get_K_data():
             _r1, _r2, V, d = self._Kr_diag
-            exp_K_r = _r1 * np.dot(V*np.exp(factor * d), V.T) * _r2
-            exp_K_x = np.exp(factor * kx2)
-            K_data = (exp_K_r, exp_K_x)
-            self._K_data.append((factor, K_data))
-            ind = -1
-            while len(self._K_data) > _K_data_max_len:
-                # Reduce storage
-                self._K_data.pop(0)
-
-        K_data = self._K_data[ind][1]
-        exp_K_r, exp_K_x = K_data
+            exp_K_r = _astype(_r1 * np.dot(V*exp(factor * d), V.T) * _r2,
+                              self.dtype)
+            exp_K_x = _astype(exp(factor * np.asarray(kx2)), self.dtype)
+            return (exp_K_r, exp_K_x)
+
+        if self.propagator_cache is None:
+            exp_K_r, exp_K_x = get_K_data()
+        else:
+            exp_K_r, exp_K_x = self.propagator_cache.get(
+                factor, kx2, self._Kr_diag, compute=get_K_data)
         if twist_phase_x is None or self.twist == 0:
-            tmp = self.ifft(exp_K_x * self.fft(y))
+            tmp = self._apply_kx(y, exp_K_x)
         else:
             if twist_phase_x is None:
                 twist_phase_x = self.y_twist
-            tmp = twist_phase_x*self.ifft(exp_K_x * self.fft(y/twist_phase_x))
+            tmp = twist_phase_x*self._apply_kx(y/twist_phase_x, exp_K_x)
         return np.einsum('...ij,...yj->...yi', exp_K_r, tmp)
 
     def apply_K(self, y, kx2=None, twist_phase_x=None):
@@ -749,15 +1503,11 @@ class CylindricalBasis(ObjectBase, BasisMixin):
             kx2 = self._Kx
 
         if twist_phase_x is None or self.twist == 0:
-            yt = self.fft(y)
-            yt *= kx2
-            yt = self.ifft(yt)
+            yt = self._apply_kx(y, kx2)
         else:
             if twist_phase_x is None:
                 twist_phase_x = self.y_twist
-            yt = self.fft(y/twist_phase_x)
-            yt *= kx2
-            yt = self.ifft(yt)
+            yt = self._apply_kx(y/twist_phase_x, kx2)
             yt *= twist_phase_x
 
         # C <- alpha*B*A + beta*C    A = A^T  zSYMM or zHYMM but not supported
@@ -777,12 +1527,38 @@ class CylindricalBasis(ObjectBase, BasisMixin):
         """Perform the fft along the x axes"""
         # Makes sure that
         axis = (self.axes % len(x.shape))[0]
-        return fft(x, axis=axis)
+        return self._backend.fft(x, axis=axis)
 
     def ifft(self, x):
         """Perform the fft along the x axes"""
         axis = (self.axes % len(x.shape))[0]
-        return ifft(x, axis=axis)
+        return self._backend.ifft(x, axis=axis)
+
+    def _apply_kx(self, y, Kx, out=None):
+        """Return `ifft(Kx*fft(y))` using the planned FFTs if possible.
+
+        If `out` is provided, then the result is stored there.  See
+        :meth:`PeriodicBasis._apply_k` for details.
+        """
+        plans = self._fft_plans
+        if plans is not None:
+            fft_plan, ifft_plan = plans
+            y = np.asarray(y)
+            shape = fft_plan.input_shape
+            if (y.shape == shape
+                    and np.can_cast(y.dtype, fft_plan.input_array.dtype)
+                    and np.broadcast_shapes(np.shape(Kx), shape) == shape):
+                fft_plan.input_array[...] = y
+                yt = fft_plan()
+                yt *= Kx
+                if out is None:
+                    out = np.empty(shape, dtype=yt.dtype)
+                out[...] = ifft_plan()
+                return out
+        if out is None:
+            return self.ifft(Kx * self.fft(y))
+        out[...] = self.ifft(Kx * self.fft(y))
+        return out
 
     def _get_K(self, l=0):
         r"""Return `(K, r1, r2, w)`: the DVR kinetic term for the radial function
@@ -0,0 +1,190 @@
+"""Cache of propagators for split-operator evolution.
+
+Split-operator evolvers call ``basis.laplacian(y, factor, exp=True)`` with the
+same `factor` at every step.  Computing ``exp(-factor*k**2)`` requires a
+transcendental function evaluation over the whole grid, so the bases store the
+results in a bounded least-recently-used (LRU) cache shared by all bases.
+
+Entries are keyed on the value (and type) of `factor` and the *identity* of
+the arrays (such as `k2`) from which the propagator is computed.  The cache
+holds weak references to these arrays, so it does not keep the grids of
+deleted bases alive: their entries are dropped.  (Objects that do not support
+weak references are held, and their size counts toward the memory budget.)
+If you modify one of these arrays in place, you must call
+:meth:`PropagatorCache.clear`.
+
+Examples
+--------
+>>> cache = PropagatorCache(maxsize=2)
+>>> k2 = np.arange(4.0)
+>>> U = cache.get(0.5, k2, compute=lambda: np.exp(-0.5*k2))
+>>> cache.get(0.5, k2, compute=lambda: np.exp(-0.5*k2)) is U
+True
+>>> cache.stats()['hits'], cache.stats()['misses']
+(1, 1)
+"""
+import collections
+import threading
+import weakref
+
+import numpy as np
+
+__all__ = ['PropagatorCache', 'PROPAGATOR_CACHE']
+
+
+def _nbytes(value):
+    """Return the number of bytes used by the array(s) in `value`."""
+    if isinstance(value, (tuple, list)):
+        return sum(map(_nbytes, value))
+    return getattr(value, 'nbytes', 0)
+
+
+def _freeze(value):
+    """Make the numpy array(s) in `value` read-only since they are shared."""
+    if isinstance(value, (tuple, list)):
+        for _v in value:
+            _freeze(_v)
+    elif isinstance(value, np.ndarray):
+        value.setflags(write=False)
+
+
+def _factor_key(factor):
+    """Return a hashable key for `factor` (a number or small array)."""
+    if isinstance(factor, (str, tuple)):
+        return factor
+    if np.ndim(factor) == 0:
+        # Include the type so that real and complex factors with the same
+        # value (which give propagators of different types) are distinct.
+        return (np.asarray(factor).dtype.str, complex(factor))
+    factor = np.asarray(factor)
+    return (factor.shape, factor.dtype.str, factor.tobytes())
+
+
+class _StrongRef(object):
+    """Reference to an object that does not support weak references."""
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __call__(self):
+        return self.obj
+
+
+def _get_ref(obj, callback):
+    """Return a (weak if possible) reference to `obj`."""
+    try:
+        return weakref.ref(obj, callback)
+    except TypeError:
+        return _StrongRef(obj)
+
+
+class PropagatorCache(object):
+    """Bounded LRU cache of propagators.
+
+    Arguments
+    ---------
+    maxsize : int
+       Maximum number of entries.
+    max_bytes : int
+       Memory budget in bytes.  The least recently used entries are evicted
+       until the total size of the cached arrays is within this budget.
+       Propagators larger than this are computed but not cached.
+    """
+    def __init__(self, maxsize=16, max_bytes=256*2**20):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __reduce__(self):
+        """Pickle the settings only: the entries are keyed on object ids,
+        which are not meaningful in another process, and the lock cannot
+        be pickled.  The cache is restored empty."""
+        return (self.__class__, (self.maxsize, self.max_bytes))
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self._data = collections.OrderedDict()
+            self._dead = collections.deque()  # Keys whose arrays were deleted
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def _pop(self, key):
+        """Remove the entry `key` if it exists (call with the lock held)."""
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def _purge(self):
+        """Remove the entries whose arrays were deleted (call with the lock
+        held)."""
+        while self._dead:
+            key = self._dead.popleft()
+            entry = self._data.get(key, None)
+            if entry is not None and any(_r() is None for _r in entry[2]):
+                self._pop(key)
+
+    def stats(self):
+        """Return a dictionary of the cache statistics."""
+        with self._lock:
+            self._purge()
+            return dict(hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, size=len(self._data),
+                        nbytes=self.nbytes, max_bytes=self.max_bytes)
+
+    def get(self, factor, *arrays, compute):
+        """Return the propagator for `factor` and `arrays`.
+
+        Arguments
+        ---------
+        factor : float, complex, array, str, tuple
+           Value of the factor (compared by value).  Strings and tuples can
+           also be used as hashable keys for other kinds of kernels.
+        *arrays : objects
+           Objects from which the propagator is computed (compared by
+           identity).
+        compute : callable
+           Function `compute()` that returns the propagator if it is not in
+           the cache.  It may return an array or tuple of arrays.  These are
+           made read-only since they are shared.
+        """
+        key = (_factor_key(factor),) + tuple(map(id, arrays))
+        with self._lock:
+            self._purge()
+            entry = self._data.get(key, None)
+            if entry is not None:
+                if all(_r() is _a for _r, _a in zip(entry[2], arrays)):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                # An id was reused after the array was deleted.
+                self._pop(key)
+            self.misses += 1
+
+        value = compute()
+
+        # The callbacks may be called by the garbage collector at any time
+        # (even with the lock held), so they only record the key.
+        dead = self._dead
+        refs = tuple(_get_ref(_a, lambda _r: dead.append(key))
+                     for _a in arrays)
+        nbytes = _nbytes(value) + sum(_nbytes(_r.obj) for _r in refs
+                                      if isinstance(_r, _StrongRef))
+        if nbytes > self.max_bytes or self.maxsize <= 0:
+            return value
+
+        _freeze(value)
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = (value, nbytes, refs)
+                self.nbytes += nbytes
+            while (len(self._data) > self.maxsize
+                   or self.nbytes > self.max_bytes):
+                _key, _entry = self._data.popitem(last=False)
+                self.nbytes -= _entry[1]
+                self.evictions += 1
+        return value
+
+
+# Default cache shared by all bases.
+PROPAGATOR_CACHE = PropagatorCache()
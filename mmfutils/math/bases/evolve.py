@@ -0,0 +1,154 @@
+r"""Split-operator evolution.
+
+This module provides :class:`SplitOperatorEvolver` which evolves the
+Schrodinger equation
+
+.. math::
+   i\hbar \dot{\psi} = \left(-\frac{\hbar^2\nabla^2}{2m}
+                            + V(\psi, t)\right)\psi
+
+using Strang splitting with any basis implementing :class:`IBasisMinimal`.
+Each step is
+
+.. math::
+   e^{-i V\delta_t/2\hbar}e^{-i K\delta_t/\hbar}e^{-i V\delta_t/2\hbar}
+
+but the adjacent half potential steps of consecutive steps are fused so that
+`N` steps require `N` kinetic steps and only `N+1` potential evaluations.  The
+kinetic step uses ``basis.laplacian(y, exp=True)`` (in place if the basis
+supports the `out` argument) and the potential step uses preallocated
+buffers, so no state-sized temporaries are allocated in the loop.
+
+Examples
+--------
+>>> from mmfutils.math.bases import PeriodicBasis
+>>> basis = PeriodicBasis(Nxyz=(64,), Lxyz=(16.0,))
+>>> x = basis.xyz[0]
+>>> def get_V(y, t):
+...     return x**2/2
+>>> evolver = SplitOperatorEvolver(basis=basis, dt=0.01, get_V=get_V)
+>>> psi0 = np.exp(-x**2/2)       # Ground state
+>>> psi = evolver.evolve(psi0 + 0j, steps=100)
+>>> np.allclose(psi, np.exp(-0.5j)*psi0, atol=1e-5)  # E = 1/2, t = 1
+True
+"""
+import inspect
+import time
+
+import numpy as np
+
+from mmfutils.containers import ObjectBase
+
+__all__ = ['SplitOperatorEvolver']
+
+
+class SplitOperatorEvolver(ObjectBase):
+    """Fused Strang split-operator evolver.
+
+    Arguments
+    ---------
+    basis : IBasisMinimal
+       Basis providing `laplacian(y, factor, exp=True)`.
+    dt : float, complex
+       Time step.  Use ``dt = -1j*dtau`` for imaginary time evolution.
+    get_V : callable
+       Potential `get_V(y, t)`.  This is called with the current state (which
+       must not be modified) and time, and must return an array (or number)
+       that broadcasts with `y`.  For nonlinear problems, `V` may depend on
+       `y`.
+    hbar, m : float
+       Planck's constant and the mass.
+
+    Attributes
+    ----------
+    steps : int
+       Total number of steps taken.
+    wall_time : float
+       Total time (s) spent in :meth:`evolve`.
+    """
+    def __init__(self, basis, dt, get_V, hbar=1.0, m=1.0):
+        self.basis = basis
+        self.dt = dt
+        self.get_V = get_V
+        self.hbar = hbar
+        self.m = m
+        super().__init__()
+
+    def init(self):
+        self._laplacian_out = (
+            'out' in inspect.signature(self.basis.laplacian).parameters)
+        self._buffers = {}
+        self.steps = 0
+        self.wall_time = 0.0
+        super().init()
+
+    @property
+    def steps_per_second(self):
+        """Average number of steps per second taken by :meth:`evolve`."""
+        if self.wall_time == 0:
+            return np.nan
+        return self.steps / self.wall_time
+
+    def _get_buffer(self, shape, dtype):
+        """Return a preallocated buffer."""
+        key = (shape, np.dtype(dtype))
+        if key not in self._buffers:
+            self._buffers[key] = np.empty(shape, dtype=dtype)
+        return self._buffers[key]
+
+    def _apply_V(self, y, t, dt):
+        """Apply `exp(-i*V*dt/hbar)` to `y` in place."""
+        V = self.get_V(y, t)
+        factor = -1j * dt / self.hbar
+        if np.ndim(V) == 0:
+            y *= np.exp(factor * V)
+            return
+        V = np.asarray(V)
+        expV = self._get_buffer(V.shape, y.dtype)
+        np.multiply(V, factor, out=expV)
+        np.exp(expV, out=expV)
+        y *= expV
+
+    def _apply_K(self, y, dt):
+        """Apply `exp(-i*K*dt/hbar)` to `y` in place."""
+        factor = 1j * self.hbar * dt / 2.0 / self.m
+        if self._laplacian_out:
+            self.basis.laplacian(y, factor=factor, exp=True, out=y)
+        else:
+            y[...] = self.basis.laplacian(y, factor=factor, exp=True)
+
+    def evolve(self, y, steps, t=0.0):
+        """Return the state `y` evolved for `steps` steps starting at time
+        `t`.
+
+        Arguments
+        ---------
+        y : array
+           Initial state.  If this is a writeable complex C-contiguous array,
+           then it will be evolved in place, otherwise a copy is made.
+        steps : int
+           Number of steps.
+        t : float
+           Initial time.  The potential is evaluated at times `t + n*dt.real`.
+        """
+        y = np.asarray(y)
+        if not (np.iscomplexobj(y) and y.flags.writeable
+                and y.flags.c_contiguous):
+            y = np.array(y, dtype=np.result_type(y.dtype, np.complex64),
+                         order='C')
+        if steps <= 0:
+            return y
+
+        dt = self.dt
+        dt_t = np.real(dt)
+        tic = time.perf_counter()
+        self._apply_V(y, t, dt/2.0)
+        for n in range(steps):
+            self._apply_K(y, dt)
+            t += dt_t
+            # Fuse the final half step of this step with the first half step
+            # of the next.
+            self._apply_V(y, t, dt if n < steps - 1 else dt/2.0)
+        self.wall_time += time.perf_counter() - tic
+        self.steps += steps
+        return y
@@ -47,6 +47,20 @@ class IBasis(IBasisMinimal):
         I.e. laplacian(y) = grad_dot_grad(y, y)
         """
 
+    def laplacian_batch(ys, factors, exp=False):
+        """Return the laplacian of a stack of states `ys[n]`, each with its
+        own `factors[n]`, in a single pass.
+
+        Parameters
+        ----------
+        ys : array
+           Stack of states.  The first axis indexes the states.
+        factors : array
+           Factors for each state (or a single factor for all states).
+        exp : bool
+           If `True`, then compute the exponential of the laplacians.
+        """
+
     is_metric_scalar = Attribute(
         """True if the metric is a scalar (number) that commutes with
         everything.  (Allows some algorithms to improve performance.
@@ -154,6 +168,37 @@ class BasisMixin(object):
         laplacian = self.laplacian
         return (laplacian(a*b) - laplacian(a)*b - a*laplacian(b))/2.0
 
+    def laplacian_batch(self, ys, factors, exp=False, out=None, **kw):
+        """Return the laplacian of a stack of states `ys[n]`, each with its
+        own `factors[n]`, in a single pass.
+
+        The factors are reshaped to broadcast along the leading axis of `ys`
+        and passed to :meth:`laplacian`, so the transforms are performed on the
+        whole stack at once.  This requires that the basis acts on the
+        trailing axes of `ys` (the default).
+
+        Arguments
+        ---------
+        ys : array
+           Stack of states.  The first axis indexes the states (components,
+           species, etc.)
+        factors : array
+           Factors for each state (or a single factor for all states).
+        exp : bool
+           If `True`, then compute the exponential of the laplacians.
+        out : array, optional
+           If provided (and supported by :meth:`laplacian`), the result is
+           stored here.
+        """
+        ys = np.asarray(ys)
+        factors = np.asarray(factors)
+        if factors.ndim > 0:
+            factors = factors.reshape(
+                factors.shape + (1,) * (ys.ndim - factors.ndim))
+        if out is not None:
+            kw['out'] = out
+        return self.laplacian(ys, factor=factors, exp=exp, **kw)
+
     @property
     def is_metric_scalar(self):
         """Return `True` if the metric is a scalar (number) that commutes with
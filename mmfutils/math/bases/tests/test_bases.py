@@ -10,6 +10,10 @@ the following form:
    e^{a\nabla^2} y(r) &= \frac{r_0^d}{\sqrt{r_0^2+2a}^d}
    e^{-r^2/(r_0^2+2a)/2}
 """
+import collections
+import pickle
+import threading
+
 import numpy as np
 import scipy.special
 import scipy as sp
@@ -18,6 +22,9 @@ import pytest
 
 from mmfutils.interface import verifyObject, verifyClass
 from mmfutils.math.bases import bases
+from mmfutils.performance import fft
+from mmfutils.performance.backends import (
+    Backend, available_backends, get_backend)
 from mmfutils.math.bases.interfaces import (
     IBasis, IBasisWithConvolution, IBasisKx, IBasisLz)
 
@@ -315,6 +322,20 @@ class TestPeriodicBasis(ConvolutionTests):
         assert np.allclose(V[0], V_no_ff)
         assert np.allclose(V[1], V_no_ff)
 
+    def test_laplacian_out(self):
+        """Test the laplacian with a specified output array."""
+        laplacian = self.basis.laplacian
+        exact = self.exact
+        y = exact.y + 0j
+        for exp in [False, True]:
+            res = laplacian(y, factor=exact.factor, exp=exp)
+            out = np.empty_like(y)
+            assert laplacian(y, factor=exact.factor, exp=exp, out=out) is out
+            assert np.allclose(out, res)
+            y_ = y.copy()
+            assert laplacian(y_, factor=exact.factor, exp=exp, out=y_) is y_
+            assert np.allclose(y_, res)
+
     def test_laplacian_quart(self):
         """Test the laplacian with a Gaussian and modified dispersion."""
         # Real and Complex
@@ -365,6 +386,55 @@ class TestPeriodicBasis(ConvolutionTests):
                            b.laplacian(f, factor=factor, kwz2=kwz2))        
 
 
+class TestPeriodicBasisFFTPlans(TestPeriodicBasis):
+    """Repeat the tests using the pre-planned FFTs."""
+    @classmethod
+    def setup_class(cls):
+        super().setup_class()
+        cls.basis = bases.PeriodicBasis(Nxyz=cls.basis.Nxyz,
+                                        Lxyz=cls.basis.Lxyz,
+                                        fft_plans=True)
+
+    def test_plans(self):
+        if self.basis._fftn_plans is None:
+            pytest.skip("requires pyfftw")
+        y = self.y + 0j
+        fftn_plan, ifftn_plan = self.basis._fftn_plans
+        res1 = self.basis.laplacian(y)
+        res2 = self.basis.laplacian(2*y)
+        assert res1 is not ifftn_plan.output_array
+        assert np.allclose(2*res1, res2)
+        assert np.allclose(res1, self.exact.d2y/self.exact.factor)
+
+    def test_plans_out(self):
+        y = self.y + 0j
+        out = np.empty_like(y)
+        assert self.basis.laplacian(y, out=out) is out
+        assert np.allclose(out, self.exact.d2y/self.exact.factor)
+
+    def test_plans_threads(self):
+        """Each thread uses its own plans."""
+        basis = self.basis
+        ys = [(1 + _n)*self.y + 0j for _n in range(4)]
+        exact = [basis.laplacian(_y) for _y in ys]
+        barrier = threading.Barrier(len(ys))
+        plans, res = {}, {}
+
+        def f(n):
+            barrier.wait()
+            plans[n] = basis._fftn_plans
+            res[n] = [basis.laplacian(ys[n]) for _m in range(10)]
+
+        threads = [threading.Thread(target=f, args=(_n,))
+                   for _n in range(len(ys))]
+        [_t.start() for _t in threads]
+        [_t.join() for _t in threads]
+        for _n in range(len(ys)):
+            assert all(np.allclose(_r, exact[_n]) for _r in res[_n])
+        if basis._fftn_plans is not None:
+            assert len(set(map(id, plans.values()))) == len(ys)
+
+
 class TestCartesianBasis(ConvolutionTests):
     @classmethod
     def setup_class(cls):
@@ -384,7 +454,7 @@ class TestCartesianBasis(ConvolutionTests):
         V_exact = np.ma.divide(
             self.Q * sp.special.erf(self.r/2),
             self.r).filled(self.Q/np.sqrt(np.pi))
-        for method in ['sum', 'pad']:
+        for method in ['sum', 'pad', 'pruned']:
             V = self.basis.convolve_coulomb(y, method=method)
             assert np.allclose(V[0], V_exact)
             assert np.allclose(V[1], V_exact)
@@ -569,6 +639,505 @@ class TestCylindricalBasis(LaplacianTests):
         assert np.allclose(n_2D, n_2D_exact, rtol=0.01, atol=0.01)
 
 
+class TestCylindricalBasisFFTPlans(TestCylindricalBasis):
+    """Repeat the tests using the pre-planned FFTs."""
+    @classmethod
+    def setup_class(cls):
+        super().setup_class()
+        cls.basis = bases.CylindricalBasis(Nxr=cls.basis.Nxr,
+                                           Lxr=cls.basis.Lxr,
+                                           fft_plans=True)
+
+    def test_pickle(self):
+        """The plans are not pickled but are rebuilt."""
+        basis = pickle.loads(pickle.dumps(self.basis))
+        assert (basis._fft_plans is None) == (self.basis._fft_plans is None)
+        y = self.exact.y
+        assert np.allclose(basis.laplacian(y), self.basis.laplacian(y))
+
+
+class TestRealFFT(object):
+    """Check that the real transforms agree with the complex transforms."""
+    @pytest.mark.parametrize('dim', [1, 2, 3])
+    def test_convolve_coulomb_exact(self, dim):
+        basis = bases.CartesianBasis(Nxyz=(16,)*dim, Lxyz=(20.0,)*dim)
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        V = {}
+        for method in ['sum', 'pad', 'pruned']:
+            V[method] = basis.convolve_coulomb_exact(y, method=method)
+            assert not np.iscomplexobj(V[method])
+            assert np.allclose(
+                V[method], basis.convolve_coulomb_exact(y + 0j, method=method))
+        assert np.allclose(V['sum'], V['pad'])
+        assert np.allclose(V['pruned'], V['pad'])
+
+    @pytest.mark.parametrize('N', [15, 16])
+    def test_periodic(self, N):
+        basis = bases.PeriodicBasis(Nxyz=(N, N + 1), Lxyz=(10.0, 11.0))
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        V = basis.convolve_coulomb([y, 2*y])
+        assert not np.iscomplexobj(V)
+        assert np.allclose(V, basis.convolve_coulomb([y + 0j, 2*y]))
+        V = basis.convolve(y, C=y)
+        assert not np.iscomplexobj(V)
+        assert np.allclose(V, basis.convolve(y + 0j, C=y))
+
+
+class TestSinglePrecision(object):
+    """Check that `dtype=np.float32` bases work in single precision."""
+    @pytest.mark.parametrize('fft_plans', [False, True])
+    def test_periodic(self, fft_plans):
+        kw = dict(Nxyz=(16, 17), Lxyz=(10.0, 11.0))
+        basis = bases.PeriodicBasis(dtype=np.float32, fft_plans=fft_plans,
+                                    **kw)
+        basis64 = bases.PeriodicBasis(**kw)
+        assert all(_x.dtype == np.float32 for _x in basis.xyz)
+        assert basis.metric.dtype == np.float32
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        psi = (y + 0j).astype(np.complex64)
+        for res, res64 in [
+                (basis.laplacian(psi), basis64.laplacian(psi)),
+                (basis.laplacian(psi, factor=0.1j, exp=True),
+                 basis64.laplacian(psi, factor=0.1j, exp=True)),
+                (basis.smooth(psi), basis64.smooth(psi))]:
+            assert res.dtype == np.complex64
+            assert np.allclose(res, res64, atol=1e-5)
+
+    @pytest.mark.parametrize('method', ['sum', 'pad', 'pruned'])
+    def test_coulomb_exact(self, method):
+        kw = dict(Nxyz=(16,)*2, Lxyz=(20.0,)*2)
+        basis = bases.CartesianBasis(dtype=np.float32, **kw)
+        basis64 = bases.CartesianBasis(**kw)
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        V = basis.convolve_coulomb_exact(y, method=method)
+        assert V.dtype == np.float32
+        assert np.allclose(
+            V, basis64.convolve_coulomb_exact(y, method=method), atol=1e-5)
+
+    @pytest.mark.parametrize('fft_plans', [False, True])
+    def test_cylindrical(self, fft_plans):
+        kw = dict(Nxr=(16, 8), Lxr=(10.0, 5.0))
+        basis = bases.CylindricalBasis(dtype=np.float32, fft_plans=fft_plans,
+                                       **kw)
+        basis64 = bases.CylindricalBasis(**kw)
+        x, r = basis.xyz
+        assert x.dtype == r.dtype == basis.metric.dtype == np.float32
+        psi = np.exp(-x**2 - r**2).astype(np.complex64)
+        for res, res64 in [
+                (basis.laplacian(psi), basis64.laplacian(psi)),
+                (basis.laplacian(psi, factor=0.1j, exp=True),
+                 basis64.laplacian(psi, factor=0.1j, exp=True))]:
+            assert res.dtype == np.complex64
+            assert np.allclose(res, res64, atol=1e-5)
+
+
+class TestLaplacianBatch(object):
+    """Check the batched laplacian against a loop over the components."""
+    @pytest.mark.parametrize('basis', [
+        bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0)),
+        bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0),
+                            fft_plans=True, state_shape=(3, 16, 17)),
+        bases.CylindricalBasis(Nxr=(16, 8), Lxr=(10.0, 5.0)),
+        bases.SphericalBasis(N=16, R=5.0)])
+    @pytest.mark.parametrize('exp', [False, True])
+    def test_laplacian_batch(self, basis, exp):
+        np.random.seed(2)
+        shape = (3,) + tuple(basis.shape)
+        ys = np.random.random(shape) + 1j*np.random.random(shape) - 0.5 - 0.5j
+        factors = np.array([0.1j, 0.2, 0.3 - 0.1j])
+        res = basis.laplacian_batch(ys, factors, exp=exp)
+        for y, factor, _res in zip(ys, factors, res):
+            assert np.allclose(_res, basis.laplacian(y, factor=factor, exp=exp))
+        assert np.allclose(res[1], basis.laplacian_batch(ys, 0.2, exp=exp)[1])
+
+    def test_laplacian_batch_out(self):
+        basis = bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0))
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        ys = np.array([y, 2j*y])
+        factors = [0.1j, 0.2j]
+        res = basis.laplacian_batch(ys, factors, exp=True)
+        assert basis.laplacian_batch(ys, factors, exp=True, out=ys) is ys
+        assert np.allclose(ys, res)
+
+
+class TestCoulombSumThreads(object):
+    @pytest.mark.parametrize('dim', [2, 3])
+    @pytest.mark.parametrize('dtype', [float, complex])
+    def test_threads(self, dim, dtype):
+        basis = bases.CartesianBasis(Nxyz=(16,)*dim, Lxyz=(20.0,)*dim)
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2).astype(dtype)
+        V = basis.convolve_coulomb_exact(y, method='pad')
+        for threads, max_in_flight in [(1, None), (4, None), (4, 2), (3, 1)]:
+            V1 = basis.convolve_coulomb_exact(
+                y, method='sum', threads=threads, max_in_flight=max_in_flight)
+            assert V1.dtype == V.dtype
+            assert np.allclose(V, V1)
+
+    def test_pool(self, monkeypatch):
+        """The thread pool is shared and sized independently of the FFT
+        threads."""
+        monkeypatch.setattr(bases, '_WORKERS', 3)
+        monkeypatch.setattr(bases, '_POOL', None)
+        monkeypatch.setattr(fft, '_THREADS', 8)
+        pool = bases._get_pool()
+        assert bases._get_pool() is pool
+        assert pool._max_workers == 3
+        bases.set_num_workers(2)
+        assert pool._shutdown
+        assert bases._get_pool()._max_workers == 2
+        bases._get_pool().shutdown()
+
+    def test_workers(self, monkeypatch):
+        """Several workers run concurrently with single-threaded FFTs."""
+        monkeypatch.setattr(bases, '_WORKERS', 2)
+        monkeypatch.setattr(bases, '_POOL', None)
+        basis = bases.CartesianBasis(Nxyz=(8, 9), Lxyz=(10.0, 11.0))
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        V = basis.convolve_coulomb_exact(y, threads=1)
+
+        # The first two shifts wait for each other, so this fails unless two
+        # workers run at the same time.
+        barrier = threading.Barrier(2, timeout=10)
+        threads = set()
+        get_exp_delta = basis.get_exp_delta
+
+        def wait(l):
+            threads.add((threading.get_ident(), fft.get_num_threads()))
+            if l in [(0, 0), (0, 1)]:
+                barrier.wait()
+            return get_exp_delta(l)
+
+        basis.get_exp_delta = wait
+        assert np.allclose(V, basis.convolve_coulomb_exact(y))
+        assert len(threads) == 2
+        assert {_n for _t, _n in threads} == {1}
+        bases._get_pool().shutdown()
+
+    def test_exp_delta(self):
+        basis = bases.CartesianBasis(Nxyz=(8, 9), Lxyz=(10.0, 11.0))
+        x, y = basis.xyz
+        l = (1, 2)
+        exp_delta = np.exp(2j*np.pi*(l[0]*x/3/10.0 + l[1]*y/3/11.0))
+        assert np.allclose(basis.get_exp_delta(l), exp_delta)
+
+
+class TestKernelCache(object):
+    @pytest.mark.parametrize('method', ['sum', 'pad'])
+    def test_coulomb_exact(self, method):
+        basis = bases.CartesianBasis(Nxyz=(16,)*2, Lxyz=(20.0,)*2)
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+
+        def F(k):
+            return np.exp(-k**2)
+
+        V = basis.convolve_coulomb_exact(y, form_factors=[F], method=method)
+        misses = basis._kernel_cache.stats()['misses']
+        assert np.allclose(
+            V, basis.convolve_coulomb_exact(y, form_factors=[F],
+                                            method=method))
+        stats = basis._kernel_cache.stats()
+        assert stats['misses'] == misses
+        assert stats['hits'] >= misses
+
+        # Different form factors give different kernels
+        V1 = basis.convolve_coulomb_exact(
+            y, form_factors=[lambda k: 2*F(k)], method=method)
+        assert np.allclose(2*V, V1)
+
+        # Changing the basis invalidates the cache
+        basis.Lxyz = (25.0,)*2
+        basis.init()
+        assert basis._kernel_cache.stats()['size'] == 0
+        V1 = basis.convolve_coulomb_exact(y, form_factors=[F], method=method)
+        assert not np.allclose(V, V1)
+
+    @pytest.mark.parametrize('dim', [2, 3])
+    def test_coulomb_pruned(self, dim):
+        """The 'pruned' kernels are computed per slab and not cached."""
+        basis = bases.CartesianBasis(Nxyz=(8,)*dim, Lxyz=(20.0,)*dim)
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        V = {}
+        for _y in [y, y + 0j]:
+            V[_y.dtype] = basis.convolve_coulomb_exact(_y, method='pruned')
+            assert basis._kernel_cache.stats()['size'] == 0
+            basis.slab_bytes = 1
+            assert np.allclose(
+                V[_y.dtype], basis.convolve_coulomb_exact(_y, method='pruned'))
+            del basis.slab_bytes
+        for _y in [y, y + 0j]:
+            assert np.allclose(
+                V[_y.dtype], basis.convolve_coulomb_exact(_y, method='pad'))
+
+    def test_coulomb_pruned_axes(self):
+        """The 'pruned' method convolves along `axes`."""
+        kw = dict(Nxyz=(8, 10), Lxyz=(20.0, 21.0))
+        basis = bases.CartesianBasis(**kw)
+        basis_axes = bases.CartesianBasis(axes=(0, 2), **kw)
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        ys = np.stack([y, 2*y], axis=1)
+        for _ys in [ys, ys + 0j]:
+            V = basis_axes.convolve_coulomb_exact(_ys, method='pruned')
+            assert V.shape == ys.shape
+            assert np.allclose(V[:, 0], basis.convolve_coulomb_exact(
+                _ys[:, 0], method='pad'))
+            assert np.allclose(V[:, 1], 2*V[:, 0])
+
+    def test_coulomb(self):
+        basis = bases.CartesianBasis(Nxyz=(32,)*2, Lxyz=(20.0,)*2)
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        for fast_coulomb in [True, False]:
+            basis.fast_coulomb = fast_coulomb
+            basis.init()
+            V = basis.convolve_coulomb(y)
+            assert np.allclose(V, basis.convolve_coulomb(y))
+            assert basis._kernel_cache.stats()['hits'] > 0
+
+        basis = bases.PeriodicBasis(Nxyz=(16,)*2, Lxyz=(20.0,)*2)
+        for y in [y[::2, ::2], y[::2, ::2] + 0j]:
+            V = basis.convolve_coulomb(y)
+            assert np.allclose(V, basis.convolve_coulomb(y))
+
+
+class TestOutOfCore(object):
+    """Check that memory-mapped states are processed slab by slab."""
+    @pytest.fixture
+    def basis(self, tmp_path):
+        basis = bases.PeriodicBasis(Nxyz=(8, 9, 10), Lxyz=(10.0, 11.0, 12.0),
+                                    scratch_dir=str(tmp_path))
+        basis.slab_bytes = 1000  # Force several slabs
+        return basis
+
+    def get_memmap(self, tmp_path, y):
+        ym = np.memmap(tmp_path / 'y.npy', dtype=y.dtype, mode='w+',
+                       shape=y.shape)
+        ym[...] = y
+        return ym
+
+    @pytest.mark.parametrize('components', [(), (2,)])
+    @pytest.mark.parametrize('dtype', [float, complex])
+    def test_periodic(self, basis, tmp_path, components, dtype):
+        np.random.seed(3)
+        shape = components + tuple(basis.shape)
+        y = np.random.random(shape).astype(dtype) - 0.5
+        if dtype is complex:
+            y += 1j*np.random.random(shape)
+        ym = self.get_memmap(tmp_path, y)
+
+        def F(k):
+            return np.exp(-k**2)
+
+        for f in [basis.fftn, basis.ifftn,
+                  lambda y: basis.fft(y, axis=1),
+                  basis.laplacian,
+                  lambda y: basis.laplacian(y, factor=0.1j, exp=True),
+                  basis.convolve_coulomb,
+                  lambda y: basis.convolve(y, C=basis.xyz[0]**2),
+                  lambda y: basis.convolve(y, Ck=F)]:
+            res = f(ym)
+            assert isinstance(res, np.memmap)
+            assert res.dtype == f(y).dtype
+            assert np.allclose(res, f(y))
+
+        # The scratch files are anonymous
+        assert [_f.name for _f in tmp_path.iterdir()] == ['y.npy']
+
+    def test_out(self, basis, tmp_path):
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2) + 0j
+        ym = self.get_memmap(tmp_path, y)
+        res = basis.laplacian(y, factor=0.1j, exp=True)
+        assert basis.laplacian(ym, factor=0.1j, exp=True, out=ym) is ym
+        assert np.allclose(ym, res)
+
+    def test_backend(self, tmp_path):
+        """The slabs are transformed with the basis backend."""
+        calls = []
+        numpy = get_backend('numpy')
+
+        def wrap(name):
+            def f(*v, **kw):
+                calls.append(name)
+                return getattr(numpy, name)(*v, **kw)
+            return f
+
+        backend = Backend('counting', **{
+            _name: wrap(_name) for _name in ['fft', 'ifft', 'fftn', 'ifftn']})
+        basis = bases.PeriodicBasis(Nxyz=(8, 9, 10), Lxyz=(10.0, 11.0, 12.0),
+                                    scratch_dir=str(tmp_path),
+                                    backend=backend)
+        basis.slab_bytes = 1000
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2) + 0j
+        ym = self.get_memmap(tmp_path, y)
+        for f in [basis.fftn, basis.ifftn, lambda y: basis.fft(y, axis=1),
+                  basis.laplacian]:
+            del calls[:]
+            res = f(ym)
+            assert isinstance(res, np.memmap)
+            assert calls
+            assert np.allclose(res, f(y))
+
+
+class TestBackends(object):
+    """Check that the bases give the same results with all backends."""
+    def get_bases(self, backend):
+        return [
+            bases.SphericalBasis(N=32, R=5.0, backend=backend),
+            bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0),
+                                backend=backend),
+            bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0),
+                                fft_plans=True, backend=backend),
+            bases.CartesianBasis(Nxyz=(15, 16), Lxyz=(10.0, 11.0),
+                                 backend=backend),
+            bases.CylindricalBasis(Nxr=(16, 8), Lxr=(10.0, 5.0),
+                                   backend=backend)]
+
+    def get_results(self, basis):
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        res = [basis.laplacian(y + 0j),
+               basis.laplacian(y + 0j, factor=0.1j, exp=True)]
+        if hasattr(basis, 'convolve_coulomb'):
+            res.append(basis.convolve_coulomb(y))
+        if isinstance(basis, bases.CartesianBasis):
+            for method in ['sum', 'pad', 'pruned']:
+                res.append(basis.convolve_coulomb_exact(y, method=method))
+        return res
+
+    @pytest.mark.parametrize('backend', available_backends())
+    def test_backends(self, backend):
+        for basis, basis0 in zip(self.get_bases(backend),
+                                 self.get_bases(None)):
+            assert basis._backend.name == backend
+            for res, res0 in zip(self.get_results(basis),
+                                 self.get_results(basis0)):
+                assert res.dtype == res0.dtype
+                assert np.allclose(res, res0)
+
+    def test_custom(self):
+        """Check that the operations go through the backend."""
+        backend0 = get_backend('numpy')
+        calls = collections.Counter()
+
+        def wrap(name):
+            def f(*v, **kw):
+                calls[name] += 1
+                return getattr(backend0, name)(*v, **kw)
+            return f
+
+        backend = Backend('custom', get_fft_plans=None, get_fftn_plans=None,
+                          exp=wrap('exp'),
+                          **{_name: wrap(_name) for _name in
+                             ['fft', 'ifft', 'fftn', 'ifftn', 'rfft', 'irfft',
+                              'rfftn', 'irfftn', 'dst']})
+        for basis, basis0 in zip(self.get_bases(backend),
+                                 self.get_bases(None)):
+            calls.clear()
+            for res, res0 in zip(self.get_results(basis),
+                                 self.get_results(basis0)):
+                assert np.allclose(res, res0)
+            assert calls['exp'] > 0
+            if isinstance(basis, bases.SphericalBasis):
+                assert calls['dst'] > 0
+            elif isinstance(basis, bases.CylindricalBasis):
+                assert calls['fft'] > 0 and calls['ifft'] > 0
+            else:
+                assert calls['fftn'] > 0 and calls['rfftn'] > 0
+            if isinstance(basis, bases.CartesianBasis):
+                assert calls['rfft'] > 0 and calls['fft'] > 0
+
+    def test_state(self):
+        basis = bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0),
+                                    fft_plans=True, backend='numpy')
+        assert basis._fftn_plans is None    # numpy backend has no plans
+        basis1 = bases.PeriodicBasis(**basis._getstate())
+        assert basis1._backend is get_backend('numpy')
+        assert basis1.xp is get_backend('numpy').xp
+        with pytest.raises(ValueError, match="Unknown backend"):
+            bases.PeriodicBasis(Nxyz=(16,), Lxyz=(10.0,), backend='unknown')
+
+    def test_overrides(self, monkeypatch):
+        """The old class attributes `xp`, `_fftn` etc. can still be set."""
+        calls = []
+
+        def fftn(x, axes=None):
+            calls.append('fftn')
+            return np.fft.fftn(x, axes=axes)
+
+        basis = bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0))
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2) + 0j
+        res = basis.laplacian(y)
+        monkeypatch.setattr(bases.PeriodicBasis, '_fftn', staticmethod(fftn))
+        assert np.allclose(basis.laplacian(y), res)
+        assert calls == ['fftn']
+        monkeypatch.undo()
+
+        basis._ifftn = lambda x, axes=None: calls.append('ifftn') or (
+            np.fft.ifftn(x, axes=axes))
+        basis.xp = np
+        assert np.allclose(basis.laplacian(y), res)
+        assert calls == ['fftn', 'ifftn']
+        assert bases.PeriodicBasis(Nxyz=(4,), Lxyz=(1.0,))._ifftn is (
+            get_backend().ifftn)
+
+    @pytest.mark.parametrize('backend', available_backends())
+    def test_pickle(self, backend):
+        for basis in self.get_bases(backend):
+            res = self.get_results(basis)   # Fill the caches
+            basis1 = pickle.loads(pickle.dumps(basis))
+            assert basis1._backend is basis._backend
+            for _r, _r1 in zip(res, self.get_results(basis1)):
+                assert np.allclose(_r, _r1)
+
+
+class TestLazy(object):
+    """Check that boosts and twists can be changed without init()."""
+    def test_periodic(self):
+        basis = bases.CartesianBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0))
+        x, y = basis.xyz
+        f = np.exp(-x**2/2 - y**2/3)
+        xyz = basis.xyz
+        Vc = basis.convolve_coulomb(f)
+        for boost_pxyz, smoothing_cutoff in [((0.5, -0.2), 0.8),
+                                             ((0.5, -0.2), 0.5),
+                                             ((0, 0), 0.8)]:
+            basis.boost_pxyz = np.asarray(boost_pxyz)
+            basis.smoothing_cutoff = smoothing_cutoff
+            assert basis.initialized
+            assert basis.xyz is xyz
+            basis0 = bases.CartesianBasis(
+                Nxyz=(16, 17), Lxyz=(10.0, 11.0),
+                boost_pxyz=boost_pxyz, smoothing_cutoff=smoothing_cutoff)
+            assert np.allclose(basis.k_max, basis0.k_max)
+            for res, res0 in [
+                    (basis.laplacian(f), basis0.laplacian(f)),
+                    (basis.laplacian(f, factor=0.1j, exp=True),
+                     basis0.laplacian(f, factor=0.1j, exp=True)),
+                    (basis.smooth(f), basis0.smooth(f)),
+                    (basis.convolve_coulomb(f), basis0.convolve_coulomb(f))]:
+                assert res.dtype == res0.dtype
+                assert np.allclose(res, res0)
+        assert np.allclose(basis.convolve_coulomb(f), Vc)
+
+        basis.Nxyz = np.array([16, 16])
+        assert not basis.initialized
+
+    def test_cylindrical(self):
+        basis = bases.CylindricalBasis(Nxr=(16, 8), Lxr=(10.0, 5.0))
+        x, r = basis.xyz
+        f = np.exp(-x**2/2 - r**2/2) + 0j
+        Kr = basis._Kr
+        for twist, boost_px in [(0.3, 0), (0.3, 0.4), (0, 0)]:
+            basis.twist = twist
+            basis.boost_px = boost_px
+            assert basis.initialized
+            assert basis._Kr is Kr
+            basis0 = bases.CylindricalBasis(
+                Nxr=(16, 8), Lxr=(10.0, 5.0), twist=twist, boost_px=boost_px)
+            assert np.allclose(basis.k_max, basis0.k_max)
+            assert np.allclose(basis.y_twist, basis0.y_twist)
+            assert np.allclose(basis.laplacian(f), basis0.laplacian(f))
+            assert np.allclose(basis.laplacian(f, factor=0.1j, exp=True),
+                               basis0.laplacian(f, factor=0.1j, exp=True))
+
+
 class TestCoverage(object):
     """Walk down some error branches for coverage."""
     def test_convolve_coulomb_exact(self):
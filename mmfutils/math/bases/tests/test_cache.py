@@ -0,0 +1,142 @@
+import pickle
+
+import numpy as np
+
+import pytest
+
+from mmfutils.math import bases
+from mmfutils.math.bases.cache import PropagatorCache
+
+
+class TestPropagatorCache(object):
+    def test_lru(self):
+        cache = PropagatorCache(maxsize=2)
+        k2 = np.arange(10.0)
+        calls = []
+
+        def get(factor):
+            def compute():
+                calls.append(factor)
+                return np.exp(-factor*k2)
+            return cache.get(factor, k2, compute=compute)
+
+        U1 = get(1.0)
+        assert not U1.flags.writeable
+        assert get(1.0) is U1
+        get(2.0)
+        get(1.0)                # 1.0 is now most recently used
+        get(3.0)                # Evicts 2.0
+        assert len(calls) == 3
+        get(1.0)
+        get(2.0)
+        assert calls == [1.0, 2.0, 3.0, 2.0]
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (3, 4)
+        assert stats['evictions'] == 2
+        assert stats['size'] == 2
+        assert stats['nbytes'] == 2 * U1.nbytes
+
+    def test_identity(self):
+        """Arrays are compared by identity, factors by value."""
+        cache = PropagatorCache()
+        k2a = np.arange(10.0)
+        k2b = k2a.copy()
+        Ua = cache.get(1.0, k2a, compute=lambda: np.exp(-k2a))
+        Ub = cache.get(1.0, k2b, compute=lambda: np.exp(-k2b))
+        assert Ua is not Ub
+        assert cache.get(np.float64(1.0), k2a, compute=None) is Ua
+        factor = np.array([1.0, 2.0])[:, None]
+        U = cache.get(factor, k2a, compute=lambda: np.exp(-factor*k2a))
+        assert cache.get(factor.copy(), k2a, compute=None) is U
+
+    def test_factor_type(self):
+        """Real and complex factors with the same value are distinct."""
+        cache = PropagatorCache()
+        k2 = np.arange(10.0)
+        U = cache.get(1.0, k2, compute=lambda: np.exp(-k2))
+        Uc = cache.get(1 + 0j, k2, compute=lambda: np.exp(-(1 + 0j)*k2))
+        assert not np.iscomplexobj(U)
+        assert np.iscomplexobj(Uc)
+
+    def test_weakref(self):
+        """Entries are dropped when their arrays are deleted."""
+        cache = PropagatorCache()
+        k2 = np.arange(10.0)
+        U = cache.get(1.0, k2, compute=lambda: np.exp(-k2))
+        assert cache.stats()['nbytes'] == U.nbytes
+        del k2
+        assert cache.stats() == dict(
+            hits=0, misses=1, evictions=0, size=0, nbytes=0,
+            max_bytes=cache.max_bytes)
+
+        # Objects that do not support weak references are held and counted.
+        k2 = [np.arange(10.0)]
+        U = cache.get(1.0, k2, compute=lambda: np.exp(-k2[0]))
+        assert cache.stats()['nbytes'] == U.nbytes + k2[0].nbytes
+        assert cache.get(1.0, k2, compute=None) is U
+
+    def test_pickle(self):
+        cache = PropagatorCache(maxsize=3, max_bytes=1000)
+        k2 = np.arange(10.0)
+        cache.get(1.0, k2, compute=lambda: np.exp(-k2))
+        cache1 = pickle.loads(pickle.dumps(cache))
+        assert (cache1.maxsize, cache1.max_bytes) == (3, 1000)
+        assert cache1.stats()['size'] == 0
+        U = cache1.get(1.0, k2, compute=lambda: np.exp(-k2))
+        assert cache1.get(1.0, k2, compute=None) is U
+
+    def test_max_bytes(self):
+        k2 = np.arange(10.0)
+        cache = PropagatorCache(max_bytes=2*k2.nbytes)
+        for factor in [1.0, 2.0, 3.0]:
+            cache.get(factor, k2, compute=lambda: np.exp(-factor*k2))
+        assert cache.stats()['size'] == 2
+        assert cache.nbytes <= cache.max_bytes
+
+        # Too large to cache
+        cache = PropagatorCache(max_bytes=k2.nbytes - 1)
+        cache.get(1.0, k2, compute=lambda: np.exp(-k2))
+        assert cache.stats()['size'] == 0
+        cache.clear()
+        assert cache.stats()['misses'] == 0
+
+
+class TestBases(object):
+    @pytest.fixture
+    def cache(self):
+        return PropagatorCache()
+
+    @pytest.mark.parametrize('use_kx2', [False, True])
+    def test_periodic(self, cache, use_kx2):
+        basis = bases.PeriodicBasis(Nxyz=(16, 17), Lxyz=(10.0, 11.0))
+        basis.propagator_cache = cache
+        kw = dict(kx2=basis.kx**2/2) if use_kx2 else {}
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2)
+        res = basis.laplacian(y, factor=0.1j, exp=True, **kw)
+        assert np.allclose(res, basis.laplacian(y, factor=0.1j, exp=True, **kw))
+        assert cache.stats()['hits'] == 1
+        basis.propagator_cache = None
+        assert np.allclose(res, basis.laplacian(y, factor=0.1j, exp=True, **kw))
+
+    def test_spherical(self, cache):
+        basis = bases.SphericalBasis(N=32, R=5.0)
+        basis.propagator_cache = cache
+        r = basis.xyz[0]
+        y = np.exp(-r**2)
+        res = basis.laplacian(y, factor=0.1j, exp=True)
+        assert np.allclose(res, basis.laplacian(y, factor=0.1j, exp=True))
+        assert cache.stats()['hits'] == 1
+        basis.propagator_cache = None
+        assert np.allclose(res, basis.laplacian(y, factor=0.1j, exp=True))
+
+    def test_cylindrical(self, cache):
+        basis = bases.CylindricalBasis(Nxr=(16, 8), Lxr=(10.0, 5.0))
+        basis.propagator_cache = cache
+        x, r = basis.xyz
+        y = np.exp(-x**2 - r**2)
+        for factor in [0.1j, 0.2j, 0.3j, 0.4j]:
+            basis.laplacian(y, factor=factor, exp=True)
+        res = basis.laplacian(y, factor=0.1j, exp=True)
+        assert cache.stats()['hits'] == 1
+        basis.propagator_cache = None
+        assert np.allclose(res, basis.laplacian(y, factor=0.1j, exp=True))
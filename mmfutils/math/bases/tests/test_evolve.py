@@ -0,0 +1,64 @@
+import numpy as np
+
+import pytest
+
+from mmfutils.math import bases
+from mmfutils.math.bases import SplitOperatorEvolver
+
+
+def get_bases():
+    return [bases.PeriodicBasis(Nxyz=(32, 30), Lxyz=(10.0, 11.0)),
+            bases.CylindricalBasis(Nxr=(32, 16), Lxr=(10.0, 5.0)),
+            bases.SphericalBasis(N=32, R=5.0)]
+
+
+class TestSplitOperatorEvolver(object):
+    @pytest.mark.parametrize('basis', get_bases())
+    def test_strang(self, basis):
+        """Compare with an unfused Strang splitting."""
+        r2 = sum(_x**2 for _x in basis.xyz)
+        hbar, m, dt = 1.2, 0.9, 0.01
+
+        def get_V(y, t):
+            return r2/2 * (1 + 0.1*np.sin(t)) + abs(y)**2
+
+        y0 = np.exp(-r2/2) * (1 + 0j)
+        evolver = SplitOperatorEvolver(basis=basis, dt=dt, get_V=get_V,
+                                       hbar=hbar, m=m)
+        steps = 20
+        y = evolver.evolve(y0.copy(), steps=steps, t=0.5)
+
+        y1 = y0.copy()
+        t = 0.5
+        for n in range(steps):
+            y1 *= np.exp(-0.5j*dt*get_V(y1, t)/hbar)
+            y1 = basis.laplacian(y1, factor=1j*hbar*dt/2/m, exp=True)
+            t += dt
+            y1 *= np.exp(-0.5j*dt*get_V(y1, t)/hbar)
+        assert np.allclose(y, y1)
+        assert evolver.steps == steps
+        assert evolver.steps_per_second > 0
+
+    def test_in_place(self):
+        basis = bases.PeriodicBasis(Nxyz=(32,), Lxyz=(10.0,))
+        x = basis.xyz[0]
+        evolver = SplitOperatorEvolver(basis=basis, dt=0.01,
+                                       get_V=lambda y, t: 0.5)
+        assert np.isnan(evolver.steps_per_second)
+        y0 = np.exp(-x**2/2)
+        y = evolver.evolve(y0, steps=2)
+        assert y is not y0
+        assert evolver.evolve(y, steps=2) is y
+        assert evolver.evolve(y, steps=0) is y
+
+    def test_imaginary_time(self):
+        """Imaginary time evolution should find the ground state."""
+        basis = bases.PeriodicBasis(Nxyz=(64,), Lxyz=(20.0,))
+        x = basis.xyz[0]
+        evolver = SplitOperatorEvolver(basis=basis, dt=-0.1j,
+                                       get_V=lambda y, t: x**2/2)
+        y = np.ones_like(x) + 0j
+        for n in range(20):
+            y = evolver.evolve(y, steps=20)
+            y /= abs(y).max()
+        assert np.allclose(abs(y), np.exp(-x**2/2), atol=1e-3)
@@ -1,12 +1,11 @@
 """General utility functions"""
-from distutils.version import StrictVersion
 import functools
 import operator
 
 import numpy as np
 from numpy.linalg import norm
-import scipy as sp
 
+from mmfutils.performance.backends import get_backend
 from mmfutils.performance.fft import fft, ifft, fftn, ifftn, resample
 
 __all__ = ('prod', 'norm', 'ndgrid', 'dst', 'idst', 'get_xyz')
@@ -35,7 +34,7 @@ def ndgrid(*v):
         return np.meshgrid(*v, sparse=True, indexing='ij')
 
 
-def get_xyz(Nxyz, Lxyz, symmetric_lattice=False):
+def get_xyz(Nxyz, Lxyz, symmetric_lattice=False, dtype=float, backend=None):
     """Return `(x,y,z,...)` with broadcasting for a periodic lattice.
 
     Arguments
@@ -49,16 +48,22 @@ def get_xyz(Nxyz, Lxyz, symmetric_lattice=False):
        but not on the lattice, otherwise the origin is part of the lattice,
        but the lattice will not be symmetric (if `Nxyz` is even as is
        typically the case for performance).
+    dtype : dtype
+       Floating point type of the result.  The abscissa are computed in
+       double precision then converted.
+    backend : str, Backend, None
+       Array backend (see :mod:`mmfutils.performance.backends`).
     """
-    xyz = []
+    xp = get_backend(backend).xp
     # Special case for N = 1 should also always be centered
     _offsets = [0.5 if symmetric_lattice or _N == 1 else 0 for _N in Nxyz]
-    xyz = ndgrid(*[_l/_n * (np.arange(-_n/2, _n/2) + _offset)
-                   for _n, _l, _offset in zip(Nxyz, Lxyz, _offsets)])
+    xyz = ndgrid(*[
+        xp.asarray(_l/_n * (np.arange(-_n/2, _n/2) + _offset), dtype=dtype)
+        for _n, _l, _offset in zip(Nxyz, Lxyz, _offsets)])
     return xyz
 
 
-def get_kxyz(Nxyz, Lxyz):
+def get_kxyz(Nxyz, Lxyz, real=False, dtype=float, backend=None):
     """Return list of ks in correct order for FFT.
 
     Arguments
@@ -67,43 +72,42 @@ def get_kxyz(Nxyz, Lxyz):
        Number of points in each dimension.
     Lxyz : [float]
        Size of periodic box in each dimension.
+    real : bool
+       If `True`, then return the half-spectrum momenta for use with
+       :func:`rfftn`: the last dimension has only `N//2 + 1` non-negative
+       momenta.
+    dtype : dtype
+       Floating point type of the result.  The momenta are computed in
+       double precision then converted.
+    backend : str, Backend, None
+       Array backend (see :mod:`mmfutils.performance.backends`).
+
+    Examples
+    --------
+    >>> kx, ky = get_kxyz((4, 4), (2*np.pi, 2*np.pi), real=True)
+    >>> kx.ravel(), ky.ravel()
+    (array([ 0.,  1., -2., -1.]), array([0., 1., 2.]))
     """
     # Note: Do not kill the single highest momenta... this leads to bad
     # scaling of high-frequency errors.
-    kxyz = ndgrid(*[2.0 * np.pi * np.fft.fftfreq(_n, _l/_n)
-                    for _n, _l in zip(Nxyz, Lxyz)])
+    freqs = [np.fft.fftfreq] * len(Nxyz)
+    if real:
+        freqs[-1] = np.fft.rfftfreq
+    xp = get_backend(backend).xp
+    kxyz = ndgrid(*[xp.asarray(2.0 * np.pi * _freq(_n, _l/_n), dtype=dtype)
+                    for _freq, _n, _l in zip(freqs, Nxyz, Lxyz)])
     return kxyz
 
 
 ######################################################################
-# 1D FFTs for real functions.
-def dst(f, axis=-1):
+# 1D FFTs for real functions.  These use FFTW if available (see
+# mmfutils.performance.fft.dst) or the transforms of the specified backend.
+def dst(f, axis=-1, backend=None):
     """Return the Discrete Sine Transform (DST III) of `f`"""
-    args = dict(type=3, axis=axis)
-    return sp.fftpack.dst(f, **args)
+    return get_backend(backend).dst(f, type=3, axis=axis)
 
 
-def idst(F, axis=-1):
+def idst(F, axis=-1, backend=None):
     """Return the Inverse Discrete Sine Transform (DST II) of `f`"""
-    N = F.shape[-1]
-    args = dict(type=2, axis=axis)
-    return sp.fftpack.dst(F, **args)/(2.0*N)
-
-
-if StrictVersion(sp.__version__) < StrictVersion('0.16.0'):
-    # Scipy pre 0.16.0 cannot handle complex inputs.
-    dst_real, idst_real = dst, idst
-
-    def dst(f, axis=-1):
-        """Return the Discrete Sine Transform (DST III) of `f`"""
-        res = dst_real(f.real)
-        if np.iscomplexobj(f):
-            res = res + 1j*dst_real(f.imag)
-        return res
-
-    def idst(F, axis=-1):
-        """Return the Inverse Discrete Sine Transform (DST II) of `f`"""
-        res = idst_real(F.real)
-        if np.iscomplexobj(F):
-            res = res + 1j*idst_real(F.imag)
-        return res
+    N = F.shape[axis]
+    return get_backend(backend).dst(F, type=2, axis=axis)/(2.0*N)
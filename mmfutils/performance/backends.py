@@ -0,0 +1,160 @@
+"""Array backends.
+
+A :class:`Backend` collects the array operations used by the bases in
+:mod:`mmfutils.math.bases`: the array namespace `xp`, the FFTs, the
+real-to-real transforms, and elementwise kernels such as `exp`.  Backends are
+registered by name with :func:`register_backend` and selected per basis
+instance with the `backend` argument::
+
+    basis = PeriodicBasis(Nxyz=..., Lxyz=..., backend='numexpr')
+
+The following backends are provided (if the corresponding packages are
+available):
+
+``'default'``:
+   The default transforms of :mod:`mmfutils.performance.fft` (FFTW if
+   available, otherwise numpy) with numpy kernels.
+``'numpy'``:
+   The numpy FFTs and scipy real-to-real transforms.
+``'pyfftw'``:
+   The FFTW transforms (requires :mod:`pyfftw`).
+``'numexpr'``:
+   The default transforms with the elementwise kernels evaluated by
+   :mod:`numexpr` (multi-threaded, and using the VML if available).
+
+Other engines can be used by registering a new backend.  Unspecified
+operations default to those of the ``'default'`` backend.  For example, to use
+the process-parallel transforms of :mod:`mmfutils.performance.mpfft`::
+
+    from mmfutils.performance import mpfft
+    register_backend(Backend('mpfft', fftn=mpfft.fftn, ifftn=mpfft.ifftn))
+
+Examples
+--------
+>>> backend = get_backend('numpy')
+>>> x = np.arange(4.0)
+>>> np.allclose(backend.fft(x), np.fft.fft(x))
+True
+>>> get_backend() is get_backend('default')
+True
+"""
+import importlib.util
+
+import numpy as np
+
+from . import fft as _fft
+
+__all__ = ['Backend', 'register_backend', 'get_backend', 'available_backends']
+
+_BACKENDS = {}
+
+# Names of the transforms in mmfutils.performance.fft.
+_FFTS = ('fft', 'ifft', 'fftn', 'ifftn', 'rfft', 'irfft', 'rfftn', 'irfftn',
+         'dst', 'dct')
+
+
+class Backend(object):
+    """Collection of array operations.
+
+    Arguments
+    ---------
+    name : str
+       Name used to register the backend.
+    xp : module
+       Numpy-compatible array namespace.
+    asnumpy : function
+       Convert an array to a numpy array (on the host).
+    exp : function
+       Elementwise exponential `exp(x)`.
+    get_fft_plans, get_fftn_plans : function, None
+       Functions returning planned transforms (see
+       :func:`mmfutils.performance.fft.get_fftn_plans`) or `None` if the
+       backend does not support these.
+    **kw : function
+       Transforms `fft`, `ifft`, `fftn`, `ifftn`, `rfft`, `irfft`, `rfftn`,
+       `irfftn`, `dst` and `dct` with the signatures of the functions in
+       :mod:`mmfutils.performance.fft`.  These default to the latter.  The
+       complex transforms must accept the `out` argument.
+    """
+    def __init__(self, name, xp=np, asnumpy=np.asarray, exp=np.exp,
+                 get_fft_plans=_fft.get_fft_plans,
+                 get_fftn_plans=_fft.get_fftn_plans, **kw):
+        unknown = set(kw).difference(_FFTS)
+        if unknown:
+            raise ValueError("Unknown operations {}".format(sorted(unknown)))
+        self.name = name
+        self.xp = xp
+        self.asnumpy = asnumpy
+        self.exp = exp
+        self.get_fft_plans = get_fft_plans
+        self.get_fftn_plans = get_fftn_plans
+        for _name in _FFTS:
+            setattr(self, _name, kw.get(_name, getattr(_fft, _name)))
+
+    def __repr__(self):
+        return "Backend({!r})".format(self.name)
+
+    def __reduce__(self):
+        """Registered backends are pickled by name."""
+        if _BACKENDS.get(self.name, None) is self:
+            return (get_backend, (self.name,))
+        return object.__reduce__(self)
+
+
+def register_backend(backend):
+    """Register `backend` under `backend.name` (replacing any existing
+    backend of that name)."""
+    _BACKENDS[backend.name] = backend
+    return backend
+
+
+def available_backends():
+    """Return the names of the registered backends."""
+    return sorted(_BACKENDS)
+
+
+def get_backend(backend=None):
+    """Return the backend.
+
+    Arguments
+    ---------
+    backend : str, Backend, None
+       Name of a registered backend or a :class:`Backend` (which is returned
+       as is).  `None` returns the ``'default'`` backend.
+    """
+    if backend is None:
+        backend = 'default'
+    if isinstance(backend, Backend):
+        return backend
+    try:
+        return _BACKENDS[backend]
+    except KeyError:
+        raise ValueError("Unknown backend {!r} (available: {})".format(
+            backend, available_backends()))
+
+
+def _exp_numexpr(x):
+    """Return `exp(x)` using numexpr for the supported types."""
+    x = np.asarray(x)
+    if x.dtype in (np.float32, np.float64, np.complex128) and x.ndim > 0:
+        from .numexpr import numexpr
+        return numexpr.evaluate('exp(x)', local_dict=dict(x=x))
+    return np.exp(x)
+
+
+register_backend(Backend('default'))
+register_backend(Backend(
+    'numpy',
+    get_fft_plans=None, get_fftn_plans=None,
+    **{_name: getattr(_fft, _name + '_numpy') for _name in _FFTS[:-2]},
+    dst=_fft.dst_scipy, dct=_fft.dct_scipy))
+
+if hasattr(_fft, 'fftn_pyfftw'):
+    register_backend(Backend(
+        'pyfftw',
+        **{_name: getattr(_fft, _name + '_pyfftw') for _name in _FFTS[:-2]},
+        dst=getattr(_fft, 'dst_pyfftw', _fft.dst_scipy),
+        dct=getattr(_fft, 'dct_pyfftw', _fft.dct_scipy)))
+
+if importlib.util.find_spec('numexpr') is not None:
+    register_backend(Backend('numexpr', exp=_exp_numexpr))
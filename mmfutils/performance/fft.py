@@ -17,51 +17,157 @@ using something like::
 
 Note: The FFTW library does not work with negative indices for axis.
 Indices should first be normalized by ``inds % len(shape)``.
+
+The functions :func:`fft`, :func:`ifft`, :func:`fftn`, and :func:`ifftn`
+accept the keyword arguments `out` and `overwrite_input`.  If `out` is
+provided, the result is stored there, avoiding an allocation.  This may be the
+input array, in which case the transform is performed in place.
+
+Planning wisdom is persisted between processes: see
+:mod:`mmfutils.performance.wisdom`.
+
+The real-to-real transforms :func:`dst` and :func:`dct` (types I-IV, with the
+same unnormalized convention as :mod:`scipy.fftpack`) use FFTW if available,
+falling back to :mod:`scipy.fft`.  Complex inputs are supported by transforming
+the real and imaginary parts together in a single pass.
 """
+import contextlib
 import functools
+import inspect
 import itertools
+import threading
 import warnings
 
 import numpy.fft
 import numpy as np
 
 from .threads import SET_THREAD_HOOKS
+from .wisdom import ensure_wisdom_loaded
 
 del numpy
 
-__all__ = ['fft', 'ifft', 'fftn', 'ifftn', 'fftfreq', 'resample']
+__all__ = ['fft', 'ifft', 'fftn', 'ifftn', 'rfftn', 'irfftn', 'dst', 'dct',
+           'fftfreq', 'rfftfreq', 'resample', 'Resampler']
+
+
+# Numpy versions with a default axis specified.  These support the `out` and
+# `overwrite_input` arguments of the pyfftw versions, but `overwrite_input` is
+# ignored, and `out` is only used directly by numpy >= 2.0: otherwise the
+# result is copied into `out`.
+_NUMPY_OUT = 'out' in inspect.signature(np.fft.fft).parameters
+
+
+def _numpy_out(f, x, out, **kw):
+    """Return `f(x, **kw)`, storing the result in `out` if provided."""
+    if out is None:
+        return f(x, **kw)
+    elif _NUMPY_OUT:
+        return f(x, out=out, **kw)
+    out[...] = f(x, **kw)
+    return out
+
+
+def fft_numpy(Phi, axis=-1, out=None, overwrite_input=False, n=None):
+    return _numpy_out(np.fft.fft, Phi, out=out, n=n, axis=axis)
 
 
-# Numpy versions with a default axis specified
-def fft_numpy(Phi, axis=-1):
-    return np.fft.fft(Phi, axis=axis)
+def ifft_numpy(Phit, axis=-1, out=None, overwrite_input=False, n=None):
+    return _numpy_out(np.fft.ifft, Phit, out=out, n=n, axis=axis)
 
 
-def ifft_numpy(Phit, axis=-1):
-    return np.fft.ifft(Phit, axis=axis)
+def fftn_numpy(Phi, axes=None, out=None, overwrite_input=False):
+    return _numpy_out(np.fft.fftn, Phi, out=out, axes=axes)
 
 
-def fftn_numpy(Phi, axes=None):
-    return np.fft.fftn(Phi, axes=axes)
+def ifftn_numpy(Phit, axes=None, out=None, overwrite_input=False):
+    return _numpy_out(np.fft.ifftn, Phit, out=out, axes=axes)
 
 
-def ifftn_numpy(Phit, axes=None):
-    return np.fft.ifftn(Phit, axes=axes)
+# Real transforms.  The last of the axes is halved to `N//2 + 1` points.
+def rfft_numpy(Phi, axis=-1, n=None):
+    return np.fft.rfft(Phi, n=n, axis=axis)
+
+
+def irfft_numpy(Phit, n=None, axis=-1):
+    return np.fft.irfft(Phit, n=n, axis=axis)
+
+
+def rfftn_numpy(Phi, axes=None):
+    return np.fft.rfftn(Phi, axes=axes)
+
+
+def irfftn_numpy(Phit, s=None, axes=None):
+    return np.fft.irfftn(Phit, s=s, axes=axes)
 
 
 fftfreq = np.fft.fftfreq
+rfftfreq = np.fft.rfftfreq
 fftshift = np.fft.fftshift
 
 
 _THREADS = 8
 _PLANNER_EFFORT = 'FFTW_MEASURE'
 
+# Per-thread limits on the number of threads (see thread_limit()).
+_LOCAL_THREADS = threading.local()
+
+
+def _r2r(f, x, type, axis, **kw):
+    """Return the real-to-real transform `f(x, type, axis)`.
+
+    Complex `x` is supported by stacking the real and imaginary parts so that
+    they are transformed together in a single pass.
+    """
+    x = np.asarray(x)
+    if not np.iscomplexobj(x):
+        return f(x, type=type, axis=axis, **kw)
+    axis = axis % x.ndim + 1
+    res = f(np.stack([x.real, x.imag]), type=type, axis=axis,
+            overwrite_x=True, **kw)
+    return res[0] + 1j*res[1]
+
+
+def dst_scipy(x, type=2, axis=-1):
+    """Return the Discrete Sine Transform of `x` (see :func:`scipy.fft.dst`)."""
+    import scipy.fft
+    return _r2r(scipy.fft.dst, x, type=type, axis=axis, workers=get_num_threads())
+
+
+def dct_scipy(x, type=2, axis=-1):
+    """Return the Discrete Cosine Transform of `x` (see
+    :func:`scipy.fft.dct`)."""
+    import scipy.fft
+    return _r2r(scipy.fft.dct, x, type=type, axis=axis, workers=get_num_threads())
+
 
 def set_num_threads(nthreads):
     global _THREADS
     _THREADS = nthreads
 
 
+def get_num_threads():
+    """Return the number of threads used by each transform (in the calling
+    thread: see :func:`thread_limit`)."""
+    return getattr(_LOCAL_THREADS, 'nthreads', None) or _THREADS
+
+
+@contextlib.contextmanager
+def thread_limit(nthreads):
+    """Context manager limiting the transforms in the calling thread to
+    `nthreads` threads.
+
+    This is used by workers running transforms concurrently so that they do
+    not oversubscribe the cores.  The global setting (see
+    :func:`set_num_threads`) is unaffected.
+    """
+    old = getattr(_LOCAL_THREADS, 'nthreads', None)
+    _LOCAL_THREADS.nthreads = nthreads
+    try:
+        yield
+    finally:
+        _LOCAL_THREADS.nthreads = old
+
+
 SET_THREAD_HOOKS.add(set_num_threads)
 
 
@@ -70,7 +176,11 @@ try:                     # NOQA  This is too complex, but that is okay
     from pyfftw.interfaces.numpy_fft import (fft as _fft,
                                              ifft as _ifft,
                                              fftn as _fftn,
-                                             ifftn as _ifftn)
+                                             ifftn as _ifftn,
+                                             rfft as _rfft,
+                                             irfft as _irfft,
+                                             rfftn as _rfftn,
+                                             irfftn as _irfftn)
 
     # Hack to get the version from pyfftw to resolve issue #25
     from pkg_resources import parse_version
@@ -84,58 +194,183 @@ try:                     # NOQA  This is too complex, but that is okay
         pyfftw.interfaces.cache.enable()
         pyfftw.interfaces.cache.set_keepalive_time(60*60)
 
+    # Plans for transforms with a specified output array.  These are stored
+    # per thread since the plans are bound to the arrays with update_arrays().
+    _OUT_PLANS = threading.local()
+    _MAX_OUT_PLANS = 32
+
+    def _get_out_plan(a, out, axes, direction, overwrite_input):
+        """Return a cached FFTW plan for transforming `a` into `out`."""
+        aligned = pyfftw.is_byte_aligned(a) and pyfftw.is_byte_aligned(out)
+        inplace = np.may_share_memory(a, out)
+        threads = get_num_threads()
+        key = (a.shape, a.dtype, out.dtype, axes, direction, inplace,
+               aligned, overwrite_input, threads, _PLANNER_EFFORT)
+        plans = getattr(_OUT_PLANS, 'plans', None)
+        if plans is None:
+            plans = _OUT_PLANS.plans = {}
+        plan = plans.get(key, None)
+        if plan is None:
+            ensure_wisdom_loaded()
+            flags = [_PLANNER_EFFORT]
+            if overwrite_input:
+                flags.append('FFTW_DESTROY_INPUT')
+            if not aligned:
+                flags.append('FFTW_UNALIGNED')
+            # Plan with scratch arrays since planning destroys the data.
+            _a = pyfftw.empty_aligned(a.shape, dtype=a.dtype)
+            _out = _a if inplace else pyfftw.empty_aligned(
+                out.shape, dtype=out.dtype)
+            plan = pyfftw.FFTW(_a, _out, axes=axes, direction=direction,
+                               flags=flags, threads=threads)
+            while len(plans) >= _MAX_OUT_PLANS:
+                plans.pop(next(iter(plans)))
+            plans[key] = plan
+        return plan
+
+    def _execute(f, v, kw, out, direction):
+        """Compute `f(*v, **kw)` storing the result in `out`.
+
+        If possible, the transform is performed directly into `out` (which may
+        be the input array for an in-place transform) using a cached plan,
+        otherwise the result is computed with `f` and copied.
+        """
+        a = v[0]
+        if 'axis' in kw:
+            axes = (kw['axis'],)
+        elif kw.get('axes', None) is not None:
+            axes = tuple(kw['axes'])
+        else:
+            axes = tuple(range(len(np.shape(a))))
+        overwrite_input = kw.get('overwrite_input', False)
+        if (len(v) == 1 and isinstance(a, np.ndarray)
+                and set(kw).issubset(['axis', 'axes', 'overwrite_input',
+                                      'threads', 'planner_effort'])
+                and a.shape == out.shape
+                and a.dtype == out.dtype
+                and np.iscomplexobj(a)
+                and a.flags.c_contiguous and out.flags.c_contiguous
+                and (a is out or not np.may_share_memory(a, out))):
+            plan = _get_out_plan(a, out, axes=axes, direction=direction,
+                                 overwrite_input=overwrite_input)
+            plan.update_arrays(a, out)
+            return plan(normalise_idft=True)
+        out[...] = f(*v, **kw)
+        return out
+
     # Also, the number of threads is set by default to 1.  Here we set the
     # default value to 8 and use FFT_MEASURE to actually check.
     @functools.wraps(_fft)
     def fft_pyfftw(*v, **kw):
         global _THREADS, _PLANNER_EFFORT
-        kw.update(threads=_THREADS, planner_effort=_PLANNER_EFFORT)
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
         if 'axis' in kw:
             # Support negative arguments for the axis keyword
             dim = len(np.shape(v[0]))
             kw['axis'] = (kw['axis'] + dim) % dim
+        out = kw.pop('out', None)
+        if out is not None:
+            return _execute(_fft, v, kw, out=out,
+                            direction='FFTW_FORWARD')
         return _fft(*v, **kw)
 
     @functools.wraps(_ifft)
     def ifft_pyfftw(*v, **kw):
         global _THREADS, _PLANNER_EFFORT
-        kw.update(threads=_THREADS, planner_effort=_PLANNER_EFFORT)
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
         if 'axis' in kw:
             # Support negative arguments for the axis keyword
             dim = len(np.shape(v[0]))
             kw['axis'] = (kw['axis'] + dim) % dim
+        out = kw.pop('out', None)
+        if out is not None:
+            return _execute(_ifft, v, kw, out=out,
+                            direction='FFTW_BACKWARD')
         return _ifft(*v, **kw)
 
     @functools.wraps(_fftn)
     def fftn_pyfftw(*v, **kw):
         global _THREADS, _PLANNER_EFFORT
-        kw.update(threads=_THREADS, planner_effort=_PLANNER_EFFORT)
-        if 'axes' in kw:
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
+        if kw.get('axes', None) is not None:
             # Support negative arguments for the axis keyword
             dim = len(np.shape(v[0]))
             kw['axes'] = (np.asarray(kw['axes']) + dim) % dim
+        out = kw.pop('out', None)
+        if out is not None:
+            return _execute(_fftn, v, kw, out=out,
+                            direction='FFTW_FORWARD')
         return _fftn(*v, **kw)
 
     @functools.wraps(_ifftn)
     def ifftn_pyfftw(*v, **kw):
         global _THREADS, _PLANNER_EFFORT
-        kw.update(threads=_THREADS, planner_effort=_PLANNER_EFFORT)
-        if 'axes' in kw:
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
+        if kw.get('axes', None) is not None:
             # Support negative arguments for the axis keyword
             dim = len(np.shape(v[0]))
             kw['axes'] = (np.asarray(kw['axes']) + dim) % dim
+        out = kw.pop('out', None)
+        if out is not None:
+            return _execute(_ifftn, v, kw, out=out,
+                            direction='FFTW_BACKWARD')
         return _ifftn(*v, **kw)
 
+    @functools.wraps(_rfft)
+    def rfft_pyfftw(*v, **kw):
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
+        if 'axis' in kw:
+            # Support negative arguments for the axis keyword
+            dim = len(np.shape(v[0]))
+            kw['axis'] = (kw['axis'] + dim) % dim
+        return _rfft(*v, **kw)
+
+    @functools.wraps(_irfft)
+    def irfft_pyfftw(*v, **kw):
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
+        if 'axis' in kw:
+            # Support negative arguments for the axis keyword
+            dim = len(np.shape(v[0]))
+            kw['axis'] = (kw['axis'] + dim) % dim
+        return _irfft(*v, **kw)
+
+    @functools.wraps(_rfftn)
+    def rfftn_pyfftw(*v, **kw):
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
+        if kw.get('axes', None) is not None:
+            # Support negative arguments for the axis keyword
+            dim = len(np.shape(v[0]))
+            kw['axes'] = (np.asarray(kw['axes']) + dim) % dim
+        return _rfftn(*v, **kw)
+
+    @functools.wraps(_irfftn)
+    def irfftn_pyfftw(*v, **kw):
+        ensure_wisdom_loaded()
+        kw.update(threads=get_num_threads(), planner_effort=_PLANNER_EFFORT)
+        if kw.get('axes', None) is not None:
+            # Support negative arguments for the axis keyword
+            dim = len(np.shape(v[0]))
+            kw['axes'] = (np.asarray(kw['axes']) + dim) % dim
+        return _irfftn(*v, **kw)
+
     def get_fft_pyfftw(a, n=None, axis=-1, overwrite_input=False,
                        auto_align_input=True, auto_contiguous=True,
                        avoid_copy=False):
         """Return a function to compute the fft."""
         global _THREADS, _PLANNER_EFFORT
+        ensure_wisdom_loaded()
         # Support negative arguments for the axis keyword
         dim = len(np.shape(a))
         axis = (axis + dim) % dim
         return pyfftw.builders.fft(a=a, n=n, axis=axis,
-                                   threads=_THREADS,
+                                   threads=get_num_threads(),
                                    planner_effort=_PLANNER_EFFORT,
                                    overwrite_input=overwrite_input,
                                    auto_align_input=auto_align_input,
@@ -147,10 +382,11 @@ try:                     # NOQA  This is too complex, but that is okay
                         avoid_copy=False):
         """Return a function to compute the ifft."""
         global _THREADS, _PLANNER_EFFORT
+        ensure_wisdom_loaded()
         dim = len(np.shape(a))
         axis = (axis + dim) % dim
         return pyfftw.builders.ifft(a=a, n=n, axis=axis,
-                                    threads=_THREADS,
+                                    threads=get_num_threads(),
                                     planner_effort=_PLANNER_EFFORT,
                                     overwrite_input=overwrite_input,
                                     auto_align_input=auto_align_input,
@@ -162,11 +398,12 @@ try:                     # NOQA  This is too complex, but that is okay
                         avoid_copy=False):
         """Return a function to compute the fftn."""
         global _THREADS, _PLANNER_EFFORT
+        ensure_wisdom_loaded()
         if axes is not None:
             dim = len(np.shape(a))
             axes = (np.asarray(axes) + dim) % dim
         return pyfftw.builders.fftn(a=a, s=s, axes=axes,
-                                    threads=_THREADS,
+                                    threads=get_num_threads(),
                                     planner_effort=_PLANNER_EFFORT,
                                     overwrite_input=overwrite_input,
                                     auto_align_input=auto_align_input,
@@ -178,36 +415,278 @@ try:                     # NOQA  This is too complex, but that is okay
                          avoid_copy=False):
         """Return a function to compute the ifftn."""
         global _THREADS, _PLANNER_EFFORT
+        ensure_wisdom_loaded()
         if axes is not None:
             dim = len(np.shape(a))
             axes = (np.asarray(axes) + dim) % dim
         return pyfftw.builders.ifftn(a=a, s=s, axes=axes,
-                                     threads=_THREADS,
+                                     threads=get_num_threads(),
                                      planner_effort=_PLANNER_EFFORT,
                                      overwrite_input=overwrite_input,
                                      auto_align_input=auto_align_input,
                                      auto_contiguous=auto_contiguous,
                                      avoid_copy=avoid_copy)
 
+    def get_fftn_plans(shape, dtype=complex, axes=None):
+        """Return `(fftn, ifftn)`: planned transforms with shared buffers.
+
+        The forward transform reads `fftn.input_array` and writes
+        `fftn.output_array`, which is also the input array of the inverse
+        transform.  These should be used by copying data into the input array
+        and then calling the plans without arguments::
+
+            fftn.input_array[...] = y
+            yt = fftn()
+            yt *= K
+            res = ifftn().copy()
+
+        Do not pass arrays to the plans: they may then adopt the passed array
+        as the internal buffer and overwrite it on a later call.
+
+        Returns `None` if pyfftw is not available.
+        """
+        a = pyfftw.empty_aligned(shape, dtype=dtype)
+        fftn = get_fftn_pyfftw(a, axes=axes, avoid_copy=True)
+        ifftn = get_ifftn_pyfftw(fftn.output_array, axes=axes,
+                                 overwrite_input=True, avoid_copy=True)
+        return fftn, ifftn
+
+    def get_fft_plans(shape, dtype=complex, axis=-1):
+        """Return `(fft, ifft)`: planned 1D transforms with shared buffers.
+
+        See :func:`get_fftn_plans` for usage.
+        """
+        a = pyfftw.empty_aligned(shape, dtype=dtype)
+        fft = get_fft_pyfftw(a, axis=axis, avoid_copy=True)
+        ifft = get_ifft_pyfftw(fft.output_array, axis=axis,
+                               overwrite_input=True, avoid_copy=True)
+        return fft, ifft
+
+    try:
+        from pyfftw.interfaces.scipy_fft import dst as _dst, dct as _dct
+
+        def dst_pyfftw(x, type=2, axis=-1):
+            """Return the Discrete Sine Transform of `x` using FFTW."""
+            ensure_wisdom_loaded()
+            return _r2r(_dst, x, type=type, axis=axis, workers=get_num_threads(),
+                        planner_effort=_PLANNER_EFFORT)
+
+        def dct_pyfftw(x, type=2, axis=-1):
+            """Return the Discrete Cosine Transform of `x` using FFTW."""
+            ensure_wisdom_loaded()
+            return _r2r(_dct, x, type=type, axis=axis, workers=get_num_threads(),
+                        planner_effort=_PLANNER_EFFORT)
+
+        dst = dst_pyfftw
+        dct = dct_pyfftw
+    except ImportError:          # pragma: nocover
+        # Older versions of pyfftw do not provide the real-to-real transforms
+        dst = dst_scipy
+        dct = dct_scipy
+
     fft = fft_pyfftw
     ifft = ifft_pyfftw
     fftn = fftn_pyfftw
     ifftn = ifftn_pyfftw
+    rfft = rfft_pyfftw
+    irfft = irfft_pyfftw
+    rfftn = rfftn_pyfftw
+    irfftn = irfftn_pyfftw
 except ImportError:              # pragma: nocover
     warnings.warn("Could not import pyfftw... falling back to numpy")
     fft = fft_numpy
     ifft = ifft_numpy
     fftn = fftn_numpy
     ifftn = ifftn_numpy
+    rfft = rfft_numpy
+    irfft = irfft_numpy
+    rfftn = rfftn_numpy
+    irfftn = irfftn_numpy
+    dst = dst_scipy
+    dct = dct_scipy
+
+    def get_fftn_plans(shape, dtype=complex, axes=None):
+        return None
+
+    def get_fft_plans(shape, dtype=complex, axis=-1):
+        return None
+
 
+class Resampler(object):
+    """Spectral resampling from arrays of shape `shape_in` to `shape_out`.
+
+    This precomputes the slices mapping the Fourier coefficients between the
+    two grids and keeps work buffers so that repeated resampling (as in
+    :meth:`mmfutils.math.bases.CartesianBasis.convolve_coulomb_fast`) does not
+    need to zero-fill a new spectrum each time.  The buffers are allocated
+    per thread, so instances can be shared between threads (as they are by
+    :func:`get_resampler`).
+
+    Complex inputs keep the Nyquist mode of even lattices as a negative
+    frequency (as :func:`resample` always has).  Real inputs are resampled one
+    axis at a time with real transforms, splitting the Nyquist mode equally
+    between the positive and negative frequencies so that the result is real.
+    In one dimension, this is the real part of the complex result.
+
+    Arguments
+    ---------
+    shape_in, shape_out : tuple
+       Shapes of the input and output arrays.  Only the axes with different
+       lengths are resampled.
+    dtype : dtype
+       Type of the input arrays.
+    backend : str, Backend, None
+       Backend providing the transforms (see
+       :mod:`mmfutils.performance.backends`).
 
-def resample(f, N):
+    Examples
+    --------
+    >>> x = np.arange(8)/8.0
+    >>> X = np.arange(12)/12.0
+    >>> r = Resampler(x.shape, X.shape, dtype=float)
+    >>> np.allclose(r(np.cos(2*np.pi*x)), np.cos(2*np.pi*X))
+    True
+    >>> out = np.empty(x.shape)
+    >>> Resampler(X.shape, x.shape, dtype=float)(np.sin(2*np.pi*X),
+    ...                                          out=out) is out
+    True
+    >>> np.allclose(out, np.sin(2*np.pi*x))
+    True
+    """
+    def __init__(self, shape_in, shape_out, dtype=complex, backend=None):
+        from .backends import get_backend
+        self.backend = get_backend(backend)
+        self.shape_in = tuple(shape_in)
+        self.shape_out = tuple(np.broadcast_to(shape_out,
+                                               (len(self.shape_in),)))
+        self.dtype = np.dtype(dtype)
+        self.real = not np.issubdtype(self.dtype, np.complexfloating)
+        self.axes = tuple(
+            _a for _a, (_n, _N)
+            in enumerate(zip(self.shape_in, self.shape_out))
+            if _n != _N)
+        self.scale = float(np.prod(np.divide(self.shape_out, self.shape_in)))
+        self._local = threading.local()
+
+        # Note: there are no negative frequencies if `_N == 1`.
+        self._blocks = list(itertools.product(
+            *([slice(0, (_N + 1) // 2)]
+              + ([slice(-(_N - 1) // 2, None)] if _N > 1 else [])
+              for _N in np.minimum(self.shape_in, self.shape_out))))
+
+        # Per-axis slices and half-spectrum shapes for real inputs.
+        self._steps = []
+        shape = list(self.shape_in)
+        for axis in self.axes:
+            n, N = self.shape_in[axis], self.shape_out[axis]
+            m = min(n, N)
+            shape[axis] = N//2 + 1
+            buffer_shape = tuple(shape)
+            shape[axis] = N
+            index = [slice(None)] * len(shape)
+            index[axis] = slice(0, (m + 1)//2)
+            copy = tuple(index)
+            nyquist = None
+            if m % 2 == 0:
+                index[axis] = m//2
+                nyquist = tuple(index)
+            self._steps.append((axis, N, N > n, buffer_shape, copy, nyquist))
+
+    def _get_buffer(self, key, shape):
+        """Return this thread's zero-initialized work buffer `key`.
+
+        Only the coefficients copied in each call are overwritten, so the
+        remaining entries stay zero.
+        """
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        if key not in buffers:
+            ctype = np.result_type(self.dtype, np.complex64)
+            buffers[key] = self.backend.xp.zeros(shape, dtype=ctype)
+        return buffers[key]
+
+    def __call__(self, f, out=None):
+        """Return `f` resampled to `shape_out`.
+
+        Arguments
+        ---------
+        f : array
+           Array of shape `shape_in`.
+        out : array, optional
+           If provided, the result is stored here.  This must be complex if
+           `f` is complex.
+        """
+        f = np.asarray(f)
+        if f.shape != self.shape_in:
+            raise ValueError("Expected shape {}, got {}".format(
+                self.shape_in, f.shape))
+        if not self.axes:
+            if out is None:
+                return f.copy()
+            out[...] = f
+            return out
+        if self.real and not np.iscomplexobj(f):
+            return self._resample_real(f, out=out)
+        return self._resample_complex(f, out=out)
+
+    def _resample_real(self, f, out):
+        rfft, irfft = self.backend.rfft, self.backend.irfft
+        for axis, N, up, buffer_shape, copy, nyquist in self._steps:
+            buffer = self._get_buffer(axis, buffer_shape)
+            fk = rfft(f, axis=axis)
+            buffer[copy] = fk[copy]
+            if nyquist is not None:
+                if up:
+                    # Split between +m/2 and -m/2 on the finer grid.
+                    buffer[nyquist] = 0.5 * fk[nyquist]
+                else:
+                    # Only -m/2 is kept: the real part is the average.
+                    buffer[nyquist] = fk[nyquist].real
+            f = irfft(buffer, n=N, axis=axis)
+        if out is None:
+            f *= self.scale
+            return f
+        return np.multiply(f, self.scale, out=out)
+
+    def _resample_complex(self, f, out):
+        if (out is not None and np.iscomplexobj(f)
+                and not np.iscomplexobj(out)):
+            raise TypeError(
+                "Cannot store complex result in out with dtype {}".format(
+                    out.dtype))
+        fftn, ifftn = self.backend.fftn, self.backend.ifftn
+        fk = fftn(f, axes=self.axes)
+        fk_out = self._get_buffer('complex', self.shape_out)
+        for _s in self._blocks:
+            fk_out[_s] = fk[_s]
+        if out is None or not np.iscomplexobj(out):
+            res = ifftn(fk_out, axes=self.axes)
+            res *= self.scale
+            if out is None:
+                return res
+            out[...] = res.real
+            return out
+        ifftn(fk_out, axes=self.axes, out=out)
+        out *= self.scale
+        return out
+
+
+@functools.lru_cache(maxsize=16)
+def get_resampler(shape_in, shape_out, dtype=complex, backend=None):
+    """Return a cached :class:`Resampler` (see :func:`resample`)."""
+    return Resampler(shape_in, shape_out, dtype=dtype, backend=backend)
+
+
+def resample(f, N, backend=None):
     """Resample f to a new grid of size N.
 
     This uses the FFT to resample the function `f` on a new grid with `N`
     points.  Note: this assumes that the function `f` is periodic.  Resampling
     non-periodic functions to finer lattices may introduce aliasing artifacts.
 
+    This uses a cached :class:`Resampler`: real inputs give real results.
+
     Arguments
     ---------
     f : array
@@ -215,6 +694,9 @@ def resample(f, N):
     N : int or array
        The number of lattice points in the new array.  If this is an integer,
        then all dimensions of the output array will have this length.
+    backend : str, Backend, None
+       Backend providing the transforms (see
+       :mod:`mmfutils.performance.backends`).
 
     Examples
     --------
@@ -236,14 +718,8 @@ def resample(f, N):
     >>> np.allclose(resample(f_XY, (Nx, Ny)), f(x,y))  # Back down
     True
     """
+    f = np.asarray(f)
     newshape = np.array(f.shape)
     newshape[...] = N
-    axes = np.where(np.not_equal(f.shape, newshape))[0]
-    fk = fftn(f, axes=axes)
-    fk1 = np.zeros(newshape, dtype=complex)
-    for _s in itertools.product(
-            *((slice(0, (_N + 1) // 2), slice(-(_N - 1) // 2, None))
-              for _N in np.minimum(f.shape, newshape))):
-        fk1[_s] = fk[_s]
-
-    return ifftn(fk1, axes=axes) * np.prod(newshape.astype(float)/f.shape)
+    return get_resampler(f.shape, tuple(newshape), dtype=f.dtype,
+                         backend=backend)(f)
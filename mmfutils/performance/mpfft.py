@@ -0,0 +1,386 @@
+"""Shared-memory process-parallel FFTs.
+
+Threaded FFTs scale poorly across the sockets of multi-socket (NUMA) nodes.
+This module provides :class:`SlabFFT`, a pool of worker processes, each
+pinned to the CPUs of one socket (NUMA node), which compute multi-dimensional
+FFTs of arrays in :mod:`multiprocessing.shared_memory` using the same slab
+decomposition as :mod:`mmfutils.performance.slabs`:
+
+1. Each worker transforms a contiguous range of slabs along the first
+   transformed axis `s` over the remaining axes.
+2. Each worker then transforms a range of pencil blocks along `s`.
+
+Each worker uses the threaded FFTs of :mod:`mmfutils.performance.fft` with
+the number of threads available on its socket.  Arrays allocated with
+:meth:`SlabFFT.empty` are transformed without copies (when passed as `out`,
+or with `overwrite_input=True`): other arrays are copied into and out of a
+shared work buffer.
+
+The module-level functions :func:`fftn` and :func:`ifftn` use a default pool
+(see :func:`get_pool`) and have the same signature as
+:func:`mmfutils.performance.fft.fftn`, so they can be used in place of the
+latter.  For example, to use them in a :class:`PeriodicBasis`, register a
+backend (see :mod:`mmfutils.performance.backends`)::
+
+    from mmfutils.performance import mpfft
+    from mmfutils.performance.backends import Backend, register_backend
+    register_backend(Backend('mpfft', fftn=mpfft.fftn, ifftn=mpfft.ifftn))
+    basis = PeriodicBasis(..., backend='mpfft')
+
+The workers are started with the ``'spawn'`` method (so that they do not
+inherit the state of the FFTW threads), hence scripts using this module must
+protect their entry point with ``if __name__ == '__main__':``.
+
+Examples
+--------
+>>> x = np.random.random((8, 6, 5)) + 0j
+>>> with SlabFFT(nprocs=2) as pool:
+...     y = pool.empty(x.shape)
+...     y[...] = x
+...     res = pool.fftn(x)
+...     pool.fftn(y, out=y) is y
+True
+>>> np.allclose(res, np.fft.fftn(x)), np.allclose(y, res)
+(True, True)
+"""
+import glob
+import multiprocessing
+import os
+import re
+import threading
+import traceback
+import weakref
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import fft as _fft
+from .slabs import _get_axes, _get_pencil_axis
+from .threads import set_num_threads
+
+__all__ = ['SlabFFT', 'get_numa_cpus', 'get_pool', 'fftn', 'ifftn']
+
+
+def _parse_cpulist(cpulist):
+    """Return the set of CPUs in a Linux cpulist such as ``"0-3,8-11"``."""
+    cpus = set()
+    for _r in cpulist.strip().split(','):
+        if _r:
+            first, _, last = _r.partition('-')
+            cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def get_numa_cpus():
+    """Return a list of the sets of available CPUs on each NUMA node.
+
+    This uses the Linux sysfs.  On other platforms, or if this information
+    is unavailable, a single set of all available CPUs is returned.
+    """
+    try:
+        available = os.sched_getaffinity(0)
+    except AttributeError:      # pragma: nocover
+        available = set(range(os.cpu_count() or 1))
+
+    def key(path):
+        return int(re.search(r'node(\d+)', path).group(1))
+
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist'),
+                       key=key):
+        with open(path) as f:
+            cpus = _parse_cpulist(f.read()) & available
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [available]
+
+
+def _execute(segments, name, shape, dtype, index, axes, inverse):
+    """Transform the block `index` of the shared array in place."""
+    if name not in segments:
+        segments[name] = shared_memory.SharedMemory(name=name)
+    a = np.ndarray(shape, dtype=dtype, buffer=segments[name].buf)
+    f = _fft.ifftn if inverse else _fft.fftn
+    a[index] = f(a[index], axes=axes)
+
+
+def _worker(conn, cpus, threads):
+    """Worker loop: execute the messages from `conn` until `None`."""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    set_num_threads(threads)
+    segments = {}
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            cmd, name, *args = msg
+            try:
+                if cmd == 'release':
+                    segment = segments.pop(name, None)
+                    if segment is not None:
+                        segment.close()
+                else:
+                    _execute(segments, name, *args)
+                conn.send(None)
+            except Exception:
+                conn.send(traceback.format_exc())
+    finally:
+        for segment in segments.values():
+            segment.close()
+
+
+class _SharedArray(object):
+    """Array interface for a shared memory segment.
+
+    This is the base of the arrays returned by :meth:`SlabFFT.empty`, keeping a
+    reference to the segment so that it is not unmapped while they exist.  The
+    segment is released once this is deleted (see :func:`_release`).
+    """
+    def __init__(self, segment, addr, shape, dtype):
+        self.segment = segment
+        self.__array_interface__ = dict(
+            shape=tuple(shape), typestr=dtype.str, descr=dtype.descr,
+            data=(addr, False), version=3)
+
+
+def _release(segments, released, name):
+    """Unlink the segment `name` once its last array has been deleted.
+
+    The workers are told to close their mappings on the next transform (see
+    :meth:`SlabFFT._flush`): this may be called by the garbage collector at
+    any time, so it cannot communicate with the workers.
+    """
+    entry = segments.pop(name, None)
+    if entry is not None:
+        entry[0].unlink()
+        released.append(name)
+
+
+def _shutdown(conns, procs, segments):
+    """Stop the workers and release the shared memory."""
+    for conn in conns:
+        try:
+            conn.send(None)
+        except (OSError, ValueError):   # pragma: nocover
+            pass
+    for proc in procs:
+        proc.join(timeout=5)
+        if proc.is_alive():     # pragma: nocover
+            proc.terminate()
+    # The segments are closed when the last array using them is deleted.
+    for segment, _addr in segments.values():
+        segment.unlink()
+    segments.clear()
+
+
+class SlabFFT(object):
+    """Pool of worker processes for slab-decomposed FFTs.
+
+    Arguments
+    ---------
+    nprocs : int, None
+       Number of worker processes.  Defaults to the number of NUMA nodes.
+    threads : int, None
+       Number of FFT threads per worker.  Defaults to the number of CPUs on
+       its node divided by the number of workers on that node.
+    cpus : [set], None
+       Sets of CPUs (one per node).  Worker `n` is pinned to
+       ``cpus[n % len(cpus)]``.  Defaults to :func:`get_numa_cpus`.
+
+    Use :meth:`close` (or a `with` statement) to stop the workers.
+    """
+    def __init__(self, nprocs=None, threads=None, cpus=None):
+        if cpus is None:
+            cpus = get_numa_cpus()
+        cpus = [set(_c) for _c in cpus]
+        if nprocs is None:
+            nprocs = len(cpus)
+        self.nprocs = nprocs
+        self.cpus = [cpus[_n % len(cpus)] for _n in range(nprocs)]
+        if threads is None:
+            threads = max(1, min(len(_c) * len(cpus) // nprocs
+                                 for _c in self.cpus))
+        self.threads = threads
+
+        # Spawn so that the workers do not inherit the FFTW threads.
+        ctx = multiprocessing.get_context('spawn')
+        self._conns, self._procs = [], []
+        for _cpus in self.cpus:
+            conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(target=_worker,
+                               args=(child_conn, _cpus, threads),
+                               daemon=True)
+            proc.start()
+            child_conn.close()
+            self._conns.append(conn)
+            self._procs.append(proc)
+
+        self._lock = threading.Lock()
+        self._segments = {}     # {name: (segment, address)}
+        self._released = []     # Names of segments to release in workers
+        self._work = None
+        self._finalize = weakref.finalize(
+            self, _shutdown, self._conns, self._procs, self._segments)
+
+    def close(self):
+        """Stop the workers and release the shared memory."""
+        self._finalize()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _new_array(self, shape, dtype):
+        """Return an array in a new shared memory segment."""
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        segment = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        addr = np.frombuffer(segment.buf, dtype=np.uint8).ctypes.data
+        self._segments[segment.name] = (segment, addr)
+        base = _SharedArray(segment, addr, shape, dtype)
+        weakref.finalize(base, _release, self._segments, self._released,
+                         segment.name)
+        return np.asarray(base)
+
+    def _flush(self):
+        """Tell the workers to close the released segments."""
+        while self._released:
+            name = self._released.pop()
+            self._send([('release', name)] * self.nprocs)
+
+    def empty(self, shape, dtype=complex):
+        """Return an uninitialized array in shared memory.
+
+        These arrays can be transformed in place without copies.  They remain
+        valid after the pool is closed, but can then no longer be
+        transformed.  The shared memory is released once the array (and all
+        views of it) are deleted.
+        """
+        return self._new_array(shape, np.dtype(dtype))
+
+    def _get_name(self, a):
+        """Return the name of the segment holding `a` or `None`."""
+        if not (isinstance(a, np.ndarray) and a.flags.c_contiguous):
+            return None
+        addr = a.__array_interface__['data'][0]
+        # Copy since segments may be released by the garbage collector.
+        for name, (segment, _addr) in list(self._segments.items()):
+            if addr == _addr and a.nbytes <= segment.size:
+                return name
+        return None
+
+    def _get_work(self, shape, dtype):
+        """Return a work array in shared memory."""
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        work = self._work
+        if work is None or work.nbytes < nbytes:
+            if work is not None:
+                name = self._get_name(work)
+                self._send([('release', name)] * self.nprocs)
+                self._segments.pop(name)[0].unlink()
+            work = self._work = self._new_array((nbytes,), np.dtype(np.uint8))
+        return work[:nbytes].view(dtype).reshape(shape)
+
+    def _send(self, msgs):
+        """Send the messages to the workers and wait for them to finish."""
+        for conn, msg in zip(self._conns, msgs):
+            conn.send(msg)
+        errors = [conn.recv() for conn, msg in zip(self._conns, msgs)]
+        errors = [_e for _e in errors if _e is not None]
+        if errors:
+            raise RuntimeError("Worker failed:\n" + errors[0])
+
+    def _map(self, a, axis, axes, inverse):
+        """Transform `a` along `axes` in blocks split along `axis`."""
+        name = self._get_name(a)
+        if axis is None:
+            indices = [(Ellipsis,)]
+        else:
+            bounds = np.linspace(0, a.shape[axis], self.nprocs + 1).astype(int)
+            indices = []
+            for i0, i1 in zip(bounds[:-1], bounds[1:]):
+                if i0 < i1:
+                    index = [slice(None)] * a.ndim
+                    index[axis] = slice(i0, i1)
+                    indices.append(tuple(index))
+        self._send([('fftn', name, a.shape, a.dtype.str, index, axes, inverse)
+                    for index in indices])
+
+    def _transform(self, x, axes, out, overwrite_input, inverse):
+        x = np.asarray(x)
+        dtype = np.result_type(x.dtype, np.complex64)
+        if dtype.kind != 'c':
+            raise TypeError("Cannot transform arrays of type {}".format(
+                x.dtype))
+        with self._lock:
+            self._flush()
+            if out is not None and out.dtype == dtype and self._get_name(out):
+                work = out
+            elif (overwrite_input and x.dtype == dtype
+                  and self._get_name(x)):
+                work = x
+            else:
+                work = self._get_work(x.shape, dtype)
+            if work is not x:
+                np.copyto(work, x)
+
+            axes = _get_axes(x.shape, axes)
+            s, rest = axes[0], axes[1:]
+            if rest:
+                self._map(work, s, rest, inverse)
+            self._map(work, _get_pencil_axis(x.shape, s), [s], inverse)
+
+            if out is None:
+                return work if work is x else work.copy()
+            if out is not work:
+                out[...] = work
+            return out
+
+    def fftn(self, Phi, axes=None, out=None, overwrite_input=False):
+        """Return the FFT of `Phi` along `axes`.
+
+        Arguments
+        ---------
+        out : array, None
+           If provided, the result is stored here.  If this was allocated by
+           :meth:`empty`, then the transform is performed in place.
+        overwrite_input : bool
+           If `True` and `Phi` was allocated by :meth:`empty`, then the
+           transform is performed in place and `Phi` is returned.
+        """
+        return self._transform(Phi, axes=axes, out=out,
+                               overwrite_input=overwrite_input, inverse=False)
+
+    def ifftn(self, Phit, axes=None, out=None, overwrite_input=False):
+        """Return the inverse FFT of `Phit` along `axes` (see :meth:`fftn`)."""
+        return self._transform(Phit, axes=axes, out=out,
+                               overwrite_input=overwrite_input, inverse=True)
+
+
+_POOL = None
+
+
+def get_pool():
+    """Return the default :class:`SlabFFT` pool, starting it if needed."""
+    global _POOL
+    if _POOL is None:
+        _POOL = SlabFFT()
+    return _POOL
+
+
+def fftn(Phi, axes=None, out=None, overwrite_input=False):
+    """Return the FFT of `Phi` using the default pool (see
+    :meth:`SlabFFT.fftn`)."""
+    return get_pool().fftn(Phi, axes=axes, out=out,
+                           overwrite_input=overwrite_input)
+
+
+def ifftn(Phit, axes=None, out=None, overwrite_input=False):
+    """Return the inverse FFT of `Phit` using the default pool (see
+    :meth:`SlabFFT.ifftn`)."""
+    return get_pool().ifftn(Phit, axes=axes, out=out,
+                            overwrite_input=overwrite_input)
@@ -0,0 +1,214 @@
+"""Slab-decomposed (out-of-core) FFTs.
+
+These functions perform multi-dimensional FFTs of arrays that need not fit in
+memory, such as :class:`numpy.memmap` arrays, by working on one slab at a
+time.  If `s` is the first transformed axis, then:
+
+1. Each slab ``x[..., i0:i1, ...]`` (chunked along `s`) is transformed along
+   the remaining axes.
+2. Each pencil block (chunked along another axis, usually ``s+1`` so that the
+   reads are contiguous runs) is transformed along `s`.
+
+No transposes are required.  The slabs are sized so that at most `max_bytes`
+(default :data:`SLAB_BYTES`) are held in memory at a time.  The results are
+stored in `out`, which defaults to a scratch :class:`numpy.memmap` backed by an
+anonymous temporary file in the directory `dir` (see :func:`empty_scratch`):
+this file is removed by the OS once the array is no longer referenced.
+
+:func:`apply_k_slabs` computes ``ifftn(Kk*fftn(x))`` in three passes, fusing
+the multiplication by the kernel with the transforms along `s`.
+
+The results agree with the in-memory transforms up to rounding errors.
+
+Examples
+--------
+>>> x = np.random.random((8, 6, 5))
+>>> res = fftn_slabs(x, max_bytes=0)    # One index per slab
+>>> isinstance(res, np.memmap)
+True
+>>> np.allclose(res, np.fft.fftn(x))
+True
+>>> np.allclose(ifftn_slabs(res, out=res), x)
+True
+"""
+import math
+import tempfile
+
+import numpy as np
+
+from .backends import get_backend
+
+__all__ = ['SLAB_BYTES', 'empty_scratch', 'fftn_slabs', 'ifftn_slabs',
+           'apply_k_slabs']
+
+# Default maximum size (in bytes) of the slabs held in memory.
+SLAB_BYTES = 64*2**20
+
+
+def empty_scratch(shape, dtype=complex, dir=None):
+    """Return an uninitialized scratch :class:`numpy.memmap`.
+
+    The array is backed by an anonymous temporary file in `dir` (which
+    defaults to the system temporary directory).  The file is unlinked
+    immediately, so the storage is released once the array is deleted.
+    (Empty arrays are simply allocated in memory.)
+
+    Arguments
+    ---------
+    shape : tuple
+       Shape of the array.
+    dtype : dtype
+       Type of the array.
+    dir : str, None
+       Directory in which to create the file.  This should be on a disk large
+       enough to hold the array.
+    """
+    shape = tuple(shape)
+    dtype = np.dtype(dtype)
+    if math.prod(shape) == 0:
+        # Empty files cannot be mapped.
+        return np.empty(shape, dtype=dtype)
+    with tempfile.TemporaryFile(dir=dir) as f:
+        # The mapping remains valid after the file is closed.
+        return np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+
+
+def _get_axes(shape, axes):
+    """Return the sorted normalized `axes`."""
+    if axes is None:
+        axes = range(len(shape))
+    return sorted(set(np.asarray(axes, dtype=int).ravel() % len(shape)))
+
+
+def _get_pencil_axis(shape, s):
+    """Return the axis along which to chunk the transforms along `s`.
+
+    We prefer the following axis so that the blocks are contiguous runs.
+    """
+    others = [_a for _a in range(len(shape)) if _a != s and shape[_a] > 1]
+    if not others:
+        return None
+    after = [_a for _a in others if _a > s]
+    return after[0] if after else others[-1]
+
+
+def _chunks(shape, axis, itemsize, max_bytes):
+    """Yield index tuples splitting `shape` into chunks along `axis`.
+
+    Each chunk has at most `max_bytes` bytes unless a single index along
+    `axis` exceeds this.
+    """
+    if axis is None:
+        yield (Ellipsis,)
+        return
+    N = shape[axis]
+    row_bytes = itemsize * math.prod(shape) // max(N, 1)
+    step = max(1, max_bytes // max(row_bytes, 1))
+    index = [slice(None)] * len(shape)
+    for i0 in range(0, N, step):
+        index[axis] = slice(i0, i0 + step)
+        yield tuple(index)
+
+
+def _get_out(x, out, dtype, dir):
+    if out is None:
+        out = empty_scratch(x.shape, dtype=dtype, dir=dir)
+    elif out.shape != x.shape:
+        raise ValueError("Expected out.shape == {}, got {}".format(
+            x.shape, out.shape))
+    return out
+
+
+def _fftn_slabs(x, axes, out, inverse, max_bytes, Kk=None, backend=None):
+    """Perform the (inverse) transforms along `axes` storing them in `out`.
+
+    If `Kk` is provided, then perform `ifftn(Kk*fftn(x))`.  The transforms
+    are those of `backend`.
+    """
+    backend = get_backend(backend)
+    fftn, fft = ((backend.ifftn, backend.ifft) if inverse
+                 else (backend.fftn, backend.fft))
+    shape, itemsize = x.shape, out.dtype.itemsize
+    s, rest = axes[0], axes[1:]
+    src = x
+    if rest:
+        for index in _chunks(shape, s, itemsize, max_bytes):
+            out[index] = fftn(np.asarray(x[index]), axes=rest)
+        src = out
+
+    pencil_axis = _get_pencil_axis(shape, s)
+    if Kk is not None:
+        Kk = np.broadcast_to(Kk, shape)
+    for index in _chunks(shape, pencil_axis, itemsize, max_bytes):
+        yt = fft(np.asarray(src[index]), axis=s)
+        if Kk is not None:
+            yt *= Kk[index]
+            yt = backend.ifft(yt, axis=s, out=yt)
+        out[index] = yt
+
+    if Kk is not None and rest:
+        for index in _chunks(shape, s, itemsize, max_bytes):
+            out[index] = backend.ifftn(np.asarray(out[index]), axes=rest)
+    return out
+
+
+def fftn_slabs(x, axes=None, out=None, dir=None, max_bytes=None,
+               backend=None):
+    """Return `fftn(x, axes)` computed slab by slab.
+
+    Arguments
+    ---------
+    x : array
+       Array to transform.  Usually a :class:`numpy.memmap`.
+    axes : [int], None
+       Axes to transform.  Defaults to all axes.
+    out : array, None
+       If provided, the result is stored here.  This may be `x`.  Otherwise
+       a scratch array is allocated in `dir`.
+    dir : str, None
+       Directory for the scratch array (see :func:`empty_scratch`).
+    max_bytes : int, None
+       Maximum size of the slabs.  Defaults to :data:`SLAB_BYTES`.
+    backend : str, Backend, None
+       Backend providing the transforms (see
+       :func:`mmfutils.performance.backends.get_backend`).
+    """
+    if max_bytes is None:
+        max_bytes = SLAB_BYTES
+    out = _get_out(x, out, np.result_type(x.dtype, np.complex64), dir)
+    return _fftn_slabs(x, axes=_get_axes(x.shape, axes), out=out,
+                       inverse=False, max_bytes=max_bytes, backend=backend)
+
+
+def ifftn_slabs(x, axes=None, out=None, dir=None, max_bytes=None,
+                backend=None):
+    """Return `ifftn(x, axes)` computed slab by slab (see
+    :func:`fftn_slabs`)."""
+    if max_bytes is None:
+        max_bytes = SLAB_BYTES
+    out = _get_out(x, out, np.result_type(x.dtype, np.complex64), dir)
+    return _fftn_slabs(x, axes=_get_axes(x.shape, axes), out=out,
+                       inverse=True, max_bytes=max_bytes, backend=backend)
+
+
+def apply_k_slabs(x, Kk, axes=None, out=None, dir=None, max_bytes=None,
+                  backend=None):
+    """Return `ifftn(Kk*fftn(x, axes), axes)` computed slab by slab.
+
+    Arguments
+    ---------
+    Kk : array
+       Kernel in momentum space.  This must broadcast to `x.shape` and should
+       fit in memory (only the pieces corresponding to each block are
+       read).
+    axes, out, dir, max_bytes, backend :
+       See :func:`fftn_slabs`.
+    """
+    if max_bytes is None:
+        max_bytes = SLAB_BYTES
+    Kk = np.asanyarray(Kk)
+    out = _get_out(x, out, np.result_type(x.dtype, Kk.dtype, np.complex64),
+                   dir)
+    return _fftn_slabs(x, axes=_get_axes(x.shape, axes), out=out,
+                       inverse=False, max_bytes=max_bytes, Kk=Kk,
+                       backend=backend)
@@ -0,0 +1,229 @@
+"""Persistent FFTW wisdom.
+
+Planning with ``FFTW_MEASURE`` can take seconds for each new combination of
+shape, axes, and number of threads.  FFTW can store the result of this
+planning as "wisdom" which this module saves to disk so that subsequent
+processes can skip the planning.
+
+The wisdom is stored as a JSON file keyed by the host name and the FFTW
+version (wisdom is not portable between machines or library versions).  By
+default this lives in ``~/.cache/mmfutils/`` but this can be changed by setting
+the environment variable ``MMFUTILS_WISDOM_DIR``.  Setting
+``MMFUTILS_WISDOM=0`` disables the automatic loading and saving.
+
+The wisdom is loaded automatically the first time one of the
+:mod:`mmfutils.performance.fft` routines plans a transform, and is saved when
+the process exits, or explicitly with :func:`save_wisdom`.  Saving merges with
+whatever is currently on disk while holding a lock, so several worker
+processes can safely save to the same file.
+
+Examples
+--------
+>>> import tempfile, os
+>>> with tempfile.TemporaryDirectory() as d:
+...     filename = os.path.join(d, 'wisdom.json')
+...     _ = save_wisdom(filename)
+...     load_wisdom(filename)
+True
+"""
+import atexit
+import contextlib
+import json
+import os
+import socket
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:             # pragma: nocover
+    fcntl = None
+
+try:
+    import pyfftw
+except ImportError:             # pragma: nocover
+    pyfftw = None
+
+__all__ = ['get_wisdom_filename', 'export_wisdom', 'import_wisdom',
+           'merge_wisdom', 'load_wisdom', 'save_wisdom']
+
+WISDOM_DIR = os.environ.get(
+    'MMFUTILS_WISDOM_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'mmfutils'))
+
+# Set to False to disable automatic loading (and saving at exit).
+AUTO_WISDOM = os.environ.get('MMFUTILS_WISDOM', '1').lower() not in (
+    '0', 'false', 'no', 'off')
+
+_LOADED = False
+_LOAD_LOCK = threading.Lock()
+
+
+def _get_fftw_version():
+    """Return the FFTW version string (or 'unknown')."""
+    return str(getattr(pyfftw, 'fftw_version', 'unknown'))
+
+
+def get_wisdom_filename(directory=None):
+    """Return the name of the wisdom file for this host and FFTW version.
+
+    Arguments
+    ---------
+    directory : str, optional
+       Directory in which to store the wisdom.  Defaults to `WISDOM_DIR`.
+    """
+    if directory is None:
+        directory = WISDOM_DIR
+    host = socket.gethostname().split('.')[0] or 'localhost'
+    name = "fftw_wisdom_{}_{}.json".format(host, _get_fftw_version())
+    return os.path.join(directory, name)
+
+
+def export_wisdom():
+    """Return a dictionary with the current FFTW wisdom.
+
+    The dictionary is suitable for storing as JSON and includes the host and
+    FFTW version so that incompatible wisdom can be rejected on import.
+    """
+    if pyfftw is None:          # pragma: nocover
+        return None
+    return dict(host=socket.gethostname(),
+                fftw_version=_get_fftw_version(),
+                wisdom=[_w.decode('ascii') for _w in pyfftw.export_wisdom()])
+
+
+def import_wisdom(wisdom):
+    """Import `wisdom` into FFTW, merging with the current wisdom.
+
+    Arguments
+    ---------
+    wisdom : dict or tuple
+       Either a dictionary as returned by :func:`export_wisdom` or a tuple as
+       returned by :func:`pyfftw.export_wisdom`.
+
+    Returns
+    -------
+    success : bool
+       `True` if all of the wisdom (double, single, and long double) was
+       imported.  Wisdom from a different FFTW version is ignored.
+    """
+    if pyfftw is None or not wisdom:   # pragma: nocover
+        return False
+    if isinstance(wisdom, dict):
+        if wisdom.get('fftw_version') != _get_fftw_version():
+            return False
+        wisdom = wisdom['wisdom']
+    wisdom = tuple(_w.encode('ascii') if isinstance(_w, str) else _w
+                   for _w in wisdom)
+    return all(pyfftw.import_wisdom(wisdom))
+
+
+def merge_wisdom(*wisdoms):
+    """Return the merge of the specified wisdom with the current wisdom.
+
+    FFTW accumulates wisdom, so merging simply imports everything and exports
+    the result.  Note that this also updates the wisdom of the current process.
+    """
+    for wisdom in wisdoms:
+        import_wisdom(wisdom)
+    return export_wisdom()
+
+
+@contextlib.contextmanager
+def _lock(filename):
+    """Context for holding an exclusive lock associated with `filename`."""
+    if fcntl is None:           # pragma: nocover
+        yield
+        return
+    with open(filename + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read(filename):
+    """Return the wisdom stored in `filename` or `None`."""
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def load_wisdom(filename=None):
+    """Load wisdom from `filename`, returning `True` if successful.
+
+    Arguments
+    ---------
+    filename : str, optional
+       Wisdom file.  Defaults to :func:`get_wisdom_filename`.
+    """
+    if pyfftw is None:          # pragma: nocover
+        return False
+    if filename is None:
+        filename = get_wisdom_filename()
+    return import_wisdom(_read(filename))
+
+
+def save_wisdom(filename=None):
+    """Save the current wisdom to `filename`, merging with what is on disk.
+
+    The file is locked while it is read, merged, and replaced, so multiple
+    processes may safely save to the same file.  The file is written
+    atomically so that readers never see a partially written file.
+
+    Arguments
+    ---------
+    filename : str, optional
+       Wisdom file.  Defaults to :func:`get_wisdom_filename`.
+
+    Returns
+    -------
+    filename : str
+       Name of the file written, or `None` if pyfftw is not available.
+    """
+    if pyfftw is None:          # pragma: nocover
+        return None
+    if filename is None:
+        filename = get_wisdom_filename()
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    with _lock(filename):
+        wisdom = merge_wisdom(_read(filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(wisdom, f)
+            os.replace(tmp, filename)
+        except BaseException:   # pragma: nocover
+            os.remove(tmp)
+            raise
+    return filename
+
+
+def _save_wisdom_atexit():      # pragma: nocover
+    """Save wisdom at exit, ignoring errors (e.g. read-only filesystems)."""
+    try:
+        save_wisdom()
+    except (IOError, OSError):
+        pass
+
+
+def ensure_wisdom_loaded():
+    """Load the default wisdom once and register saving at exit.
+
+    This is called by the :mod:`mmfutils.performance.fft` routines before
+    planning.  It does nothing if `AUTO_WISDOM` is `False` or if the wisdom has
+    already been loaded.
+    """
+    global _LOADED
+    if _LOADED or not AUTO_WISDOM or pyfftw is None:
+        return
+    with _LOAD_LOCK:
+        if _LOADED:
+            return
+        load_wisdom()
+        atexit.register(_save_wisdom_atexit)
+        _LOADED = True
@@ -1,9 +1,11 @@
 """Broyden Minimizers and Root Finders.
 
 This module contains several different minimizers and root finders that
-implement Broyden's method.
+implement Broyden's method.  :func:`broyden_solve` is a limited-memory root
+finder for large problems.
 """
 import copy
+import time
 
 import numpy as np
 
@@ -11,12 +13,11 @@ import numpy as np
 # efficient implementations.
 from numpy import matmul
 
+import scipy.linalg
 import scipy.optimize.nonlin
 import scipy as sp
 
-from ..math.linalg import block_diag
-
-__all__ = ['DyadicSum']
+__all__ = ['DyadicSum', 'broyden_solve']
 
 
 _FINFO = np.finfo(float)
@@ -24,6 +25,176 @@ _EPS = _FINFO.eps
 _TINY = _FINFO.tiny
 _SINGULAR_TOL = 1e-6
 
+# Relative size (times sqrt(N)) below which the component of a new vector
+# orthogonal to the existing basis is considered to be numerical noise.
+_ORTH_TOL = 100*_EPS
+
+
+# Reorthogonalization threshold for _orthonormalize_columns().
+_DGKS = 1/np.sqrt(2)
+
+# Number of rows processed at a time by _rotate_columns().
+_BLOCK_ROWS = 4096
+
+
+def _orthonormalize_columns(Q, n, m):
+    """Orthonormalize the columns `Q[:, n:n+m]` against `Q[:, :n]` in place.
+
+    Return `(n_, C)` where the columns `Q[:, :n_]` are orthonormal and the
+    original vectors are `X = Q[:, :n_] @ C`.  Uses classical Gram-Schmidt,
+    reorthogonalizing if the norm drops by more than a factor of
+    :data:`_DGKS` (Daniel, Gragg, Kaufman, and Stewart), costing `O(N*n*m)`.
+    New directions are only kept if they are numerically independent (the
+    remaining columns are moved down to fill the gaps).
+
+    Arguments
+    ---------
+    Q : (N, n+m) array
+       Array whose first `n` columns are orthonormal.  This should have
+       Fortran order so that the columns are contiguous.
+    n, m : int
+       Number of orthonormal and new columns.
+    """
+    N = Q.shape[0]
+    C = np.zeros((n + m, m), dtype=Q.dtype)
+    tol = _ORTH_TOL * np.sqrt(N)
+    n0 = n
+    for j in range(m):
+        r = Q[:, n0 + j]
+        rho = norm = np.linalg.norm(r)
+        for _i in range(2):     # Twice is enough (Kahan-Parlett)
+            if np.iscomplexobj(Q):
+                c = matmul(r.conj(), Q[:, :n]).conj()     # Q^H @ r
+            else:
+                c = matmul(Q[:, :n].T, r)
+            r -= matmul(Q[:, :n], c)
+            C[:n, j] += c
+            rho, rho0 = np.linalg.norm(r), rho
+            if rho > _DGKS*rho0:
+                # No significant cancellation: r is orthogonal.
+                break
+        if rho > tol * norm:
+            r /= rho
+            if n < n0 + j:
+                Q[:, n] = r
+            C[n, j] = rho
+            n += 1
+    return n, C[:n]
+
+
+def _extend_basis(Q, X):
+    """Return `(Q_, C)` where `Q_ = [Q, Qn]` has orthonormal columns and
+    `X = Q_ @ C` (see :func:`_orthonormalize_columns`).
+
+    Arguments
+    ---------
+    Q : (N, n) array
+       Orthonormal basis (`Q.T @ Q = 1`).
+    X : (N, m) array
+       New vectors.
+    """
+    N, n = Q.shape
+    m = X.shape[1]
+    # Fortran order so that the leading columns Q_[:, :n] are contiguous.
+    Q_ = np.empty((N, n + m), dtype=np.result_type(Q, X), order='F')
+    Q_[:, :n] = Q
+    Q_[:, n:] = X
+    n_, C = _orthonormalize_columns(Q_, n, m)
+    return Q_[:, :n_], C
+
+
+def _rotate_columns(Q, U):
+    """Set `Q[:, :k] = Q[:, :n] @ U` in place where `U` has shape `(n, k)`
+    with `k <= n`.
+
+    The product is computed in blocks of :data:`_BLOCK_ROWS` rows (with
+    BLAS-3) so that the only workspace needed is a block of rows.
+    """
+    n, k = U.shape
+    for r0 in range(0, Q.shape[0], _BLOCK_ROWS):
+        Qr = Q[r0:r0 + _BLOCK_ROWS]
+        Qr[:, :k] = matmul(Qr[:, :n], U)
+
+
+def _householder(U):
+    """Return `(W, reflectors)` where `W` is an orthonormal basis for the
+    orthogonal complement of the columns of the `(n, d)` array `U`.
+
+    The unitary matrix `[W, Q_U] = H_1 @ H_2 @ ...` is the product of the
+    Householder reflections `H_j = 1 - tau_j v_j v_j^H` in `reflectors` (as
+    used by :func:`_reflect_columns`).  The reflections act on the last rows
+    first so that the span of `U` is mapped onto the last `d` columns.
+    """
+    n, d = U.shape
+    R = np.array(U[::-1], dtype=np.result_type(U, float))
+    Q = np.eye(n, dtype=R.dtype)
+    reflectors = []
+    for j in range(d):
+        x = R[j:, j]
+        norm = np.linalg.norm(x)
+        phase = x[0]/abs(x[0]) if x[0] != 0 else 1.0
+        v = np.zeros(n, dtype=R.dtype)
+        v[j:] = x
+        v[j] += phase*norm
+        tau = 2.0/np.vdot(v, v).real
+        R -= tau*np.outer(v, matmul(v.conj(), R))
+        Q -= tau*np.outer(matmul(Q, v), v.conj())
+        reflectors.append((v[::-1], tau))
+    return Q[::-1, ::-1][:, :n - d], reflectors
+
+
+def _reflect_columns(Q, n, reflectors):
+    """Set `Q[:, :n-d] = Q[:, :n] @ W` in place where `W` is the orthogonal
+    complement computed by :func:`_householder` (with `d = n - W.shape[1]`).
+
+    Each reflection is a rank-one update (applied in place with the BLAS
+    routine `ger` if `Q` has Fortran order), so this costs only `O(N*n*d)`
+    (compared with `O(N*n**2)` for :func:`_rotate_columns`).
+    """
+    Qn = Q[:, :n]
+    name = 'geru' if np.iscomplexobj(Q) else 'ger'
+    ger = sp.linalg.get_blas_funcs(name, (Qn,))
+    for v, tau in reflectors:
+        v = v.astype(Q.dtype)
+        w = matmul(Qn, tau*v)
+        if Qn.flags.f_contiguous:
+            ger(-1.0, w, v.conj(), a=Qn, overwrite_a=True)
+        else:
+            for r0 in range(0, Q.shape[0], _BLOCK_ROWS):
+                Qn[r0:r0 + _BLOCK_ROWS] -= np.multiply.outer(
+                    w[r0:r0 + _BLOCK_ROWS], v.conj())
+
+
+class _InverseOperator(object):
+    """Inverse of a linear operator (see :attr:`DyadicSum.alpha`)."""
+    def __init__(self, op):
+        self.op = op
+
+    @property
+    def shape(self):
+        return self.op.shape[::-1]
+
+    def matvec(self, x):
+        return self.op.solve(x)
+
+    def rmatvec(self, x):
+        return self.op.rsolve(x)
+
+    def solve(self, x):
+        return self.op.matvec(x)
+
+    def rsolve(self, x):
+        return self.op.rmatvec(x)
+
+
+def _inverse(alpha):
+    """Return the inverse of the scalar or linear operator `alpha`."""
+    if isinstance(alpha, _InverseOperator):
+        return alpha.op
+    if hasattr(alpha, 'matvec'):
+        return _InverseOperator(alpha)
+    return 1./alpha
+
 
 class DyadicSum(object):
     r"""Represents a matrix as a sum of :math:`n` dyads of length :math:`N`:
@@ -39,14 +210,23 @@ class DyadicSum(object):
     :math:`\ket{\mat{A}}` and :math:`\ket{\mat{B}}` and the :math:`n\times n` matrix
     :math:`\mat{\sigma}`.
 
+    The term :math:`\alpha\mat{1}` can be replaced by a general linear
+    operator :math:`\mat{M}_0` (such as a cheap preconditioner) by passing
+    an object with the methods `matvec`, `rmatvec` and `solve` as `alpha`
+    (see :attr:`alpha`).
+
     If :attr:`use_svd` is `True`, then the singular value
     decomposition of :math:`\mat{\sigma}` is used to keep :math:`\mat{\sigma}`
     diagonal with positive entries and only these diagonals are stored.
 
     Notes
     -----
-    * We assume everything is real here: no complex conjugation is performed
-      with transposition.
+    * Complex matrices are supported.  The rows of :math:`\bra{\mat{B}}`
+      are bras, i.e. the conjugates of the vectors :math:`\ket{b_n}`, so
+      that the products `M @ x` and `x @ M` are ordinary matrix products.
+      The orthonormality of the bases is with respect to the Hermitian inner
+      product.  For the adjoint :math:`\mat{M}^\dagger` use, e.g.
+      :meth:`Jacobian.rmatvec`.
     * We also do not explicitly support non-square matrices.  Some methods may
       work but this has not been properly tested.
     * Left and right multiplication rely on working with matrices, not arrays.
@@ -54,7 +234,6 @@ class DyadicSum(object):
 
     .. todo:: Perform an analysis of the inverse jacobian, changing bases
        if needed to make the dyads linearly independent.
-    .. todo:: Make `inplace` work properly.
     .. todo:: Use BLAS routines (more are now available).
     .. todo:: Support __array_ufunc__:
        https://docs.scipy.org/doc/numpy/neps/ufunc-overrides.html
@@ -144,26 +323,25 @@ class DyadicSum(object):
     Attributes
     ----------
     n_max : int
-       Maximum number n of Dyads to store.  If this is finite, then the N x n
-       matrices are pre-allocated, and when m new dyads are added, they replace
-       the least significant m dyads, requiring no more allocations, otherwise
-       the dyads are added as required.
+       Maximum number n of Dyads to store.
     inplace : bool (False)
-       If :attr:`n_max` is finite, then this signifies that the matrices
-       :attr:`at` and :attr:`b` should be allocated only once and all
-       operations should be done inplace on these.  In particular, when new
-       dyads are added, the least significant components of the old matrix are
-       dropped *first* then the dyads are added.
+       If :attr:`n_max` is finite, then this signifies that the `(N, n_max)`
+       matrices :math:`\ket{\mat{A}}` and :math:`\bra{\mat{B}}^T` should be
+       allocated only once and all operations should be done inplace on these
+       (a ring buffer).  In particular, when new dyads are added, the least
+       significant components of the old matrix are dropped *first* then the
+       dyads are added in their place.  The bases are orthogonalized and
+       truncated in place (with Householder reflections), so that the memory
+       usage does not grow over many updates: only `O(N)` temporaries are
+       allocated.  The core :math:`\mat{\sigma}` is only diagonalized when
+       needed (see :meth:`compact`).  :meth:`update_broyden` drops the least
+       significant dyad before computing the update so that the secant
+       condition holds exactly.
 
        If this is `False`, then the new dyads are added first and *then* the
        least-significant components are dropped.  This latter form requires
        more storage, but may be more  accurate.
 
-       .. note:: Presently, the inplace operations cannot be performed because
-              `scipy` does not expose the correct BLAS routines, so the only
-              purpose of this flag is to somewhat limit memory usage, but this
-              is probably quite ineffective at the moment.
-
     use_svd : bool (True)
        If `True`, then :meth:`orthogonalize` will be run whenever a new dyad is
        added.  (Generally a good idea, but can be slow if there are a lot of dyads).
@@ -171,17 +349,30 @@ class DyadicSum(object):
        Each call to :meth:`orthogonalize` will only keep the singular values
        within this fraction of the highest.
 
-    _at : (N, n) float array
-       :math:`\ket{\mat{A}}`. We use the ket form here because that is
-       most often used and more efficient (presently, :func:`numpy.dot` makes
-       copies if the arrays are not both `C_CONTIGUOUS`
-    _b : (n, N) float array
-       :math:`\bra{\mat{B}}`
-    _sigma : (n, n) float array
-       :math:`\mat{\sigma}` or `(n, )` array :math:`\diag\mat{\sigma}`
-       if :attr:`use_svd`.
-    alpha : float
-       Initial dyad is this factor times the identity.
+    _A : (N, n) float array
+       :math:`\ket{\mat{A}}` with orthonormal columns. We use the ket form
+       here because that is most often used and more efficient.
+    _B : (n, N) float array
+       :math:`\bra{\mat{B}}` with orthonormal rows.
+    _S : (n, n) float array
+       :math:`\mat{\sigma}` or `(n, )` array :math:`\diag\mat{\sigma}`.
+       This need not be diagonal after :meth:`add_dyad` even if
+       :attr:`use_svd` (see :meth:`compact`).
+    _at, _b, _sigma : array
+       Canonical form of the above (see :meth:`compact`).  With
+       :attr:`use_svd`, `_sigma` is the diagonal.
+    alpha : float, operator
+       Initial dyad is this factor times the identity.  Alternatively, this
+       can be a linear operator :math:`\mat{M}_0` providing the methods
+       `matvec(x)`, `rmatvec(x)` and `solve(x)` that return
+       :math:`\mat{M}_0\vec{x}`, :math:`\mat{M}_0^\dagger\vec{x}` and
+       :math:`\mat{M}_0^{-1}\vec{x}` for vectors :math:`\vec{x}` of length
+       :math:`N` (the `scipy.optimize.nonlin.Jacobian` interface).  The
+       method `rsolve(x)` returning :math:`\mat{M}_0^{-\dagger}\vec{x}` is
+       also needed by :meth:`inv`, and the attribute `shape` by
+       :meth:`todense` and :meth:`diag` if there are no dyads.  If the
+       operator has a method `diagonal(k)` (like numpy arrays), then this is
+       used by :meth:`diag`.
     """
     # Ensure that this has higher priority than numpy or scipy arrays
     # so that A @ B will call B.__rmatmul__ if B is a DyadicSum.
@@ -191,22 +382,22 @@ class DyadicSum(object):
                  at=None, b=None, sigma=None, alpha=1.0,
                  n_max=np.inf, use_svd=True,
                  inplace=False, dynamic_range=_EPS):
-        self._at = np.empty((0, 0)) if at is None else np.ascontiguousarray(at)
-        self._b = np.empty((0, 0)) if b is None else np.ascontiguousarray(b)
+        self._A = np.empty((0, 0)) if at is None else np.ascontiguousarray(at)
+        self._B = np.empty((0, 0)) if b is None else np.ascontiguousarray(b)
         if sigma is None:
-            k = len(self._b)
-            if not len(self._at.T) == k:
+            k = len(self._B)
+            if not len(self._A.T) == k:
                 raise ValueError(
                     "If sigma==None, a and b must have same length. "
-                    + "Got {} and {}.".format(len(self._at.T), k))
+                    + "Got {} and {}.".format(len(self._A.T), k))
             sigma = np.eye(k, k)
-        self._sigma = np.asarray(sigma)
+        self._S = np.asarray(sigma)
 
         self.alpha = alpha
         
-        assert (self._at.shape[0] == self._b.shape[1])
-        assert ((self._at.shape[1], self._b.shape[0]) == self._sigma.shape or
-                (self._at.shape[1], self._b.shape[0]) == self._sigma.shape*2)
+        assert (self._A.shape[0] == self._B.shape[1])
+        assert ((self._A.shape[1], self._B.shape[0]) == self._S.shape or
+                (self._A.shape[1], self._B.shape[0]) == self._S.shape*2)
 
         self.n_max = n_max
         self.use_svd = use_svd
@@ -220,11 +411,62 @@ class DyadicSum(object):
 
     @property
     def dtype(self):
-        return np.asarray(self._at).dtype
+        return np.result_type(self._A, self._B, self._S)
 
     @property
     def shape(self):
-        return (self._at.shape[0], self._b.shape[1])
+        return (self._A.shape[0], self._B.shape[1])
+
+    @property
+    def _is_operator(self):
+        """`True` if :attr:`alpha` is a linear operator."""
+        return hasattr(self.alpha, 'matvec')
+
+    def _base(self, name, x):
+        """Return the method `name` of :attr:`alpha` (`'matvec'`, `'rmatvec'`,
+        `'solve'` or `'rsolve'`) applied to the vector `x` or to the columns
+        of the 2-d array `x`."""
+        if not self._is_operator:
+            alpha = self.alpha
+            if name.startswith('r'):
+                alpha = np.conj(alpha)
+            if name.endswith('solve'):
+                return x/alpha
+            return alpha*x
+        f = getattr(self.alpha, name)
+        if 1 == len(x.shape):
+            return np.asarray(f(x))
+        if 0 == x.shape[1]:
+            return np.zeros_like(x)
+        return np.stack([f(_x) for _x in x.T], axis=-1)
+
+    def _rbase(self, x, inverse=False):
+        """Return `x @ M0` (or `x @ inv(M0)` if `inverse`) for the row
+        vector(s) `x` where `M0` is the base operator :attr:`alpha`."""
+        if not self._is_operator:
+            return x/self.alpha if inverse else self.alpha*x
+        name = 'rsolve' if inverse else 'rmatvec'
+        return self._base(name, x.conj().T).T.conj()
+
+    def _base_columns(self, cols, N):
+        """Return the columns `cols` of the `(N, N)` base operator."""
+        res = []
+        for j in cols:
+            e = np.zeros(N)
+            e[j] = 1
+            res.append(self._base('matvec', e))
+        return np.stack(res, axis=-1)
+
+    def _base_diagonal(self, k, N):
+        """Return the `k`th diagonal of the `(N, N)` base operator.
+
+        This uses the optional method `alpha.diagonal(k)` if it exists,
+        otherwise the operator is applied to one unit vector at a time.
+        """
+        if hasattr(self.alpha, 'diagonal'):
+            return np.asarray(self.alpha.diagonal(k))
+        kb = range(max(0, k), min(N, N + k))
+        return np.array([self._base_columns([j], N)[j - k, 0] for j in kb])
 
     def copy(self):
         """Return a (deep) copy of self."""
@@ -249,9 +491,9 @@ class DyadicSum(object):
         >>> M.todense()
         array(1.)
         """
-        self._at = np.empty((0, 0), dtype=float)
-        self._b = np.empty((0, 0), dtype=float)
-        self._sigma = np.empty(0, dtype=float)
+        self._A = np.empty((0, 0), dtype=float)
+        self._B = np.empty((0, 0), dtype=float)
+        self._S = np.empty(0, dtype=float)
 
     def add_dyad(self, at, b, sigma=None):
         r"""Add `|a>d<b|` to `J`.
@@ -277,6 +519,18 @@ class DyadicSum(object):
         >>> b = np.random.random((3, 10))
         >>> s = DyadicSum(n_max=2)
         >>> s.add_dyad(at=at, b=b)
+
+        Notes
+        -----
+        The dyads are added incrementally: the new vectors are
+        orthogonalized against the existing bases (Gram-Schmidt with
+        reorthogonalization) and only the small core matrix
+        :math:`\mat{\sigma}` is decomposed, so adding :math:`m` dyads costs
+        :math:`O(Nnm)` rather than the :math:`O(N(n+m)^2)` of a full
+        :meth:`orthogonalize`.  Truncation to :attr:`n_max` and
+        :attr:`dynamic_range` is applied to the core, and the bases are
+        rotated to drop the discarded directions only when they have grown to
+        twice the retained rank (see :meth:`compact`).
         """
         # Checking
         at = np.asarray(at)
@@ -300,37 +554,196 @@ class DyadicSum(object):
             assert len(a) == sigma.shape[0]
             assert len(b) == sigma.shape[1]
 
-        # assert a.shape[1] == b.shape[1]
-        if 0 < len(self._b):
-            assert self._at.shape[0] == at.shape[0]
-            assert self._b.shape[1] == b.shape[1]
-
-            if self.n_max == np.inf or not self.inplace:
-                # Just add them
-                at_ = np.hstack([self._at, at])
-                b_ = np.vstack([self._b, b])
-                self_sigma = self._sigma
-                if 1 == len(self_sigma.shape):
-                    self_sigma = np.diag(self_sigma)
-                sigma_ = block_diag((self_sigma, sigma))
-            else:
-                assert len(a) <= self.n_max
-                assert len(b) <= self.n_max
-                at_ = self._at
-                b_ = self._b
-                sigma_ = np.diag(self._sigma)
-
-                na, nb = sigma.shape
-                sigma_[-na:, -nb:] = sigma
-                at_[:, -na:] = at
-                b_[-nb:, :] = b
-        else:
+        if 0 == len(self._B):
             # Dyadic sum is empty: just add the new ones
-            at_ = at
-            b_ = b
-            sigma_ = sigma
+            self.orthogonalize(at=at, b=b, sigma=sigma)
+            return
+
+        assert self._A.shape[0] == at.shape[0]
+        assert self._B.shape[1] == b.shape[1]
+
+        if self._use_buffers:
+            self._add_dyad_inplace(at, b, sigma)
+            return
+
+        A, B, S = self._A, self._B, self._S
+        if 1 == len(S.shape):
+            S = np.diag(S)
+
+        # Extend the orthonormal bases to include the new vectors, and
+        # express the new dyads in these bases: at = A @ ca, b = cb.T @ B.
+        A, ca = _extend_basis(A, at)
+        Bt, cb = _extend_basis(B.T, b.T)
+        sigma_ = np.zeros((A.shape[1], Bt.shape[1]),
+                          dtype=np.result_type(S, sigma, ca, cb))
+        sigma_[:S.shape[0], :S.shape[1]] = S
+        sigma_ += matmul(ca, matmul(sigma, cb.T))
+        self._set_core(A, sigma_, Bt.T)
 
-        self.orthogonalize(at=at_, b=b_, sigma=sigma_)
+    @property
+    def _use_buffers(self):
+        """Use preallocated buffers (see :attr:`inplace`)."""
+        return self.inplace and self.n_max < np.inf
+
+    def _store(self, A, B, S):
+        """Store the factors, copying them into the buffers if
+        :attr:`_use_buffers`."""
+        if not self._use_buffers or 0 == np.prod(A.shape):
+            self._A, self._B, self._S = A, B, S
+            return
+        N, k = A.shape
+        shape = (N, int(self.n_max))
+        dtype = np.result_type(A, B)
+        if (getattr(self, '_Abuf', None) is None
+                or self._Abuf.shape != shape
+                or self._Abuf.dtype != dtype):
+            self._Abuf = np.empty(shape, dtype=dtype, order='F')
+            self._Btbuf = np.empty(shape, dtype=dtype, order='F')
+        self._Abuf[:, :k] = A
+        self._Btbuf[:, :k] = B.T
+        self._A = self._Abuf[:, :k]
+        self._B = self._Btbuf[:, :k].T
+        self._S = S
+
+    def _add_dyad_inplace(self, at, b, sigma):
+        """Add the dyads reusing the preallocated buffers.
+
+        The least significant dyads are dropped first to make room for the
+        new dyads, then the new vectors are orthogonalized in place.  The
+        core is not diagonalized (see :meth:`compact`): the bases are instead
+        truncated with Householder reflections (see :meth:`_truncate_inplace`)
+        so that adding `m` dyads costs `O(N*n_max*m)` and only `O(N)`
+        workspace is used.
+        """
+        ma, mb = sigma.shape
+        n_max = int(self.n_max)
+        assert ma <= n_max
+        assert mb <= n_max
+        dtype = np.result_type(self._Abuf, at, b, sigma)
+        if dtype != self._Abuf.dtype:
+            # Reallocate the buffers (e.g. for complex dyads).
+            self._store(self._A.astype(dtype), self._B.astype(dtype),
+                        self._S)
+        self._truncate_inplace(n_max - max(ma, mb))
+        na, nb = self._A.shape[1], self._B.shape[0]
+        S = self._S
+        if 1 == len(S.shape):
+            S = np.diag(S)
+        Abuf, Btbuf = self._Abuf, self._Btbuf
+        Abuf[:, na:na + ma] = at
+        Btbuf[:, nb:nb + mb] = b.T
+        na_, ca = _orthonormalize_columns(Abuf, na, ma)
+        nb_, cb = _orthonormalize_columns(Btbuf, nb, mb)
+        sigma_ = matmul(ca, matmul(sigma, cb.T))
+        sigma_[:na, :nb] += S
+        self._A = Abuf[:, :na_]
+        self._B = Btbuf[:, :nb_].T
+        self._S = sigma_
+        self._truncate_inplace(n_max)
+
+    def _truncate_inplace(self, k_max):
+        """Drop the least significant directions in place, keeping at most
+        `k_max` (see :meth:`_get_rank`).
+
+        The bases are transformed by Householder reflections that map the
+        dropped singular vectors of the core onto the discarded columns.
+        This costs `O(N*n*d)` to drop `d` directions, rather than the
+        `O(N*n**2)` needed to diagonalize the core.
+        """
+        if 0 == len(self._B):
+            return
+        S = self._S
+        na, nb = self._A.shape[1], self._B.shape[0]
+        if 1 == len(S.shape):
+            k = max(0, min(self._get_rank(S), k_max))
+            self._A = self._Abuf[:, :k]
+            self._B = self._Btbuf[:, :k].T
+            self._S = S[:k]
+            return
+        u, d, vh = np.linalg.svd(S)
+        k = max(0, min(self._get_rank(d), k_max))
+        Wa, Wb = np.eye(na), np.eye(nb)
+        if k < na:
+            Wa, reflectors = _householder(u[:, k:])
+            _reflect_columns(self._Abuf, na, reflectors)
+        if k < nb:
+            Wb, reflectors = _householder(vh[k:].T)
+            _reflect_columns(self._Btbuf, nb, reflectors)
+        self._A = self._Abuf[:, :Wa.shape[1]]
+        self._B = self._Btbuf[:, :Wb.shape[1]].T
+        self._S = matmul(Wa.conj().T, matmul(S, Wb.conj()))
+
+    def _set_core(self, A, sigma, B):
+        """Set the dyadic sum to `A @ sigma @ B` where `A` and `B.T` have
+        orthonormal columns, truncating `sigma` if :attr:`use_svd`.
+
+        The bases are only rotated (an `O(N n**2)` operation) to diagonalize
+        `sigma` once they are twice the size of the retained rank (see
+        :meth:`compact`), so that the cost is amortized over several dyads.
+        """
+        if self.use_svd:
+            u, d, vt = np.linalg.svd(sigma)
+            k = self._get_rank(d)
+            if 2*k <= len(d):
+                A = matmul(A, u[:, :k])
+                B = matmul(vt[:k, :], B)
+                sigma = d[:k]
+            elif k < len(d):
+                sigma = matmul(u[:, :k]*d[:k], vt[:k, :])
+        self._store(A, B, sigma)
+
+    def _get_rank(self, d):
+        """Return the number of singular values `d` (in decreasing order) to
+        keep (see :attr:`dynamic_range` and :attr:`n_max`)."""
+        if 0 == len(d):
+            return 0
+        max_inds = np.where(d/d.max() >= self.dynamic_range)[0]
+        if 0 < len(max_inds):
+            max_ind = min(max_inds[-1] + 1, self.n_max)
+        else:
+            max_ind = self.n_max
+        return int(min(max_ind, len(d)))
+
+    def compact(self):
+        r"""Bring the representation into canonical form.
+
+        After :meth:`add_dyad`, the bases :math:`\ket{\mat{A}}` and
+        :math:`\bra{\mat{B}}` may contain more vectors than the rank of the
+        (truncated) matrix :math:`\mat{\sigma}`, which need not be diagonal.
+        If :attr:`use_svd`, this rotates the bases so that
+        :math:`\mat{\sigma}` is diagonal with decreasing positive entries,
+        dropping the unused vectors.
+        """
+        if not self.use_svd or 1 == len(self._S.shape) or 0 == len(self._B):
+            return
+        u, d, vt = np.linalg.svd(self._S)
+        k = self._get_rank(d)
+        if self._use_buffers:
+            _rotate_columns(self._Abuf[:, :self._A.shape[1]], u[:, :k])
+            _rotate_columns(self._Btbuf[:, :len(self._B)], vt[:k, :].T)
+            self._A = self._Abuf[:, :k]
+            self._B = self._Btbuf[:, :k].T
+        else:
+            self._A = matmul(self._A, u[:, :k])
+            self._B = matmul(vt[:k, :], self._B)
+        self._S = d[:k]
+
+    # The canonical form of the factors.  We keep these names for
+    # compatibility (they were the attributes used for storage).
+    @property
+    def _at(self):
+        self.compact()
+        return self._A
+
+    @property
+    def _b(self):
+        self.compact()
+        return self._B
+
+    @property
+    def _sigma(self):
+        self.compact()
+        return self._S
 
     def orthogonalize(self, at=None, b=None, sigma=None):
         r"""Perform a QR decomposition of the dyadic components to
@@ -383,16 +796,16 @@ class DyadicSum(object):
            \mat{B}_{\text{new}} &= \mat{Q}_{B}\mat{V}^{*}\sqrt{\mat{D}}.
         """
         if at is None:
-            at = self._at
+            at = self._A
             if 0 == np.prod(at.shape):
                 # Empty.  Do nothing.  This should only happen on
                 # default initialization.
                 return
 
         if b is None:
-            b = self._b
+            b = self._B
         if sigma is None:
-            sigma = self._sigma
+            sigma = self._S
             if 1 == len(sigma.shape):
                 sigma = np.diag(sigma)
 
@@ -417,13 +830,7 @@ class DyadicSum(object):
             sigma = matmul(ra, matmul(sigma, rb.T))
             if self.use_svd:
                 u, d_, vt = np.linalg.svd(sigma)
-                max_inds = np.where(d_/d_.max() >=
-                                    self.dynamic_range)[0]
-                if 0 < len(max_inds):
-                    max_ind = min(max_inds[-1] + 1, self.n_max)
-                else:
-                    max_ind = self.n_max
-                max_ind = min(max_ind, len(u))
+                max_ind = self._get_rank(d_)
                 at = matmul(qa, u[:, :max_ind])
                 b = matmul(vt[:max_ind, :], qb.T)
                 sigma = d_[:max_ind]
@@ -431,9 +838,7 @@ class DyadicSum(object):
                 at = qa
                 b = qb.T
 
-        self._at = at
-        self._b = b
-        self._sigma = sigma
+        self._store(at, b, sigma)
 
     def apply_transform(self, f, fr=None):
         """Apply the linear transform `f` to the vectors forming the
@@ -450,9 +855,9 @@ class DyadicSum(object):
         """
         if fr is None:
             fr = f
-        if 0 < len(self._at):
-            self._at = f(self._at)
-            self._b = fr(self._b.T).T
+        if 0 < len(self._A):
+            self._A = f(self._A)
+            self._B = fr(self._B.T).T
             self.orthogonalize()
 
     def todense(self):
@@ -471,14 +876,16 @@ class DyadicSum(object):
         array([[2., 3.],
                [2., 5.]])
         """
-        if len(self._b) == 0:
+        if len(self._B) == 0:
+            if self._is_operator:
+                return self._base('matvec', np.eye(self.alpha.shape[1]))
             return np.array(self.alpha)
 
-        if 1 == len(self._sigma.shape):
-            M = matmul(self._at*self._sigma, self._b)
+        if 1 == len(self._S.shape):
+            M = matmul(self._A*self._S, self._B)
         else:
-            M = matmul(self._at, matmul(self._sigma, self._b))
-        return M + self.alpha*np.eye(*M.shape)
+            M = matmul(self._A, matmul(self._S, self._B))
+        return M + self._base('matvec', np.eye(*M.shape))
 
     def diag(self, k=0):
         r"""Return the diagonal of the matrix.
@@ -495,80 +902,108 @@ class DyadicSum(object):
         >>> M.diag()
         array([2., 5.])
         """
-        if len(self._b) == 0:
-            return np.array(1.0)
+        if len(self._B) == 0:
+            if self._is_operator:
+                return self._base_diagonal(k, self.alpha.shape[0])
+            return np.array(self.alpha)
 
-        b = self._b
+        b = self._B
 
-        if 1 == len(self._sigma.shape):
-            at = self._at*self._sigma
+        if 1 == len(self._S.shape):
+            at = self._A*self._S
         else:
-            at = matmul(self._at, self._sigma)
+            at = matmul(self._A, self._S)
         na = at.shape[0]
         nb = b.shape[1]
         ka = max(0, -k)
         kb = max(0, k)
         n = min(na - ka, nb - kb)
         d = (at[ka:ka+n, :].T*b[:, kb:kb+n]).sum(axis=0)
-        if 0 == k:
+        if self._is_operator:
+            d = d + self._base_diagonal(k, nb)
+        elif 0 == k:
             d += self.alpha
         return d
 
     def __matmul__(self, x):
         r"""Matrix multiplication: Return self*x."""
-        if 0 == len(self._b):
-            res = self.alpha*x
-        else:
+        res = self._base('matvec', x)
+        if 0 < len(self._B):
             shape = x.shape
             if 1 == len(shape):
                 x = x.reshape((len(x), 1))
-            if 1 == len(self._sigma.shape):
-                res = self.alpha * x + matmul(self._at,
-                                              np.multiply(self._sigma[:, None],
-                                                          matmul(self._b, x)))
+            if 1 == len(self._S.shape):
+                res = res + matmul(self._A,
+                                   np.multiply(self._S[:, None],
+                                               matmul(self._B, x))).reshape(shape)
             else:
-                res = self.alpha * x + matmul(self._at, matmul(self._sigma,
-                                                               matmul(self._b, x)))
-            res = res.reshape(shape)
+                res = res + matmul(self._A, matmul(self._S,
+                                                   matmul(self._B, x))).reshape(shape)
         return res
 
     def __rmatmul__(self, x):
         r"""Matrix multiplication: Return x*self."""
-        if 0 == len(self._b):
-            res = self.alpha * x
-        else:
+        res = self._rbase(x)
+        if 0 < len(self._B):
             shape = x.shape
             if 1 == len(shape):
                 x = x.reshape((1, len(x)))
-            if 1 == len(self._sigma.shape):
-                res = self.alpha * x + matmul(
-                    np.multiply(matmul(x, self._at),
-                                self._sigma[None, :]), self._b)
+            if 1 == len(self._S.shape):
+                res = res + matmul(
+                    np.multiply(matmul(x, self._A),
+                                self._S[None, :]), self._B).reshape(shape)
             else:
-                res = self.alpha * x + matmul(matmul(matmul(x, self._at),
-                                                     self._sigma), self._b)
-            res = res.reshape(shape)
+                res = res + matmul(matmul(matmul(x, self._A),
+                                          self._S), self._B).reshape(shape)
         return res
 
+    def _get_capacitance(self):
+        r"""Return `(U, V, M0iU, C)` for the Woodbury formula.
+
+        Here :math:`\mat{M} = \mat{M}_0 + \mat{U}\mat{V}` and
+        :math:`\mat{C} = \mat{1} + \mat{V}\mat{M}_0^{-1}\mat{U}` so that
+        :math:`\mat{M}^{-1} = \mat{M}_0^{-1}
+        - \mat{M}_0^{-1}\mat{U}\mat{C}^{-1}\mat{V}\mat{M}_0^{-1}`.
+        """
+        U = self._A
+        if 1 == len(self._S.shape):
+            V = self._S[:, None]*self._B
+        else:
+            V = matmul(self._S, self._B)
+        M0iU = self._base('solve', U)
+        C = np.eye(len(V)) + matmul(V, M0iU)
+        return U, V, M0iU, C
+
     def inv(self):
-        """Return the inverse using the Sherman-Morrison formula."""
+        r"""Return the inverse using the Woodbury formula.
+
+        The result has the base operator :math:`\mat{M}_0^{-1}` (which
+        requires `alpha.rsolve()` if :attr:`alpha` is an operator).
+        """
         args = dict(n_max=self.n_max, use_svd=self.use_svd,
                     inplace=self.inplace,
                     dynamic_range=self.dynamic_range)
-        U = self._at
-        if 1 == len(self._sigma.shape):
-            V = self._sigma[:, None]*self._b
-        else:
-            V = self._sigma.dot(self._b)
-        
-        k, N = V.shape
-        b = np.linalg.solve(
-            np.eye(k) + V.dot(U)/self.alpha,
-            V/self.alpha)
-        at = -U/self.alpha
-        
-        J = DyadicSum(alpha=1./self.alpha, at=at, b=b, **args)
-        return J
+        alpha = _inverse(self.alpha)
+        if 0 == len(self._B):
+            return DyadicSum(alpha=alpha, **args)
+
+        U, V, M0iU, C = self._get_capacitance()
+        b = np.linalg.solve(C, self._rbase(V, inverse=True))
+        return DyadicSum(alpha=alpha, at=-M0iU, b=b, **args)
+
+    def solve(self, x):
+        """Return `inv(self) @ x` using the Woodbury formula.
+
+        Unlike :meth:`inv`, this only requires `alpha.solve()`.
+        """
+        res = self._base('solve', np.asarray(x))
+        if 0 < len(self._B):
+            shape = res.shape
+            y = res.reshape((shape[0], -1))
+            U, V, M0iU, C = self._get_capacitance()
+            res = (y - matmul(M0iU, np.linalg.solve(C, matmul(V, y)))
+                   ).reshape(shape)
+        return res
 
     def dot(self, x):
         """Return the matrix multiplication of self with x."""
@@ -604,21 +1039,27 @@ class DyadicSum(object):
         True
         """
         if 2 == len(key):
-            at = self._at[key[0], :]
-            b = self._b[:, key[1]]
+            at = self._A[key[0], :]
+            b = self._B[:, key[1]]
             if 2 < len(b.shape):
                 b = np.rollaxis(b, 0, -1)
-            if 1 == len(self._sigma.shape):
-                res = matmul(at*self._sigma, b).squeeze()
+            if 1 == len(self._S.shape):
+                res = matmul(at*self._S, b).squeeze()
             else:
-                res = matmul(at, matmul(self._sigma, b)).sqeeze()
+                res = matmul(at, matmul(self._S, b)).squeeze()
 
             if res.shape == ():
                 res = res.reshape((1, 1))
 
-            ka = np.arange(self._at.shape[0])[key[0]].ravel()
-            kb = np.arange(self._b.shape[1])[key[1]].ravel()
-            res[np.where(ka[:, None] == kb[None, :])] += self.alpha
+            ka = np.arange(self._A.shape[0])[key[0]].ravel()
+            kb = np.arange(self._B.shape[1])[key[1]].ravel()
+            if self._is_operator:
+                # Only compute the columns of the base operator needed.
+                kb_, inds = np.unique(kb, return_inverse=True)
+                M0 = self._base_columns(kb_, self._B.shape[1])
+                res = res + M0[ka][:, inds].reshape(res.shape)
+            else:
+                res[np.where(ka[:, None] == kb[None, :])] += self.alpha
         else:
             raise ValueError(
                 "{} only supports two-dimensional indexing.  Got {}"
@@ -638,14 +1079,32 @@ class DyadicSum(object):
            the Frobenius norm of the Jacobian (the inverse of this DyadicSum),
            or the "bad" method which minimizes the change in the Frobenius norm
            of this DyadicSum representing the inverse Jacobian.
+
+        Notes
+        -----
+        If :attr:`inplace` (with finite :attr:`n_max`), then the least
+        significant dyad is dropped *before* the update is computed so that
+        the secant condition is satisfied exactly by the result (this is
+        the "Broyden Rank Reduction" method of [vanDeRotten:2003]).
+
+        .. [vanDeRotten:2003]
+           B.A. van de Rotten, "A limited memory Broyden method to solve
+           high-dimensional systems of nonlinear equations", PhD thesis,
+           Leiden University (2003).
         """
+        dx, df = np.asarray(dx), np.asarray(df)
+        if self._use_buffers and 0 < len(self._B):
+            # Drop the least significant dyad first so that the secant
+            # condition holds after the update.
+            self._truncate_inplace(int(self.n_max) - 1)
         Bdf = self.dot(df)
-        
+
+        # The bras are the conjugates of the vectors.
         if method == 'good':
-            dxB = self.__rmatmul__(np.asarray(dx))     # dx @ self
-            self.add_dyad((dx - Bdf)/dx.dot(Bdf), dxB)
+            dxB = self.__rmatmul__(dx.conj())     # dx^H @ self
+            self.add_dyad((dx - Bdf)/np.vdot(dx, Bdf), dxB)
         else:
-            self.add_dyad((dx - Bdf)/df.dot(df), df)
+            self.add_dyad((dx - Bdf)/np.vdot(df, df), df.conj())
 
 
 class JacobianBFGS(sp.optimize.nonlin.Jacobian):
@@ -657,34 +1116,79 @@ class JacobianBFGS(sp.optimize.nonlin.Jacobian):
 
     See Chapter 7 of [Nocedal:2006] (7.19) in particular.
 
+    The last `n_max` pairs :math:`(s_i, y_i)` = `(dx, df)` are stored
+    interleaved in the rows of a single preallocated `(2*n_max, N)` array used
+    as a ring buffer, and the Gram matrix of all their inner products is
+    updated with each new pair.  A solve thus needs only two matrix-vector
+    products with this array (BLAS-2): one for all the products
+    :math:`s_i\cdot v` and :math:`y_i\cdot v`, and one to form the result.
+    The recursions in between only involve the small `(n, n)` matrices.
+
     .. [Nocedal:2006]
        Jorge Nocedal and Stephen J. Wright, `"Numerical Optimization"
        <http://dx.doi.org/10.1007/978-0-387-40065-5>`_,  ,  (2006)
 
+    .. [Byrd:1994]
+       Richard H. Byrd, Jorge Nocedal, and Robert B. Schnabel,
+       "Representations of quasi-Newton matrices and their use in limited
+       memory methods", Math. Program. 63, 129-156 (1994)
+
+    Arguments
+    ---------
+    alpha : float
+       Initial inverse Jacobian `H = alpha*1` (before any updates).
+    n_max : int
+       Number of pairs to keep.  If this is infinite, then the buffers grow
+       as needed.
+    compact : bool
+       If `True`, then :meth:`solve` uses the compact representation of
+       [Byrd:1994] (triangular solves) rather than the two-loop recursion.
+       The results agree to rounding errors.
+
     Attributes
     ----------
-    _dx, _df : list
-       List of the previous `k` differences.
-    
+    _SY : (2*n, N) array
+       Buffer with :math:`s_i` in the even and :math:`y_i` in the odd rows.
+    _G : (2*n, 2*n) array
+       Gram matrix `_SY @ _SY.T`.
+    _dx, _df : (k, N) array
+       The previous `k` differences (oldest first).
     """
-    def __init__(self, alpha=1.0, n_max=20):
-        self._dx = []
-        self._df = []
+    def __init__(self, alpha=1.0, n_max=20, compact=False):
         self._H0 = alpha
         self._last_x = self._last_f = None
         self.n_max = n_max
+        self.compact = compact
+        self._SY = self._G = None
+        self._k = self._start = 0
         sp.optimize.nonlin.Jacobian.__init__(self)
 
+    @property
+    def _order(self):
+        """Slots in chronological order (oldest first)."""
+        return (self._start + np.arange(self._k)) % (len(self._SY)//2)
+
+    @property
+    def _dx(self):
+        if not self._k:
+            return []
+        return self._SY[0::2][self._order]
+
+    @property
+    def _df(self):
+        if not self._k:
+            return []
+        return self._SY[1::2][self._order]
+
     @property
     def H0(self):
         """Return the factor for the initial inverse Jacobian approximation.
 
         This default version uses equation (7.20) of [Nocedal:2006]
         """
-        s, y = self._dx, self._df
-
-        if len(y) >= 1:
-            return s[-1].dot(y[-1])/(y[-1].dot(y[-1]))
+        if self._k >= 1:
+            i = 2*self._order[-1]
+            return self._G[i, i+1]/self._G[i+1, i+1]
         else:
             return self._H0
 
@@ -699,38 +1203,74 @@ class JacobianBFGS(sp.optimize.nonlin.Jacobian):
     @property
     def _eye(self):
         """Return an appropriately sized identity matrix."""
-        if self._dx:
+        if self._k:
             return np.eye(*self.shape, dtype=self.dtype)
         else:
             return np.array(1.0, dtype=self.dtype)
-        
+
+    def _get_products(self, v):
+        """Return `(q, sv, yv, D, YY)` with the products in chronological
+        order for the recursions.
+
+        Here `q` is `v` as a 2-d array, `sv[i] = s_i.v`, `yv[i] = y_i.v`,
+        `D[i, j] = s_i.y_j` and `YY[i, j] = y_i.y_j`.
+        """
+        q = np.asarray(v)
+        if 1 == len(q.shape):
+            q = q[:, None]
+        o = self._order
+        SYv = matmul(self._SY[:2*self._k], q)     # One GEMV for all products
+        sv, yv = SYv[0::2][o], SYv[1::2][o]
+        G = self._G
+        D = G[2*o[:, None], 2*o[None, :] + 1]
+        YY = G[2*o[:, None] + 1, 2*o[None, :] + 1]
+        return q, sv, yv, D, YY
+
+    def _combine(self, q, H0, a, b):
+        """Return `H0*q + sum_i (a[i]*s_i + b[i]*y_i)` with one GEMV."""
+        o = self._order
+        c = np.empty((2*self._k, q.shape[1]), dtype=np.result_type(q, a, b))
+        c[2*o] = a
+        c[2*o + 1] = b
+        return H0*q + matmul(c.T, self._SY[:2*self._k]).T
+
     def solve(self, v):
         """Return `H.dot(v)` where `H` is the inverse Jacobian.
 
-        Uses Algorithm (7.4) of [Nocedal:2006]
+        Uses Algorithm (7.4) of [Nocedal:2006] or, if :attr:`compact`, the
+        compact representation (2.6) of [Byrd:1994].
         """
-        if not self._dx:        # Short circuit if no updates have been given
+        if not self._k:         # Short circuit if no updates have been given
             return self._H0 * v
-        s_, y_ = self._dx, self._df
-        q = np.asarray(v).copy()
-        q_shape = q.shape
-        if 1 == len(q_shape):
-            q = q[:, None]
-        k = len(y_)
-        alpha = np.empty((k, q.shape[1]), dtype=q.dtype)
-        rho = np.empty(k, dtype=self.dtype)
+        shape = np.shape(v)
+        q, sv, yv, D, YY = self._get_products(v)
+        H0 = self.H0
+        d = np.diag(D)
+        if self.compact:
+            # H = H0 + [S, H0*Y] M [S; H0*Y].T with
+            # M = [[R^{-T}(D + H0*Y.T Y)R^{-1}, -R^{-T}], [-R^{-1}, 0]]
+            R = np.triu(D)
+            alpha = sp.linalg.solve_triangular(R, sv)
+            beta = sp.linalg.solve_triangular(
+                R, d[:, None]*alpha + H0*(matmul(YY, alpha) - yv),
+                trans='T')
+            return self._combine(q, H0, beta, -H0*alpha).reshape(shape)
+
+        # Two-loop recursion with the inner products of the updated vectors
+        # expressed in terms of sv, yv, D, and YY.
+        k = self._k
+        rho = 1./d
+        alpha = np.empty_like(sv)
         for i in reversed(range(k)):
-            s, y = s_[i], y_[i]
-            rho[i] = 1./(y.dot(s))
-            alpha[i, ...] = rho[i] * (s.dot(q))
-            q -= alpha[i][None, :] * y[:, None]
-        q *= self.H0
-        r = q
+            # s_i.q where q = v - sum_{j>i} alpha_j y_j
+            alpha[i] = rho[i]*(sv[i] - matmul(D[i, i+1:], alpha[i+1:]))
+        # y_i.r0 where r0 = H0*(v - sum_j alpha_j y_j)
+        yr = H0*(yv - matmul(YY, alpha))
+        beta = np.empty_like(sv)
         for i in range(k):
-            s, y = s_[i], y_[i]
-            beta = rho[i] * y.dot(r)
-            r += (alpha[i] - beta)[None, :]*s[:, None]
-        return r.reshape(q_shape)
+            # y_i.r where r = r0 + sum_{j<i} (alpha_j - beta_j) s_j
+            beta[i] = rho[i]*(yr[i] + matmul(D[:i, i], alpha[:i] - beta[:i]))
+        return self._combine(q, H0, alpha - beta, -H0*alpha).reshape(shape)
 
     def dense_H(self):
         """Return a dense array with the inverse Jacobian H.
@@ -755,7 +1295,17 @@ class JacobianBFGS(sp.optimize.nonlin.Jacobian):
         return np.linalg.inv(self.dense_H())
 
     todense = toarray = dense_J
-        
+
+    def _allocate(self, n, N, dtype):
+        """Allocate buffers for `n` pairs, copying the current pairs."""
+        SY = np.empty((2*n, N), dtype=dtype)
+        G = np.zeros((2*n, 2*n), dtype=dtype)
+        if self._k:
+            inds = (2*self._order[:, None] + np.arange(2)[None, :]).ravel()
+            SY[:2*self._k] = self._SY[inds]
+            G[:2*self._k, :2*self._k] = self._G[inds[:, None], inds[None, :]]
+        self._SY, self._G, self._start = SY, G, 0
+
     def update(self, x, f):
         if self._last_x is not None:
             dx = x - self._last_x
@@ -763,29 +1313,87 @@ class JacobianBFGS(sp.optimize.nonlin.Jacobian):
             if np.allclose(0, df.dot(dx), atol=_EPS**2):
                 raise np.linalg.LinAlgError(
                     "Current step makes Jacobian singular.")
-            self._dx.append(dx)
-            self._df.append(df)
-            if len(self._dx) > self.n_max:
-                self._dx = self._dx[-self.n_max:]
-                self._df = self._df[-self.n_max:]
+            self._add_pair(dx, df)
         self._last_x, self._last_f = x, f
 
+    def _add_pair(self, dx, df):
+        """Add the pair `(dx, df)` to the ring buffer."""
+        dtype = np.result_type(dx, df, float)
+        n = 0 if self._SY is None else len(self._SY)//2
+        if self._SY is None or self._SY.dtype != dtype or (
+                self._k == n < self.n_max):
+            if self.n_max < np.inf:
+                n = int(self.n_max)
+            else:
+                n = max(16, 2*n)
+            self._allocate(n, len(dx), dtype)
+        if self._k < n:
+            p = (self._start + self._k) % n
+            self._k += 1
+        else:
+            # Overwrite the oldest pair.
+            p = self._start
+            self._start = (self._start + 1) % n
+        SY = self._SY
+        SY[2*p] = dx
+        SY[2*p + 1] = df
+        # Products of the new pair with all pairs (one GEMM).
+        g = matmul(SY[:2*self._k], SY[2*p:2*p + 2].T)
+        self._G[:2*self._k, 2*p:2*p + 2] = g
+        self._G[2*p:2*p + 2, :2*self._k] = g.T
+
+
+def _as_real(v):
+    """Return a real view of the complex array `v` (real and imaginary parts
+    interleaved)."""
+    v = np.ascontiguousarray(v)
+    return v.view(v.real.dtype)
+
 
 class Jacobian(DyadicSum):
-    """Provides the `scipy.optimize.nonlin.Jacobian` interface."""
-    def __init__(self, method='good', *v, **kw):
+    """Provides the `scipy.optimize.nonlin.Jacobian` interface.
+
+    Complex Jacobians are supported natively, which is appropriate if the
+    function is complex analytic (holomorphic), i.e. if the Jacobian is
+    complex linear.  Otherwise (for example, if the function depends on the
+    complex conjugate of `x`, as for `abs(x)**2*x`), use `real_view=True`:
+    complex vectors are then viewed (without copying) as real vectors of twice
+    the length and a real Jacobian is used.
+
+    Arguments
+    ---------
+    method : 'good', 'bad'
+       Broyden update (see :meth:`DyadicSum.update_broyden`).
+    real_view : bool
+       If `True`, then work with the real views of complex vectors.
+    """
+    def __init__(self, method='good', *v, real_view=False, **kw):
         DyadicSum.__init__(self, *v, **kw)
         self.last_f = None
         self.last_x = None
         self.method = method
-        
+        self.real_view = real_view
+
+    def _view(self, v):
+        """Return `(v, from_real)` where `from_real` converts the result back
+        if `v` was viewed as real."""
+        v = np.asarray(v)
+        if self.real_view and np.iscomplexobj(v):
+            return _as_real(v), lambda res: res.view(v.dtype)
+        return v, lambda res: res
+
     def solve(self, v):
-        return self.inv().dot(v)
+        v, from_real = self._view(v)
+        return from_real(DyadicSum.solve(self, v))
 
     def rsolve(self, v):
-        return self.inv().__rmatmul__(v)
+        """Return `J^H^-1 v`."""
+        v, from_real = self._view(v)
+        return from_real(self.inv().__rmatmul__(v.conj()).conj())
 
     def update(self, x, f):
+        x, _ = self._view(x)
+        f, _ = self._view(f)
         if self.last_x is not None:
             dx = x - self.last_x
             df = f - self.last_f
@@ -794,10 +1402,242 @@ class Jacobian(DyadicSum):
         self.last_f = np.copy(f)
 
     def matvec(self, v):
-        return self.__matmul__(v)
+        v, from_real = self._view(v)
+        return from_real(self.__matmul__(v))
 
     def rmatvec(self, v):
-        return self.__rmatmul__(v)
+        """Return `J^H v`."""
+        v, from_real = self._view(v)
+        return from_real(self.__rmatmul__(v.conj()).conj())
+
+
+def _quadratic_step(phi0, s, phi):
+    """Return the minimizer of the quadratic through `phi(0) = phi0` and
+    `phi(s) = phi` with `phi'(0) = -phi0`."""
+    denom = 2*(phi - phi0 + phi0*s)
+    return phi0*s**2/denom if denom > 0 else 0.5*s
+
+
+def _cubic_step(phi0, s1, phi1, s0, phi_0):
+    """Return the minimizer of the cubic through `phi(0) = phi0`, `phi(s0) =
+    phi_0`, `phi(s1) = phi1` with `phi'(0) = -phi0` (see [Nocedal:2006])."""
+    g = -phi0
+    r1, r0 = phi1 - phi0 - g*s1, phi_0 - phi0 - g*s0
+    factor = s0**2*s1**2*(s1 - s0)
+    a = (s0**2*r1 - s1**2*r0)/factor
+    b = (-s0**3*r1 + s1**3*r0)/factor
+    if a == 0:
+        return -g/2/b if b > 0 else 0.5*s1
+    disc = b**2 - 3*a*g
+    if disc < 0:
+        return 0.5*s1
+    return (-b + np.sqrt(disc))/(3*a)
+
+
+def _backtrack(F, x, dx, phi, x_new, line_search=True, s_min=0.01,
+               c1=1e-4):
+    """Backtracking line search along `dx` used by :func:`broyden_solve`.
+
+    Return `(s, f_new, phi_new, success, nfev)` where `x_new = x + s*dx` has
+    been filled in place, `f_new = F(x_new)`, `phi_new = |f_new|**2`,
+    `success` is `True` if the Armijo condition is satisfied, and `nfev` is
+    the number of function evaluations.
+    """
+    s_, phi_ = None, None   # Previous trial
+    s_full = f_full = phi_full = None
+    nfev = 0
+    s = 1.0
+    while True:
+        np.multiply(dx, s, out=x_new)
+        x_new += x
+        f_new = F(x_new)
+        nfev += 1
+        phi_new = np.vdot(f_new, f_new).real
+        success = phi_new <= (1 - c1*s)*phi
+        if not line_search or success:
+            break
+        if not np.isfinite(phi_new):
+            if s <= s_min:
+                break
+            s *= 0.5
+            continue
+        if s_ is None:
+            s_full, f_full, phi_full = s, f_new, phi_new
+            s_next = _quadratic_step(phi, s, phi_new)
+        elif s > s_min:
+            s_next = _cubic_step(phi, s, phi_new, s_, phi_)
+        else:
+            if phi_new >= phi:
+                # Take the first (full) step and hope for the best (as
+                # does scipy.optimize.nonlin).
+                s, f_new, phi_new = s_full, f_full, phi_full
+                np.multiply(dx, s, out=x_new)
+                x_new += x
+            break
+        s_, phi_ = s, phi_new
+        s = min(0.5*s, s_next) if s_next > 0 else 0.5*s
+    return s, f_new, phi_new, success, nfev
+
+
+def broyden_solve(F, x0, alpha=None, n_max=20, method='good',
+                  f_tol=None, x_tol=None, maxiter=1000, line_search=True,
+                  s_min=0.01, max_fails=3, max_restarts=10,
+                  dynamic_range=_EPS):
+    r"""Return an :class:`scipy.optimize.OptimizeResult` with the root of
+    `F(x) = 0` found with Broyden's method.
+
+    The inverse Jacobian is approximated by a :class:`DyadicSum` with at most
+    `n_max` dyads stored in preallocated buffers (see
+    :attr:`DyadicSum.inplace`) and updated with
+    :meth:`DyadicSum.update_broyden`.  The state thus requires only
+    :math:`O(N n_{\max})` memory and each iteration costs
+    :math:`O(N n_{\max})` plus the evaluations of `F`.  In contrast,
+    :func:`scipy.optimize.broyden1` stores two vectors per iteration (by
+    default) and uses all of them at every step.
+
+    Each step :math:`\delta x = -\mathbf{B}F(x)` is followed by a backtracking
+    line search on :math:`\lVert F\rVert^2` with the Armijo condition, using
+    quadratic and cubic interpolation as in :mod:`scipy.optimize.nonlin`.  If
+    no acceptable step larger than `s_min` is found, then the last trial is
+    taken if it reduced the residual, otherwise the full step is taken (as
+    does :func:`scipy.optimize.broyden1`).
+    After `max_fails` consecutive failures the approximation is reset to
+    :math:`\alpha\mathbf{1}` (a restart).
+
+    Arguments
+    ---------
+    F : function
+       Function `F(x)` returning an array of the same shape as `x`.  Complex
+       arrays are supported if `F` is complex analytic (otherwise, work with
+       real views as discussed in :class:`Jacobian`).
+    x0 : array
+       Initial guess.
+    alpha : float, operator, None
+       Initial inverse Jacobian :math:`\mathbf{B} = \alpha\mathbf{1}`.  The
+       default follows :func:`scipy.optimize.broyden1`:
+       `-0.5*max(norm(x0), 1)/norm(F(x0))`.  (Note the sign:
+       :func:`scipy.optimize.broyden1` calls this `-alpha`.)  This can also
+       be a linear operator approximating the inverse Jacobian (see
+       :attr:`DyadicSum.alpha`), which is kept on restarts.  A good
+       preconditioner can greatly reduce the number of iterations.
+    n_max : int
+       Maximum number of dyads (the limited memory).
+    method : 'good', 'bad'
+       Broyden update (see :meth:`DyadicSum.update_broyden`).
+    f_tol : float, None
+       Absolute tolerance (in the max-norm) for the residual.  Defaults to
+       `eps**(1/3)` as in :func:`scipy.optimize.broyden1`.
+    x_tol : float, None
+       If provided, also stop once the max-norm of the step is smaller than
+       this.
+    maxiter : int
+       Maximum number of iterations.
+    line_search : bool
+       If `False`, then always take the full step.
+    s_min : float
+       Minimum step length in the line search.
+    max_fails, max_restarts : int
+       Number of consecutive line search failures before a restart, and the
+       maximum number of restarts before giving up.
+    dynamic_range : float
+       See :attr:`DyadicSum.dynamic_range`.
+
+    Returns
+    -------
+    res : OptimizeResult
+       Attributes `x`, `fun` (the residual `F(x)`), `success`, `status`
+       (0: converged, 1: `maxiter` reached, 2: too many restarts), `message`,
+       `nit` (number of iterations), `nfev` (number of function evaluations),
+       `nrestarts`, `time` (total wall time in seconds) and `time_F` (the part
+       spent evaluating `F`).
+
+    Examples
+    --------
+    >>> c = np.linspace(0, 1, 100)
+    >>> def F(x):
+    ...     return x + 0.1*x**3 - c
+    >>> res = broyden_solve(F, np.zeros_like(c), alpha=1.0, n_max=5, f_tol=1e-12)
+    >>> res.success, abs(F(res.x)).max() < 1e-10
+    (True, True)
+    >>> res.nfev < 20
+    True
+    """
+    tic = time.perf_counter()
+    time_F = [0.0]
+
+    def _F(x):
+        tic = time.perf_counter()
+        try:
+            return np.asarray(F(x))
+        finally:
+            time_F[0] += time.perf_counter() - tic
+
+    if f_tol is None:
+        f_tol = _EPS**(1./3.)
+
+    x = np.array(x0, dtype=np.result_type(x0, float))
+    f = _F(x)
+    x = x.astype(np.result_type(x, f), copy=False)
+    nfev = 1
+    if alpha is None:
+        norm_f = np.linalg.norm(f)
+        alpha = -0.5*max(np.linalg.norm(x), 1)/norm_f if norm_f else 1.0
+
+    B = DyadicSum(alpha=alpha, n_max=n_max, inplace=True,
+                  dynamic_range=dynamic_range)
+
+    # Work arrays reused across iterations (the step `dx` is new each time).
+    df = np.empty_like(x)
+    x_new = np.empty_like(x)
+    phi = np.vdot(f, f).real
+    c1 = 1e-4          # Armijo parameter
+    nit = nfails = nrestarts = 0
+    status = 1
+    while nit < maxiter:
+        if np.linalg.norm(f.ravel(), np.inf) <= f_tol:
+            status = 0
+            break
+        nit += 1
+        dx = -(B @ f)
+
+        s, f_new, phi_new, success, n = _backtrack(
+            _F, x, dx, phi, x_new=x_new, line_search=line_search,
+            s_min=s_min, c1=c1)
+        nfev += n
+
+        if not np.isfinite(phi_new):
+            # Restart from the current point.
+            nfails = max_fails
+        else:
+            dx *= s
+            np.subtract(f_new, f, out=df)
+            B.update_broyden(dx=dx, df=df, method=method)
+            x, x_new = x_new, x
+            f, phi = f_new, phi_new
+            if (x_tol is not None
+                    and np.linalg.norm(dx.ravel(), np.inf) <= x_tol):
+                status = 0
+                break
+            nfails = 0 if success or not line_search else nfails + 1
+
+        if nfails >= max_fails:
+            if nrestarts >= max_restarts:
+                status = 2
+                break
+            nrestarts += 1
+            nfails = 0
+            B.reset()
+    else:
+        if np.linalg.norm(f.ravel(), np.inf) <= f_tol:
+            status = 0
+
+    messages = {0: "Converged.",
+                1: "Maximum number of iterations reached.",
+                2: "Too many restarts."}
+    return sp.optimize.OptimizeResult(
+        x=x, fun=f, success=(status == 0), status=status,
+        message=messages[status], nit=nit, nfev=nfev, nrestarts=nrestarts,
+        time=time.perf_counter() - tic, time_F=time_F[0])
 
 
 class L_BFGS(object):
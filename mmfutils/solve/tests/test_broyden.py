@@ -1,4 +1,6 @@
 import sys
+import time
+import tracemalloc
 
 import numpy as np
 import scipy.optimize.nonlin
@@ -105,6 +107,469 @@ class TestDyadicSum(object):
         B, B_ = dyadic_sum
         assert np.allclose(B.inv().todense(), np.linalg.inv(B_))
 
+    @pytest.mark.parametrize('n_max, dynamic_range, inplace',
+                             [(np.inf, 1e-16, False),
+                              (np.inf, 1e-3, False),
+                              (6, 1e-16, False),
+                              (6, 1e-16, True)])
+    def test_incremental(self, n_max, dynamic_range, inplace):
+        """Compare the incremental updates with a full orthogonalization."""
+        np.random.seed(2)
+        N = 30
+        args = dict(n_max=n_max, dynamic_range=dynamic_range,
+                    inplace=inplace)
+        B = broyden.DyadicSum(**args)
+        B0 = broyden.DyadicSum(**args)
+        for n in range(40):
+            m = 1 + n % 3
+            at = (np.random.random((N, m)) - 0.5) * 2.0**(-n % 7)
+            b = np.random.random((m, N)) - 0.5
+            B.add_dyad(at, b)
+            if 0 == len(B0._b):
+                B0.orthogonalize(at=at, b=b, sigma=np.eye(m))
+                continue
+            at0, b0, sigma0 = B0._at, B0._b, B0._sigma
+            if inplace:
+                k = n_max - m
+                at0, b0, sigma0 = at0[:, :k], b0[:k], sigma0[:k]
+            B0.orthogonalize(at=np.hstack([at0, at]), b=np.vstack([b0, b]),
+                             sigma=np.diag(np.concatenate([sigma0,
+                                                           np.ones(m)])))
+            assert np.allclose(B.todense(), B0.todense())
+            if n_max < np.inf:
+                assert B._A.shape[1] <= 2*n_max
+
+        # Canonical form
+        at, b, sigma = B._at, B._b, B._sigma
+        assert sigma.shape == (len(b),) and len(sigma) <= n_max
+        assert np.all(np.diff(sigma) <= 0)
+        assert np.allclose(at.T @ at, np.eye(len(sigma)))
+        assert np.allclose(b @ b.T, np.eye(len(sigma)))
+        assert np.allclose(B.todense(), B0.todense())
+
+    def test_inplace_memory(self):
+        """The inplace mode should only allocate O(N) temporaries."""
+        np.random.seed(4)
+        N, n_max = 20000, 8
+        ats = np.random.random((40, N)) - 0.5
+        bs = np.random.random((40, N)) - 0.5
+        peaks = []
+        for inplace in [True, False]:
+            B = broyden.DyadicSum(n_max=n_max, inplace=inplace)
+            for at, b in zip(ats[:n_max], bs[:n_max]):
+                B.add_dyad(at, b)
+            A = B._A
+            tracemalloc.start()
+            try:
+                for at, b in zip(ats[n_max:], bs[n_max:]):
+                    B.add_dyad(at, b)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+            if inplace:
+                assert np.shares_memory(A, B._A)
+        assert peaks[0] < 4 * N * 8
+        assert peaks[1] > n_max * N * 8
+
+    def test_update_broyden_inplace(self, method):
+        """The secant condition should hold with limited memory."""
+        np.random.seed(5)
+        N, n_max = 30, 4
+        B = broyden.DyadicSum(alpha=0.5, n_max=n_max, inplace=True)
+        for n in range(20):
+            dx = np.random.random(N) - 0.5
+            df = np.random.random(N) - 0.5
+            B.update_broyden(dx=dx, df=df, method=method)
+            assert np.allclose(B @ df, dx)
+            assert len(B._S) <= n_max
+
+    def test_truncate_inplace(self):
+        """Truncation should give the best low-rank approximation."""
+        np.random.seed(6)
+        N, n_max, k = 30, 6, 4
+        B = broyden.DyadicSum(alpha=0.5, n_max=n_max, inplace=True)
+        for n in range(n_max):
+            B.add_dyad(np.random.random(N) - 0.5, np.random.random(N) - 0.5)
+        A = B._A
+        U, d, Vt = np.linalg.svd(B.todense() - 0.5*np.eye(N))
+        B._truncate_inplace(k)
+        assert np.shares_memory(A, B._A)
+        assert np.allclose(B.todense() - 0.5*np.eye(N), U[:, :k]*d[:k] @ Vt[:k])
+        assert np.allclose(B._A.T @ B._A, np.eye(k))
+        assert np.allclose(B._B @ B._B.T, np.eye(k))
+
+    def test_incremental_rank(self):
+        """Dependent dyads should not grow the basis."""
+        np.random.seed(3)
+        N, k = 30, 4
+        U = np.random.random((N, k))
+        V = np.random.random((k, N))
+        B = broyden.DyadicSum()
+        B_ = np.eye(N)
+        for n in range(20):
+            a, b = U @ np.random.random(k), np.random.random(k) @ V
+            B.add_dyad(a, b)
+            B_ += np.outer(a, b)
+            assert B._A.shape[1] <= k
+            assert B._B.shape[0] <= k
+        assert np.allclose(B.todense(), B_)
+
+        B = broyden.DyadicSum(use_svd=False)
+        for n in range(2*k):
+            B.add_dyad(U[:, n % k], V[n % k])
+        assert B._A.shape[1] == k
+        assert np.allclose(B.todense(), np.eye(N) + 2*U @ V)
+
+
+def crand(*shape):
+    return np.random.random(shape) - 0.5 + 1j*(np.random.random(shape) - 0.5)
+
+
+class TestComplex(object):
+    """Test complex dyadic sums."""
+    @pytest.mark.parametrize('n_max, inplace', [(np.inf, False),
+                                                (4, False),
+                                                (4, True)])
+    def test_add_dyad(self, n_max, inplace):
+        np.random.seed(5)
+        N = 10
+        B = broyden.DyadicSum(alpha=1.0+0.5j, n_max=n_max, inplace=inplace)
+        a, b = np.random.random(N), np.random.random(N)
+        B.add_dyad(a, b)            # Real dyad: complex ones upcast the buffers
+        B_ = (1.0+0.5j)*np.eye(N) + np.outer(a, b)
+        for n in range(2):          # Exact while the rank is <= n_max
+            at, b = crand(N, 1 + n % 2), crand(1 + n % 2, N)
+            B.add_dyad(at, b)
+            B_ += at @ b
+            assert np.allclose(B.todense(), B_)
+        for n in range(6):
+            B.add_dyad(crand(N), crand(N))
+        assert B.dtype == complex
+        at, b = B._at, B._b
+        assert len(b) <= n_max
+        assert np.allclose(at.conj().T @ at, np.eye(len(b)))
+        assert np.allclose(b @ b.conj().T, np.eye(len(b)))
+
+        M = B.todense()
+        x = crand(N)
+        assert np.allclose(B @ x, M @ x)
+        assert np.allclose(x @ B, x @ M)
+        assert np.allclose(B.inv().todense(), np.linalg.inv(M))
+
+    def test_update_broyden(self, method):
+        np.random.seed(6)
+        N = 6
+        B = broyden.DyadicSum(n_max=np.inf)
+        for n in range(8):
+            dx, df = crand(N), crand(N)
+            B.update_broyden(dx=dx, df=df, method=method)
+            assert np.allclose(B @ df, dx)
+
+    def test_jacobian(self):
+        np.random.seed(7)
+        N = 6
+        J = broyden.Jacobian(alpha=0.5)
+        for n in range(4):
+            J.update(crand(N), crand(N))
+        J_ = sp.optimize.nonlin.asjacobian(J.todense())
+        v = crand(N)
+        assert np.allclose(J.solve(v), J_.solve(v))
+        assert np.allclose(J.rsolve(v), J_.rsolve(v))
+        assert np.allclose(J.matvec(v), J_.matvec(v))
+        assert np.allclose(J.rmatvec(v), J_.rmatvec(v))
+
+    def test_real_view(self):
+        """Check the real view with a non-holomorphic function."""
+        np.random.seed(8)
+        N = 4
+        J = broyden.Jacobian(real_view=True)
+        J0 = broyden.Jacobian()
+        for n in range(5):
+            x = crand(N)
+            f = x + 0.3*abs(x)**2*x.conj()
+            J.update(x, f)
+            J0.update(x.view(float), f.view(float))
+        assert J.shape == (2*N, 2*N)
+        assert J.dtype == float
+        assert np.allclose(J.todense(), J0.todense())
+        v = crand(N)
+        for name in ['solve', 'rsolve', 'matvec', 'rmatvec']:
+            res = getattr(J, name)(v)
+            assert res.dtype == complex
+            assert np.allclose(res.view(float), getattr(J0, name)(v.view(float)))
+
+        # Secant condition (see update_broyden)
+        dx, df = crand(N), crand(N)
+        J.update(J.last_x.view(complex) + dx, J.last_f.view(complex) + df)
+        assert np.allclose(J.matvec(df), dx)
+
+
+class MatrixOperator(object):
+    """Dense linear operator with the interface required by DyadicSum."""
+    def __init__(self, M):
+        self.M = np.asarray(M)
+        self.shape = self.M.shape
+
+    def matvec(self, x):
+        return self.M @ x
+
+    def rmatvec(self, x):
+        return self.M.conj().T @ x
+
+    def solve(self, x):
+        return np.linalg.solve(self.M, x)
+
+    def rsolve(self, x):
+        return np.linalg.solve(self.M.conj().T, x)
+
+
+class TestBaseOperator(object):
+    """Test dyadic sums with a general base operator instead of alpha*1."""
+    def get_dyadic_sum(self, N=8, **kw):
+        M0 = 2*np.eye(N) + crand(N, N)
+        B = broyden.DyadicSum(alpha=MatrixOperator(M0), **kw)
+        return B, M0
+
+    def test_dense(self):
+        np.random.seed(10)
+        N = 8
+        B, M0 = self.get_dyadic_sum(N)
+        assert np.allclose(B.todense(), M0)
+        at, b = crand(N, 3), crand(3, N)
+        B.add_dyad(at, b)
+        M = M0 + at @ b
+        assert np.allclose(B.todense(), M)
+        x = crand(N, 2)
+        assert np.allclose(B @ x, M @ x)
+        assert np.allclose(B @ x[:, 0], M @ x[:, 0])
+        assert np.allclose(x.T @ B, x.T @ M)
+        assert np.allclose(x[:, 0] @ B, x[:, 0] @ M)
+        assert np.allclose(B.diag(), np.diag(M))
+        assert np.allclose(B.diag(2), np.diag(M, 2))
+        inds = np.array([1, 3, 4, 2])
+        assert np.allclose(B[inds[:, None], inds[None, :]],
+                           M[inds[:, None], inds[None, :]])
+
+    def test_diag(self):
+        """diag() and indexing do not form the dense base operator."""
+        np.random.seed(14)
+        N = 8
+        M0 = 2*np.eye(N) + crand(N, N)
+        calls = []
+
+        class Operator(MatrixOperator):
+            def matvec(self, x):
+                assert x.shape == (N,)
+                calls.append(x)
+                return MatrixOperator.matvec(self, x)
+
+        B = broyden.DyadicSum(alpha=Operator(M0))
+        assert np.allclose(B.diag(), np.diag(M0))
+        assert np.allclose(B.diag(-3), np.diag(M0, -3))
+        at, b = crand(N, 2), crand(2, N)
+        B.add_dyad(at, b)
+        M = M0 + at @ b
+        assert np.allclose(B.diag(1), np.diag(M, 1))
+        del calls[:]
+        inds = np.array([1, 3, 4, 3])
+        assert np.allclose(B[inds[:, None], inds[None, :]],
+                           M[inds[:, None], inds[None, :]])
+        assert len(calls) == 3
+
+        # The optional diagonal() method is used if provided.
+        Operator.diagonal = lambda self, k: np.diag(self.M, k)
+        del calls[:]
+        assert np.allclose(B.diag(), np.diag(M))
+        assert not calls
+        B.reset()
+        assert np.allclose(B.diag(), np.diag(M0))
+
+    def test_inv(self):
+        np.random.seed(11)
+        N = 8
+        B, M0 = self.get_dyadic_sum(N)
+        assert np.allclose(B.inv().todense(), np.linalg.inv(M0))
+        B.add_dyad(crand(N, 3), crand(3, N))
+        M = B.todense()
+        Bi = B.inv()
+        assert np.allclose(Bi.todense(), np.linalg.inv(M))
+        assert Bi.inv().alpha is B.alpha
+        assert np.allclose(Bi.inv().todense(), M)
+
+        x = crand(N, 2)
+        assert np.allclose(B.solve(x), np.linalg.solve(M, x))
+        assert np.allclose(B.solve(x[:, 0]), np.linalg.solve(M, x[:, 0]))
+
+    @pytest.mark.parametrize('inplace', [False, True])
+    def test_update_broyden(self, method, inplace):
+        np.random.seed(12)
+        N = 8
+        B, M0 = self.get_dyadic_sum(N, n_max=4, inplace=inplace)
+        for n in range(10):
+            dx, df = crand(N), crand(N)
+            B.update_broyden(dx=dx, df=df, method=method)
+            if inplace:
+                assert np.allclose(B @ df, dx)
+
+    def test_jacobian(self):
+        """The Jacobian solve() only needs alpha.solve()."""
+        np.random.seed(13)
+        N = 6
+        M0 = 2*np.eye(N) + crand(N, N)
+
+        class Operator(MatrixOperator):
+            rsolve = None
+
+        J = broyden.Jacobian(alpha=Operator(M0))
+        for n in range(4):
+            J.update(crand(N), crand(N))
+        J_ = sp.optimize.nonlin.asjacobian(J.todense())
+        v = crand(N)
+        assert np.allclose(J.solve(v), J_.solve(v))
+        assert np.allclose(J.matvec(v), J_.matvec(v))
+        assert np.allclose(J.rmatvec(v), J_.rmatvec(v))
+
+
+def laplacian_problem(N, K=2.0):
+    """Return `F(x)` for a nonlinear problem with a discrete Laplacian."""
+    np.random.seed(9)
+    c = np.random.random(N)
+
+    def F(x):
+        return (2*x + K*(2*x - np.roll(x, 1) - np.roll(x, -1))
+                + 0.5*np.tanh(x) - c)
+    return F
+
+
+class TestBroydenSolve(object):
+    """Test the broyden_solve() driver."""
+    @pytest.mark.parametrize('n_max', [5, 20, np.inf])
+    def test_solve(self, method, n_max):
+        N = 200
+        F = laplacian_problem(N)
+        res = broyden.broyden_solve(F, np.zeros(N), alpha=0.1, n_max=n_max,
+                                    method=method, f_tol=1e-10)
+        assert res.success
+        assert res.status == 0
+        assert abs(F(res.x)).max() <= 1e-10
+        assert np.allclose(res.fun, F(res.x))
+        x = sp.optimize.root(F, np.zeros(N), tol=1e-12).x
+        assert np.allclose(res.x, x)
+        assert 0 < res.nit < res.nfev
+        assert 0 <= res.time_F <= res.time
+
+    def test_line_search(self):
+        """The line search is needed for this stiff problem."""
+        N = 200
+        F = laplacian_problem(N, K=10.0)
+        res = broyden.broyden_solve(F, np.zeros(N), alpha=0.5, n_max=20,
+                                    f_tol=1e-8)
+        assert res.success
+        res = broyden.broyden_solve(F, np.zeros(N), alpha=0.5, n_max=20,
+                                    f_tol=1e-8, line_search=False,
+                                    maxiter=50)
+        assert not res.success
+
+    def test_preconditioner(self):
+        """A base operator approximating the inverse Jacobian reduces the
+        number of iterations."""
+        N, K = 200, 10.0
+        F = laplacian_problem(N, K=K)
+        # Linear part 2 + K*(2 - 2*cos(k)) of the Jacobian is diagonal in
+        # Fourier space.
+        k = 2*np.pi*np.fft.fftfreq(N)
+        J0 = 2 + K*(2 - 2*np.cos(k))
+
+        class Preconditioner(object):
+            def matvec(self, x):
+                return np.fft.ifft(np.fft.fft(x)/J0).real
+
+            rmatvec = matvec
+
+            def solve(self, x):
+                return np.fft.ifft(np.fft.fft(x)*J0).real
+
+            rsolve = solve
+
+        res0 = broyden.broyden_solve(F, np.zeros(N), alpha=0.05, n_max=10,
+                                     f_tol=1e-10)
+        res = broyden.broyden_solve(F, np.zeros(N), alpha=Preconditioner(),
+                                    n_max=10, f_tol=1e-10)
+        assert res0.success and res.success
+        assert abs(F(res.x)).max() <= 1e-10
+        assert 5*res.nit < res0.nit
+
+    def test_default_alpha(self):
+        N = 100
+        F = laplacian_problem(N)
+        res = broyden.broyden_solve(F, np.zeros(N), n_max=10)
+        assert res.success
+        assert abs(F(res.x)).max() <= np.finfo(float).eps**(1/3)
+
+    def test_complex(self):
+        np.random.seed(10)
+        N = 50
+        c = np.random.random(N) + 1j*np.random.random(N)
+
+        def F(z):
+            return z + 0.1*z**3 - c
+
+        res = broyden.broyden_solve(F, np.zeros(N), alpha=1.0, n_max=10,
+                                    f_tol=1e-12)
+        assert res.success
+        assert res.x.dtype == complex
+        assert abs(F(res.x)).max() <= 1e-12
+
+    def test_maxiter(self):
+        N = 100
+        F = laplacian_problem(N)
+        res = broyden.broyden_solve(F, np.zeros(N), alpha=0.1, maxiter=3)
+        assert not res.success
+        assert res.status == 1
+        assert res.nit == 3
+
+    def test_x_tol(self):
+        N = 100
+        F = laplacian_problem(N)
+        res = broyden.broyden_solve(F, np.zeros(N), alpha=0.1, f_tol=0,
+                                    x_tol=1e-6)
+        assert res.success
+        assert abs(F(res.x)).max() < 1e-4
+
+    def test_memory(self):
+        """The memory should be O(N*n_max) and less than scipy's."""
+        N, n_max = 20000, 5
+        F = laplacian_problem(N)
+        x0 = np.zeros(N)
+        tracemalloc.start()
+        try:
+            res = broyden.broyden_solve(F, x0, alpha=0.1, n_max=n_max,
+                                        f_tol=1e-8)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            sp.optimize.broyden1(F, x0, alpha=-0.1, f_tol=1e-8)
+            peak_scipy = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert res.success
+        assert res.nit > 2*n_max
+        assert peak < (2*n_max + 16)*N*8
+        assert peak < peak_scipy
+
+    @pytest.mark.bench
+    def test_bench(self):
+        """Compare with scipy for a large problem needing many iterations
+        (with few iterations, scipy's low-rank updates are cheaper)."""
+        N = 10**6
+        F = laplacian_problem(N)
+        x0 = np.zeros(N)
+        res = broyden.broyden_solve(F, x0, alpha=0.5, n_max=10, f_tol=1e-8)
+        tic = time.perf_counter()
+        sp.optimize.broyden1(F, x0, alpha=-0.5, f_tol=1e-8)
+        t_scipy = time.perf_counter() - tic
+        assert res.success
+        assert res.time < t_scipy
+
 
 class TestJacobianBFGS(object):
     """Test the JacobianBFGS object."""
@@ -129,6 +594,45 @@ class TestJacobianBFGS(object):
         H = J.dense_H()
         assert np.allclose(J.solve(v), H.dot(v))
         assert np.allclose(np.eye(*J.shape), J.solve(J.dense_J()))
+
+    @pytest.mark.parametrize('n_max', [3, np.inf])
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_ring_buffer(self, n_max, compact):
+        """Compare with the dense update using only the last n_max pairs."""
+        np.random.seed(2)
+        N = 10
+        J = broyden.JacobianBFGS(alpha=0.5, n_max=n_max, compact=compact)
+        A = np.random.random((N, N))
+        A = A @ A.T + N*np.eye(N)
+        x = np.random.random(N)
+        J.update(x, A @ x)
+        dxs, dfs = [], []
+        for n in range(40):
+            dx = np.random.random(N) - 0.5
+            x = x + dx
+            J.update(x, A @ x)
+            dxs.append(dx)
+            dfs.append(A @ dx)
+            if n == 3:
+                SY = J._SY
+            m = len(dxs) if n_max == np.inf else n_max
+            s_, y_ = dxs[-m:], dfs[-m:]
+            H = s_[-1].dot(y_[-1])/y_[-1].dot(y_[-1])*np.eye(N)
+            for s, y in zip(s_, y_):
+                rho = 1/y.dot(s)
+                V = np.eye(N) - rho*np.outer(y, s)
+                H = V.T @ H @ V + rho*np.outer(s, s)
+            v = np.random.random((N, 2))
+            assert np.allclose(J.solve(v), H @ v)
+            assert np.allclose(J.solve(v[:, 0]), H @ v[:, 0])
+            assert np.allclose(J.dense_H(), H)
+            assert np.allclose(J._dx, s_)
+        if n_max < np.inf:
+            # Buffers are reused.
+            assert J._SY is SY
+            assert J._SY.shape == (2*n_max, N)
+        else:
+            assert len(J._SY) >= 2*40
         
     
 class TestDyadicSumJacobian(object):
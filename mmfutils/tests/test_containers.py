@@ -1,6 +1,10 @@
+import os
 import pickle
 
-from mmfutils.containers import (Object,
+import numpy as np
+
+from mmfutils import containers
+from mmfutils.containers import (Object, lazy_attribute,
                                  Container, ContainerList, ContainerDict)
 
 import pytest
@@ -169,6 +173,197 @@ class TestObject(object):
         assert o1.x == 6
 
 
+class MyLazyObject(Object):
+    _independent_attributes = ('b',)
+
+    def __init__(self, a=1, b=2):
+        self.a = a
+        self.b = b
+        self.computed = []
+        super().__init__()
+
+    def init(self):
+        self.a2 = 2*self.a
+        super().init()
+
+    @lazy_attribute('a2', 'b')
+    def c(self):
+        self.computed.append('c')
+        return self.a2 + self.b
+
+    @lazy_attribute('c')
+    def d(self):
+        self.computed.append('d')
+        return [self.c]
+
+    @lazy_attribute('a2')
+    def e(self):
+        self.computed.append('e')
+        return -self.a2
+
+
+class TestLazy(object):
+    def test_lazy(self):
+        o = MyLazyObject()
+        assert 'c' not in o.picklable_attributes
+        assert o.computed == []
+        assert (o.c, o.d, o.e) == (4, [4], -2)
+        assert (o.c, o.d, o.e) == (4, [4], -2)
+        assert o.computed == ['c', 'd', 'e']
+
+        # Independent attributes: only the dependents are recomputed.
+        del o.computed[:]
+        o.b = 3
+        assert o.initialized
+        assert (o.c, o.d, o.e) == (5, [5], -2)
+        assert o.computed == ['c', 'd']
+
+        # Other attributes require init()
+        del o.computed[:]
+        o.a = 2
+        assert not o.initialized
+        o.init()
+        assert (o.c, o.d, o.e) == (7, [7], -4)
+        assert o.computed == ['c', 'd', 'e']
+
+    def test_invalidate(self):
+        o = MyLazyObject()
+        d = o.d
+        d.append(1)
+        assert o.d is d
+        o.invalidate('c')
+        assert o.d == [4]
+        e = o.e
+        o.invalidate()
+        assert o.d is not d
+        assert 'e' not in o.__dict__
+        assert o.e == e
+
+    def test_pickle(self):
+        o = MyLazyObject(a=2)
+        o.b = 1
+        assert o.d == [5]
+        o1 = pickle.loads(pickle.dumps(o))
+        assert 'd' not in o1.__dict__
+        assert o1.d == [5]
+
+
+class TestPickleBuffers(object):
+    def test_dumps(self):
+        x = np.arange(10**5, dtype=float)
+        o = MyObject(a=x, b=x[::1000], c=[x.reshape(10, -1), 'c'])
+        buffers = []
+        data = containers.dumps(o, buffers=buffers)
+        assert len(data) < 10**4    # x[::1000] is copied (not contiguous)
+        assert len(buffers) == 2
+        o1 = containers.loads(data, buffers=buffers)
+        assert np.shares_memory(o1.a, x)
+        assert np.shares_memory(o1.c[0], x)
+        assert np.allclose(o1.b, o.b)
+
+        o2 = containers.loads(containers.dumps(o))
+        assert not np.shares_memory(o2.a, x)
+        assert np.allclose(o2.a, x)
+
+    def test_check_picklable(self, monkeypatch):
+        """Arrays should not be serialized by the picklability check."""
+        o = MyObject(a=1, b=2, c=3)
+
+        def dumps(*v, **kw):
+            raise AssertionError("pickle.dumps() called")
+
+        monkeypatch.setattr(containers.pickle, 'dumps', dumps)
+        o.a = np.zeros(10)
+        o.b = np.zeros((10, 10))[::2]
+
+    def test_check_picklable_nested(self):
+        o = MyObject(a=1, b=2, c=3)
+        o.a = [np.ones(10), MyEmptyObject()]
+        with pytest.raises(ValueError, match="not picklable"):
+            o.b = [np.ones(10), lambda x: x]
+        with pytest.raises(ValueError, match="not picklable"):
+            o.c = np.array([lambda x: x], dtype=object)
+
+
+class TestSaveDir(object):
+    def test_save_dir(self, tmp_path):
+        x = np.arange(12.0).reshape(3, 4)
+        o = MyObject(
+            a=x,
+            b=Container(x=np.zeros(0), y=np.float64(1.5), z=np.array(2j)),
+            c=[(1, 'c', None), {'d': x.T, '__npy__': 'not a tag'}, {1: 2}])
+        dirname = tmp_path / 'o'
+        containers.save_dir(dirname, o)
+        assert (dirname / 'a.npy').exists()
+        o1 = containers.load_dir(dirname)
+        assert type(o1) is MyObject
+        assert isinstance(o1.a, np.memmap)
+        assert not o1.a.flags.writeable
+        assert np.array_equal(o1.a, x)
+        assert type(o1.b) is Container
+        assert o1.b.x.shape == (0,)
+        assert o1.b.y == 1.5 and type(o1.b.y) is np.float64
+        assert o1.b.z == 2j
+        assert o1.c[0] == (1, 'c', None)
+        assert np.array_equal(o1.c[1]['d'], x.T)
+        assert o1.c[1]['__npy__'] == 'not a tag'
+        assert o1.c[2] == {1: 2}
+
+        o2 = containers.load_dir(dirname, mmap_mode=None)
+        assert not isinstance(o2.a, np.memmap)
+        assert np.array_equal(o2.a, x)
+
+    def test_init(self, tmp_path):
+        """init() should be called on loading."""
+        o = MyLazyObject(a=2)
+        o.b = 1
+        containers.save_dir(tmp_path / 'o', o)
+        o1 = containers.load_dir(tmp_path / 'o')
+        assert o1.a2 == 4
+        assert o1.d == [5]
+
+        c = ContainerDict(b='Hi', a=1)
+        containers.save_dir(tmp_path / 'c', c)
+        assert containers.load_dir(tmp_path / 'c') == c
+
+    def test_overwrite(self, tmp_path):
+        dirname = tmp_path / 'c'
+        containers.save_dir(dirname, Container(x=np.ones(3), y=1))
+        with pytest.raises(ValueError, match="exists"):
+            containers.save_dir(dirname, Container(x=np.zeros(2)))
+        containers.save_dir(dirname, Container(x=np.zeros(2)),
+                            overwrite=True)
+        assert sorted(_p.name for _p in tmp_path.iterdir()) == ['c']
+        c = containers.load_dir(dirname)
+        assert np.array_equal(c.x, np.zeros(2))
+        assert 'y' not in c
+
+        (tmp_path / 'data').mkdir()
+        with pytest.raises(ValueError, match="not an archive"):
+            containers.save_dir(tmp_path / 'data', c, overwrite=True)
+        with pytest.raises(TypeError):
+            containers.save_dir(tmp_path / 'x', dict(x=1))
+
+    def test_overwrite_failure(self, tmp_path, monkeypatch):
+        """The old archive is kept if it cannot be replaced."""
+        dirname = str(tmp_path / 'c')
+        containers.save_dir(dirname, Container(x=np.ones(3)))
+        replace = os.replace
+
+        def fail(src, dst):
+            if os.path.basename(src) == 'new':
+                raise OSError("Failed")
+            replace(src, dst)
+
+        monkeypatch.setattr(os, 'replace', fail)
+        with pytest.raises(OSError, match="Failed"):
+            containers.save_dir(dirname, Container(x=np.zeros(2)),
+                                overwrite=True)
+        monkeypatch.undo()
+        assert sorted(_p.name for _p in tmp_path.iterdir()) == ['c']
+        assert np.array_equal(containers.load_dir(dirname).x, np.ones(3))
+
+
 class TestPersist(object):
     def test_archive(self):
         o = MyObject(c=[1, 2, 3], a=1, b="b")
@@ -0,0 +1,68 @@
+import pickle
+
+import numpy as np
+
+import pytest
+
+from mmfutils.performance import backends
+
+
+class TestBackends(object):
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(1)
+
+    def rand(self, shape, complex=True):
+        X = np.random.random(shape) - 0.5
+        if complex:
+            X = X + 1j*(np.random.random(shape) - 0.5)
+        return X
+
+    @pytest.mark.parametrize('name', backends.available_backends())
+    def test_backend(self, name):
+        backend = backends.get_backend(name)
+        assert backend.name == name
+        x = self.rand((8, 9))
+        for f, f_ in [(backend.fft, np.fft.fft),
+                      (backend.ifft, np.fft.ifft),
+                      (backend.fftn, np.fft.fftn),
+                      (backend.ifftn, np.fft.ifftn),
+                      (backend.rfftn, np.fft.rfftn)]:
+            assert np.allclose(f(x.real if f is backend.rfftn else x),
+                               f_(x.real if f is backend.rfftn else x))
+        assert np.allclose(backend.rfft(x.real, n=12),
+                           np.fft.rfft(x.real, n=12))
+        assert np.allclose(backend.fft(x, n=12, axis=0),
+                           np.fft.fft(x, n=12, axis=0))
+        assert np.allclose(backend.irfftn(np.fft.rfftn(x.real), s=x.shape),
+                           x.real)
+        assert np.allclose(backend.dst(x, type=2),
+                           backends.get_backend('numpy').dst(x, type=2))
+        for _x in [x, x.real, x.astype(np.complex64), 1.0]:
+            assert np.allclose(backend.exp(_x), np.exp(_x))
+        assert pickle.loads(pickle.dumps(backend)) is backend
+
+    def test_registry(self):
+        assert backends.get_backend() is backends.get_backend('default')
+        with pytest.raises(ValueError, match="Unknown backend"):
+            backends.get_backend('no-such-backend')
+        with pytest.raises(ValueError, match="Unknown operations"):
+            backends.Backend('test', fftw=np.fft.fft)
+
+        calls = []
+
+        def fftn(x, axes=None, out=None):
+            calls.append(axes)
+            return np.fft.fftn(x, axes=axes)
+
+        backend = backends.Backend('test', fftn=fftn)
+        assert backends.get_backend(backend) is backend
+        try:
+            backends.register_backend(backend)
+            assert 'test' in backends.available_backends()
+            x = self.rand((4, 5))
+            assert np.allclose(backends.get_backend('test').fftn(x),
+                               np.fft.fftn(x))
+            assert calls == [None]
+        finally:
+            del backends._BACKENDS['test']
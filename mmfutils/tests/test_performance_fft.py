@@ -1,5 +1,8 @@
+import concurrent.futures
+
 from mmfutils.performance import fft
 import numpy as np
+import scipy.fftpack
 
 import pytest
 
@@ -47,6 +50,180 @@ class Test_FFT(object):
                 assert np.allclose(fft.ifftn_numpy(x, **kw),
                                    np.fft.ifftn(x, **kw))
 
+    def test_rfftn(self):
+        shape = (32, 30)
+        x = self.rand(shape, complex=False)
+
+        for axes in [None, [0], [1], [-1], [-2], [1, 0]]:
+            kw = {}
+            s = shape
+            if axes is not None:
+                kw = dict(axes=axes)
+                s = [shape[_a] for _a in axes]
+            for rfftn, irfftn in [(fft.rfftn_numpy, fft.irfftn_numpy),
+                                  (fft.rfftn, fft.irfftn)]:
+                xt = rfftn(x, **kw)
+                assert np.allclose(xt, np.fft.rfftn(x, **kw))
+                assert np.allclose(irfftn(xt, s=s, **kw), x)
+
+    def check_out(self, fft, ifft, fftn, ifftn):
+        """Check the `out` and `overwrite_input` arguments."""
+        shape = (32, 30)
+        x = self.rand(shape)
+        # Misaligned array to check that the unaligned plans are used.
+        x_ = np.empty(np.prod(shape) + 1, dtype=complex)[1:].reshape(shape)
+        x_[...] = x
+
+        for axis in [0, 1, -1, -2]:
+            for f, f_ in [(fft, np.fft.fft), (ifft, np.fft.ifft)]:
+                for x in [x, x_]:
+                    res = f_(x, axis=axis)
+                    out = np.empty_like(x)
+                    assert f(x, axis=axis, out=out) is out
+                    assert np.allclose(out, res)
+                    y = x.copy()
+                    assert f(y, axis=axis, out=y) is y
+                    assert np.allclose(y, res)
+
+        for axes in [None, [0], [1], [-1], [-2], [1, 0]]:
+            for f, f_ in [(fftn, np.fft.fftn), (ifftn, np.fft.ifftn)]:
+                for x in [x, x_, x.real]:
+                    res = f_(x, axes=axes)
+                    out = np.empty(shape, dtype=complex)
+                    assert f(x, axes=axes, out=out) is out
+                    assert np.allclose(out, res)
+                    y = x.copy()
+                    f(y, axes=axes, out=out, overwrite_input=True)
+                    assert np.allclose(out, res)
+
+    def test_out(self):
+        self.check_out(fft.fft_numpy, fft.ifft_numpy,
+                       fft.fftn_numpy, fft.ifftn_numpy)
+
+    def check_r2r(self, dst, dct):
+        """Check the real-to-real transforms against scipy.fftpack."""
+        shape = (8, 9)
+        for complex in [False, True]:
+            x = self.rand(shape, complex=complex)
+            for type in [1, 2, 3, 4]:
+                for axis in [0, 1, -1, -2]:
+                    for f, f_ in [(dst, scipy.fftpack.dst),
+                                  (dct, scipy.fftpack.dct)]:
+                        assert np.allclose(f(x, type=type, axis=axis),
+                                           f_(x, type=type, axis=axis))
+        x = self.rand(shape, complex=False).astype(np.float32)
+        assert dst(x).dtype == dct(x).dtype == np.float32
+
+    def test_r2r(self):
+        self.check_r2r(fft.dst_scipy, fft.dct_scipy)
+
+    @pytest.mark.parametrize('shape_in, shape_out', [
+        ((8, 9), (12, 9)), ((12, 9), (8, 5)), ((9, 7), (13, 5)),
+        ((1, 4), (3, 4)), ((4,), (1,))])
+    def test_resample(self, shape_in, shape_out):
+        """Check that band-limited functions are resampled exactly."""
+        def f(shape):
+            x, y = (np.arange(_N)/_N for _N in shape + (1,)*(2 - len(shape)))
+            x, y = x[:, None], y[None, :]
+            n = [(min(shape_in[_a], shape_out[_a]) - 1)//2
+                 if _a < len(shape) else 0 for _a in range(2)]
+            return (np.cos(2*np.pi*(n[0]*x + n[1]*y) + 0.3)
+                    + np.sin(2*np.pi*n[0]*x)).reshape(shape)
+
+        for complex in [False, True]:
+            x = f(shape_in)*(1 + 1j if complex else 1)
+            res = fft.resample(x, shape_out)
+            assert np.iscomplexobj(res) == complex
+            assert np.allclose(res, f(shape_out)*(1 + 1j if complex else 1))
+
+            r = fft.Resampler(shape_in, shape_out, dtype=x.dtype)
+            out = np.empty(shape_out, dtype=x.dtype)
+            assert r(x, out=out) is out
+            assert np.allclose(out, res)
+            assert np.allclose(r(x), res)  # Buffers are reused
+
+    def test_thread_limit(self):
+        threads = fft.get_num_threads()
+        with fft.thread_limit(1):
+            assert fft.get_num_threads() == 1
+            with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                assert executor.submit(fft.get_num_threads).result() == threads
+        assert fft.get_num_threads() == threads
+
+    def test_resample_threads(self):
+        """The cached resamplers can be used from several threads.
+
+        Note: the inputs are distinct arrays because pyfftw plans new
+        transforms (once per thread) in the input array, so concurrently
+        transforming the same array is not safe.
+        """
+        xs = [self.rand((16, 12), complex=complex)
+              for complex in [False, True]*8]
+        expected = [fft.Resampler(x.shape, (24, 10), dtype=x.dtype)(x)
+                    for x in xs]
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            for n in range(5):
+                res = list(executor.map(
+                    lambda x: fft.resample(x, (24, 10)), xs))
+                for _r, _e in zip(res, expected):
+                    assert np.allclose(_r, _e)
+
+    def test_resample_mixed(self):
+        """Real and complex inputs use separate buffers."""
+        x = self.rand((5, 3), complex=False)
+        r = fft.Resampler(x.shape, (3, 2), dtype=x.dtype)
+        res, resc = r(x), r(x + 0j)
+        for n in range(2):
+            assert np.allclose(r(x), res)
+            assert np.allclose(r(x + 0j), resc)
+
+    def test_resample_nyquist(self):
+        """Real resampling along one axis gives the real part of the complex
+        resampling (the Nyquist mode is split between +-k)."""
+        x = self.rand((8, 6), complex=False)
+        for shape_out in [(12, 6), (4, 6), (8, 9)]:
+            res = fft.resample(x, shape_out)
+            assert res.dtype == x.dtype
+            assert np.allclose(res, fft.resample(x + 0j, shape_out).real)
+        with pytest.raises(ValueError):
+            fft.Resampler((8, 6), (12, 10))(res)
+
+    @pytest.mark.parametrize('shape_in, shape_out', [
+        ((9, 7), (13, 11)), ((9, 7), (5, 3)), ((8, 6), (12, 10)),
+        ((8, 6), (6, 4))])
+    def test_resample_real_nd(self, shape_in, shape_out):
+        """Real nD inputs are resampled with real transforms.
+
+        This agrees with the complex path (used for all inputs before) except
+        for the Nyquist modes of even lattices, which the complex path keeps
+        as negative frequencies, giving a complex result.
+        """
+        x = self.rand(shape_in, complex=False)
+        xk = np.fft.fftn(x)
+        for _a, (_n, _N) in enumerate(zip(shape_in, shape_out)):
+            m = min(_n, _N)
+            if m % 2 == 0:
+                index = [slice(None)]*len(shape_in)
+                index[_a] = [m//2, -m//2]
+                xk[tuple(index)] = 0
+        x_ = np.fft.ifftn(xk).real
+        complex_resampler = fft.Resampler(shape_in, shape_out, dtype=complex)
+        for _x in [x, x_]:
+            res = fft.resample(_x, shape_out)
+            assert res.dtype == _x.dtype
+            res_complex = complex_resampler(_x + 0j)
+            odd = all(min(_n, _N) % 2 for _n, _N in zip(shape_in, shape_out))
+            if odd or _x is x_:
+                assert np.allclose(res, res_complex)
+            else:
+                assert not np.allclose(res_complex.imag, 0)
+
+    def test_resample_out(self):
+        """A complex result cannot be stored in a real array."""
+        x = self.rand((8, 6), complex=True)
+        with pytest.raises(TypeError):
+            fft.Resampler(x.shape, (12, 6))(x, out=np.empty((12, 6)))
+
 
 @pytest.mark.skipif(not hasattr(fft, 'pyfftw'),
                     reason="requires pyfftw")
@@ -114,3 +291,14 @@ class Test_FFT_pyfftw(Test_FFT):
                                    np.fft.fftn(x, **kw))
                 assert np.allclose(fft.get_ifftn_pyfftw(x, **kw)(x),
                                    np.fft.ifftn(x, **kw))
+
+    @pytest.mark.skipif(not hasattr(fft, 'dst_pyfftw'),
+                        reason="requires pyfftw.interfaces.scipy_fft")
+    def test_r2r_pyfftw(self):
+        for threads in [1, 2]:
+            fft.set_num_threads(threads)
+            self.check_r2r(fft.dst_pyfftw, fft.dct_pyfftw)
+
+    def test_out_pyfftw(self):
+        self.check_out(fft.fft_pyfftw, fft.ifft_pyfftw,
+                       fft.fftn_pyfftw, fft.ifftn_pyfftw)
@@ -0,0 +1,148 @@
+import gc
+import os
+import timeit
+
+import numpy as np
+
+import pytest
+
+from mmfutils.performance import fft, mpfft
+from mmfutils.performance.backends import Backend
+from mmfutils.math import bases
+
+
+class TestSlabFFT(object):
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(1)
+        cls.pool = mpfft.SlabFFT(nprocs=3)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.pool.close()
+
+    def rand(self, shape):
+        return (np.random.random(shape) - 0.5
+                + 1j*(np.random.random(shape) - 0.5))
+
+    @pytest.mark.parametrize('axes', [None, (1, 2, 3), (2,), (3,), (1, 3)])
+    def test_fftn(self, axes):
+        x = self.rand((3, 16, 12, 10))
+        for f, f_ in [(self.pool.fftn, np.fft.fftn),
+                      (self.pool.ifftn, np.fft.ifftn)]:
+            res = f(x, axes=axes)
+            assert np.allclose(res, f_(x, axes=axes))
+            out = np.empty_like(x)
+            assert f(x, axes=axes, out=out) is out
+            assert np.allclose(out, res)
+
+    def test_shared(self):
+        x = self.rand((16, 12))
+        y = self.pool.empty(x.shape)
+        y[...] = x
+        res = self.pool.fftn(y)
+        assert res is not y
+        assert np.allclose(y, x)
+        assert self.pool.fftn(y, overwrite_input=True) is y
+        assert np.allclose(y, res)
+        assert self.pool.ifftn(y, out=y) is y
+        assert np.allclose(y, x)
+
+        # Real inputs, 1D arrays, and growing the work buffer.
+        x = np.random.random(7)
+        assert np.allclose(self.pool.fftn(x), np.fft.fft(x))
+        x = np.random.random((32, 32, 32))
+        assert np.allclose(self.pool.fftn(x), np.fft.fftn(x))
+
+    def test_release(self):
+        """Segments are released when the arrays are deleted."""
+        names = []
+        for n in range(5):
+            y = self.pool.empty((8, 6))
+            y[...] = x = self.rand(y.shape)
+            assert self.pool.fftn(y, out=y) is y
+            assert np.allclose(y, np.fft.fftn(x))
+            names.append(self.pool._get_name(y))
+            del y
+            gc.collect()
+        assert not set(names).intersection(self.pool._segments)
+        if os.path.isdir('/dev/shm'):
+            assert not [_n for _n in names
+                        if os.path.exists(os.path.join('/dev/shm', _n))]
+
+        # Views keep the segment alive.
+        y = self.pool.empty((8, 6))
+        name = self.pool._get_name(y)
+        z = y[1:]
+        del y
+        gc.collect()
+        assert name in self.pool._segments
+        z[...] = 1
+        del z
+        gc.collect()
+        assert name not in self.pool._segments
+        x = self.rand((4, 4))
+        assert np.allclose(self.pool.fftn(x), np.fft.fftn(x))
+        assert not self.pool._released
+
+    @pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'),
+                        reason="requires os.sched_getaffinity")
+    def test_affinity(self):
+        """The workers are pinned to their CPUs."""
+        x = self.rand((4, 4))
+        assert np.allclose(self.pool.fftn(x), np.fft.fftn(x))
+        assert [os.sched_getaffinity(_p.pid) for _p in self.pool._procs
+                ] == self.pool.cpus
+
+    def test_error(self):
+        with pytest.raises(TypeError):
+            self.pool.fftn(np.ones((4, 4), dtype=object))
+        with pytest.raises(RuntimeError, match="Worker failed"):
+            self.pool._send([('fftn', 'no-such-segment', (4,), '<c16',
+                              (Ellipsis,), [0], False)])
+        x = self.rand((4, 4))
+        assert np.allclose(self.pool.fftn(x), np.fft.fftn(x))
+
+    def test_basis(self):
+        basis = bases.PeriodicBasis(Nxyz=(16, 12), Lxyz=(10.0, 11.0))
+        y = np.exp(-sum(_x**2 for _x in basis.xyz)/2) + 0j
+        res = basis.laplacian(y, factor=0.1j, exp=True)
+        basis = bases.PeriodicBasis(
+            Nxyz=(16, 12), Lxyz=(10.0, 11.0),
+            backend=Backend('mpfft', fftn=self.pool.fftn,
+                            ifftn=self.pool.ifftn))
+        assert np.allclose(basis.laplacian(y, factor=0.1j, exp=True), res)
+        assert basis.laplacian(y, factor=0.1j, exp=True, out=y) is y
+        assert np.allclose(y, res)
+
+    def test_parse_cpulist(self):
+        assert mpfft._parse_cpulist("0-2,8,10-11\n") == {0, 1, 2, 8, 10, 11}
+        assert all(mpfft.get_numa_cpus())
+
+    @pytest.mark.bench
+    @pytest.mark.skipif(not hasattr(fft, 'fftn_pyfftw'),
+                        reason="requires pyfftw")
+    @pytest.mark.skipif(len(mpfft.get_numa_cpus()) < 2,
+                        reason="requires several NUMA nodes")
+    def test_fftn_bench(self):
+        """Compare with the threaded pyfftw transforms on all CPUs."""
+        cpus = set.union(*mpfft.get_numa_cpus())
+        x = self.rand((256, 256, 256))
+        res = np.fft.fftn(x)
+        threads = fft.get_num_threads()
+        try:
+            with mpfft.SlabFFT() as pool:
+                y = pool.empty(x.shape)
+                y[...] = x
+                assert np.allclose(pool.fftn(y), res)
+                assert [os.sched_getaffinity(_p.pid) for _p in pool._procs
+                        ] == pool.cpus
+                fft.set_num_threads(len(cpus))
+                fft.fftn_pyfftw(x, out=x)      # Plan
+                t1 = timeit.repeat(lambda: pool.fftn(y, out=y), number=10)
+                t2 = timeit.repeat(lambda: fft.fftn_pyfftw(x, out=x),
+                                   number=10)
+        finally:
+            fft.set_num_threads(threads)
+        print("SlabFFT: {:.3g}s, pyfftw ({} threads): {:.3g}s".format(
+            min(t1), len(cpus), min(t2)))
@@ -0,0 +1,63 @@
+import numpy as np
+
+import pytest
+
+from mmfutils.performance import slabs
+from mmfutils.performance.backends import Backend
+
+
+class TestSlabs(object):
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(1)
+
+    def rand(self, shape):
+        return (np.random.random(shape) - 0.5
+                + 1j*(np.random.random(shape) - 0.5))
+
+    @pytest.mark.parametrize('axes', [None, (1, 2, 3), (2,), (3,), (1, 3)])
+    @pytest.mark.parametrize('max_bytes', [0, 1000, None])
+    def test_fftn(self, axes, max_bytes):
+        x = self.rand((3, 8, 6, 5))
+        res = slabs.fftn_slabs(x, axes=axes, max_bytes=max_bytes)
+        assert np.allclose(res, np.fft.fftn(x, axes=axes))
+        assert np.allclose(
+            slabs.ifftn_slabs(res, axes=axes, max_bytes=max_bytes, out=res),
+            x)
+
+        if axes is None:
+            axes = (1, 2, 3)
+        Kk = np.random.random(x.shape[1:])
+        assert np.allclose(
+            slabs.apply_k_slabs(x, Kk, axes=axes, max_bytes=max_bytes),
+            np.fft.ifftn(Kk*np.fft.fftn(x, axes=axes), axes=axes))
+
+    def test_scratch(self, tmp_path):
+        x = self.rand((4, 5))
+        res = slabs.fftn_slabs(x, dir=str(tmp_path))
+        assert isinstance(res, np.memmap)
+        assert res.dtype == complex
+        assert list(tmp_path.iterdir()) == []
+        assert slabs.empty_scratch((0, 3)).shape == (0, 3)
+        assert slabs.fftn_slabs(x.real.astype(np.float32)).dtype == np.complex64
+        assert np.allclose(slabs.fftn_slabs(x[0], max_bytes=0),
+                           np.fft.fft(x[0]))
+        with pytest.raises(ValueError):
+            slabs.fftn_slabs(x, out=x[0])
+
+    def test_backend(self):
+        calls = []
+
+        def fftn(x, axes=None, out=None):
+            calls.append('fftn')
+            return np.fft.fftn(x, axes=axes)
+
+        def fft(x, axis=-1, out=None):
+            calls.append('fft')
+            return np.fft.fft(x, axis=axis)
+
+        x = self.rand((4, 5, 6))
+        res = slabs.fftn_slabs(x, max_bytes=0,
+                               backend=Backend('test', fft=fft, fftn=fftn))
+        assert np.allclose(res, np.fft.fftn(x))
+        assert set(calls) == {'fft', 'fftn'}
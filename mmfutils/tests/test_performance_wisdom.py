@@ -0,0 +1,61 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+import pytest
+
+from mmfutils.performance import fft, wisdom
+
+pytestmark = pytest.mark.skipif(wisdom.pyfftw is None,
+                                reason="requires pyfftw")
+
+
+def _save(filename):
+    wisdom.save_wisdom(filename)
+
+
+class TestWisdom(object):
+    def test_auto_wisdom(self):
+        """The tests must not write to the user's wisdom (see conftest.py)."""
+        assert not wisdom.AUTO_WISDOM
+        fft.fftn(np.ones((4, 4), dtype=complex))
+        assert not wisdom._LOADED
+
+    def test_filename(self, tmp_path):
+        filename = wisdom.get_wisdom_filename(directory=str(tmp_path))
+        assert os.path.dirname(filename) == str(tmp_path)
+        assert wisdom._get_fftw_version() in os.path.basename(filename)
+
+    def test_save_load(self, tmp_path):
+        filename = str(tmp_path / 'wisdom.json')
+        assert not wisdom.load_wisdom(filename)   # Missing file
+        x = np.random.random((16, 12)) + 0j
+        fft.get_fftn_pyfftw(x)(x)
+        assert wisdom.save_wisdom(filename) == filename
+        with open(filename) as f:
+            data = json.load(f)
+        assert data['fftw_version'] == wisdom._get_fftw_version()
+        assert wisdom.load_wisdom(filename)
+
+    def test_version_mismatch(self):
+        w = wisdom.export_wisdom()
+        w['fftw_version'] = 'not-a-version'
+        assert not wisdom.import_wisdom(w)
+
+    def test_merge(self):
+        w = wisdom.export_wisdom()
+        assert wisdom.import_wisdom(tuple(_w.encode() for _w in w['wisdom']))
+        assert wisdom.merge_wisdom(w, None)['wisdom'] == w['wisdom']
+
+    def test_concurrent_save(self, tmp_path):
+        filename = str(tmp_path / 'wisdom.json')
+        ps = [multiprocessing.Process(target=_save, args=(filename,))
+              for _n in range(4)]
+        [_p.start() for _p in ps]
+        [_p.join() for _p in ps]
+        assert all(_p.exitcode == 0 for _p in ps)
+        assert wisdom.load_wisdom(filename)
+        assert not [_f for _f in os.listdir(tmp_path)
+                    if _f.endswith('.tmp')]